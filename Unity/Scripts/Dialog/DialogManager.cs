@@ -21,6 +21,10 @@ namespace AIuniTalk.Dialog
         
         private Dictionary<string, SpeechBubble> activeBubbles = new Dictionary<string, SpeechBubble>();
         private List<DialogSession> activeSessions = new List<DialogSession>();
+        private Dictionary<string, string> resolvedLocations = new Dictionary<string, string>();
+        private bool locationResolveRequested = false;
+        private float locationResolveRetryTime = 0f;
+        private const float LocationResolveRetryInterval = 10f;
         
         private void Start()
         {
@@ -209,18 +213,50 @@ namespace AIuniTalk.Dialog
         
         private string ConvertWaypointNameToLocation(string waypointName)
         {
-            // ウェイポイント名から日本語の場所名に変換
-            if (waypointName.Contains("Takoyaki")) return "たこ焼き屋台";
-            if (waypointName.Contains("Cotton_Candy")) return "わたあめ屋台";
-            if (waypointName.Contains("Goldfish")) return "金魚すくい";
-            if (waypointName.Contains("Shooting")) return "射的";
-            if (waypointName.Contains("Stage")) return "ステージ前";
-            if (waypointName.Contains("Rest")) return "休憩所";
-            if (waypointName.Contains("Drink")) return "ドリンク屋台";
-            if (waypointName.Contains("Fireworks")) return "花火観覧スポット";
-            if (waypointName.Contains("Central")) return "中央広場";
+            // サーバーで解決済みの場所名を使う
+            if (resolvedLocations.TryGetValue(waypointName, out string locationName))
+            {
+                return locationName;
+            }
             
-            return "夏祭り会場";
+            RequestLocationResolve();
+            
+            // 未解決の間はウェイポイント名をそのまま送る（サーバー側で場所に変換される）
+            return waypointName;
+        }
+        
+        private void RequestLocationResolve()
+        {
+            if (locationResolveRequested || Time.time < locationResolveRetryTime) return;
+            
+            var waypointManager = FindObjectOfType<FestivalWaypointManager>();
+            if (waypointManager == null) return;
+            
+            List<string> names = new List<string>();
+            foreach (Transform waypoint in waypointManager.GetAllWaypoints())
+            {
+                if (waypoint != null && !names.Contains(waypoint.name))
+                {
+                    names.Add(waypoint.name);
+                }
+            }
+            
+            locationResolveRequested = true;
+            ServerConnection.Instance.ResolveLocations(names.ToArray(), results =>
+            {
+                foreach (var result in results)
+                {
+                    if (!string.IsNullOrEmpty(result.display_name))
+                    {
+                        resolvedLocations[result.name] = result.display_name;
+                    }
+                }
+            }, () =>
+            {
+                // 失敗したら少し待ってから、次のウェイポイント変換時にもう一度問い合わせる
+                locationResolveRequested = false;
+                locationResolveRetryTime = Time.time + LocationResolveRetryInterval;
+            });
         }
         
         private void CreateDefaultSpeechBubblePrefab()
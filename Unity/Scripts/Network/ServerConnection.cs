@@ -144,6 +144,40 @@ namespace AIuniTalk.Network
             }
         }
         
+        public void ResolveLocations(string[] names, Action<LocationResolveResult[]> callback, Action onError = null)
+        {
+            StartCoroutine(ResolveLocationsCoroutine(names, callback, onError));
+        }
+        
+        private IEnumerator ResolveLocationsCoroutine(string[] names, Action<LocationResolveResult[]> callback, Action onError)
+        {
+            LocationResolveRequest requestData = new LocationResolveRequest { names = names };
+            string jsonData = JsonUtility.ToJson(requestData);
+            byte[] bodyRaw = Encoding.UTF8.GetBytes(jsonData);
+            
+            using (UnityWebRequest request = new UnityWebRequest($"{serverUrl}/location/resolve", "POST"))
+            {
+                request.uploadHandler = new UploadHandlerRaw(bodyRaw);
+                request.downloadHandler = new DownloadHandlerBuffer();
+                request.SetRequestHeader("Content-Type", "application/json");
+                request.timeout = (int)connectionTimeout;
+                
+                yield return request.SendWebRequest();
+                
+                if (request.result == UnityWebRequest.Result.Success)
+                {
+                    LocationResolveResponse response = JsonUtility.FromJson<LocationResolveResponse>(request.downloadHandler.text);
+                    callback?.Invoke(response.results);
+                    Debug.Log($"Resolved {response.results.Length} locations");
+                }
+                else
+                {
+                    Debug.LogError($"Failed to resolve locations: {request.error}");
+                    onError?.Invoke();
+                }
+            }
+        }
+        
         public void ResetSession(string sessionId)
         {
             StartCoroutine(ResetSessionCoroutine(sessionId));
@@ -188,6 +222,26 @@ namespace AIuniTalk.Network
         public string location;
     }
     
+    [Serializable]
+    public class LocationResolveRequest
+    {
+        public string[] names;
+    }
+    
+    [Serializable]
+    public class LocationResolveResult
+    {
+        public string name;
+        public string location_id;
+        public string display_name;
+    }
+    
+    [Serializable]
+    public class LocationResolveResponse
+    {
+        public LocationResolveResult[] results;
+    }
+    
     [Serializable]
     public class DialogResponse
     {
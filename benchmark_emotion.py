@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+感情推定のマイクロベンチマーク
+旧実装（any()による逐次走査）と EmotionClassifier の1発言あたりのコストを比較します
+
+使い方:
+    python benchmark_emotion.py --iterations 20000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server"))
+
+from services.emotion_classifier import EmotionClassifier  # noqa: E402
+
+SAMPLES = [
+    "わぁ、いい匂いがしますね！",
+    "別に、興味ないけど...",
+    "提灯がすごく綺麗です",
+    "え？本当に？びっくりした！",
+    "ちょっと寂しいな...",
+    "もう、イライラするなぁ",
+    "花火まであと少しですね♪",
+    "金魚すくい、やってみます？",
+    "涼しい風が気持ちいいですね",
+    "一緒に回れて楽しいです！",
+]
+
+
+def legacy_detect_emotion(text: str) -> str:
+    """変更前の DialogService._detect_emotion"""
+    if any(word in text for word in ['嬉しい', '楽しい', 'わぁ', '♪']):
+        return 'happy'
+    elif any(word in text for word in ['悲しい', '寂しい', 'つらい']):
+        return 'sad'
+    elif any(word in text for word in ['怒', 'むか', 'イライラ']):
+        return 'angry'
+    elif any(word in text for word in ['びっくり', 'え？', '！？']):
+        return 'surprised'
+    else:
+        return 'neutral'
+
+
+def per_call_ns(fn, texts, iterations: int) -> float:
+    started = time.perf_counter_ns()
+    for i in range(iterations):
+        fn(texts[i % len(texts)])
+    return (time.perf_counter_ns() - started) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emotion classifier micro-benchmark")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=6, help="classify_many に渡す発言数")
+    args = parser.parse_args()
+
+    texts = [random.choice(SAMPLES) for _ in range(1000)]
+    classifier = EmotionClassifier()
+
+    batches = [texts[i:i + args.batch] for i in range(0, len(texts), args.batch)]
+    started = time.perf_counter_ns()
+    for i in range(args.iterations // args.batch):
+        classifier.classify_many(batches[i % len(batches)])
+    batch_ns = (time.perf_counter_ns() - started) / max(1, (args.iterations // args.batch) * args.batch)
+
+    results = {
+        "legacy_ns_per_text": round(per_call_ns(legacy_detect_emotion, texts, args.iterations), 1),
+        "classify_ns_per_text": round(per_call_ns(classifier.classify, texts, args.iterations), 1),
+        "classify_many_ns_per_text": round(batch_ns, 1),
+        "batch_size": args.batch,
+        "iterations": args.iterations,
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+近接検出のベンチマーク
+全ペアの距離計算（各キャラクターが他の全員と距離を測る現在のUnity側の方式）と
+サーバーの SpatialGrid による検出の1回あたりのコストを、キャラクター数ごとに比較します
+
+使い方:
+    python benchmark_proximity.py --counts 3 50 100 300 1000 --radius 2.0
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server"))
+
+from services.spatial_grid import SpatialGrid  # noqa: E402
+
+
+def brute_force_pairs(positions: dict, radius: float) -> list:
+    """全ペアの距離を計算する方式（O(n²)）"""
+    return [
+        (a, b) for a, b in itertools.combinations(positions, 2)
+        if math.dist(positions[a], positions[b]) < radius
+    ]
+
+
+def per_call_us(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Proximity detection benchmark")
+    parser.add_argument("--counts", type=int, nargs="+", default=[3, 10, 50, 100, 300, 1000])
+    parser.add_argument("--radius", type=float, default=2.0, help="会話を始める距離")
+    parser.add_argument("--density", type=float, default=0.05, help="1平方メートルあたりのキャラクター数")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    grid = SpatialGrid(args.radius)
+    results = []
+    for n in args.counts:
+        # 人数が増えても混み具合が同じになるよう会場の広さを変える
+        side = math.sqrt(n / args.density)
+        positions = {
+            f"npc{i}": (random.uniform(0, side), random.uniform(0, side)) for i in range(n)
+        }
+
+        found = len(grid.pairs_within(positions, args.radius))
+        assert found == len(brute_force_pairs(positions, args.radius))
+
+        results.append({
+            "agents": n,
+            "pairs_found": found,
+            "brute_force_us": round(per_call_us(lambda: brute_force_pairs(positions, args.radius), args.repeat), 1),
+            "grid_us": round(per_call_us(lambda: grid.pairs_within(positions, args.radius), args.repeat), 1),
+        })
+
+    print(json.dumps({"radius": args.radius, "density": args.density, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+"""
+OpenAI互換のローカル代替サーバー（負荷・レイテンシ検証用）
+APIキーもネットワークも不要でサーバーの並列動作を確認できます
+
+使い方:
+    python fake_llm_server.py --port 8001 --latency 1.5 --jitter 0.5
+    python fake_llm_server.py --distribution lognormal --latency 1.0 --jitter 0.5   # 裾の重い分布
+
+障害の注入（耐障害レイヤーの確認用）:
+    python fake_llm_server.py --error-rate 0.1 --rate-limit-rate 0.05 --slow-rate 0.05 --slow-latency 8
+    curl -X POST localhost:8001/faults -d '{"outage": true}'   # 実行中に切り替え
+
+サーバー側の server/.env:
+    OPENAI_API_KEY=dummy
+    OPENAI_BASE_URL=http://localhost:8001/v1
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LINES = [
+    "わぁ、いい匂いがしますね！",
+    "ちょっと並んでみようか",
+    "あれ、美味しそうだね",
+    "花火まであと少しですね♪",
+    "一緒に行ってみます？",
+    "別に、興味ないけど...",
+    "涼しい風が気持ちいいですね",
+    "提灯がすごく綺麗です",
+]
+
+
+SCRIPT_SPEAKER = re.compile(r"^- ([\w-]+)（", re.MULTILINE)
+SCRIPT_TURNS = re.compile(r"(\d+)行の会話")
+
+
+def build_content(request: dict) -> str:
+    """リクエストに応じた応答本文（JSON台本指定なら台本）を作る"""
+    if (request.get("response_format") or {}).get("type") != "json_object":
+        return random.choice(LINES)
+
+    system = next((m.get("content", "") for m in request.get("messages", []) if m.get("role") == "system"), "")
+    speakers = SCRIPT_SPEAKER.findall(system) or ["alpha", "beta"]
+    match = SCRIPT_TURNS.search("\n".join(m.get("content", "") for m in request.get("messages", [])))
+    turns = int(match.group(1)) if match else 6
+    lines = [{"speaker": speakers[i % len(speakers)], "text": random.choice(LINES)} for i in range(turns)]
+    return json.dumps({"lines": lines}, ensure_ascii=False)
+
+
+# POST /faults で実行中に変更できる項目
+RUNTIME_FIELDS = (
+    "latency", "jitter", "distribution",
+    "error_rate", "rate_limit_rate", "slow_rate", "slow_latency", "outage",
+)
+
+
+DISTRIBUTIONS = ("uniform", "normal", "lognormal", "exponential")
+
+
+class FakeLLMState:
+    def __init__(self, latency: float, jitter: float, token_interval: float, distribution: str = "uniform"):
+        self.latency = latency
+        self.jitter = jitter
+        self.token_interval = token_interval
+        self.distribution = distribution
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.total = 0
+
+        # 障害の注入
+        self.error_rate = 0.0       # 500を返す割合
+        self.rate_limit_rate = 0.0  # 429を返す割合
+        self.slow_rate = 0.0        # slow_latencyだけ遅らせる割合
+        self.slow_latency = 5.0
+        self.outage = False         # 全リクエストに503を返す
+        self.faults = {"errors": 0, "rate_limited": 0, "slow": 0, "outage": 0}
+
+    def pick_fault(self):
+        """このリクエストに注入する障害（無ければNone）"""
+        roll = random.random()
+        with self.lock:
+            if self.outage:
+                fault = "outage"
+            elif roll < self.error_rate:
+                fault = "errors"
+            elif roll < self.error_rate + self.rate_limit_rate:
+                fault = "rate_limited"
+            elif roll < self.error_rate + self.rate_limit_rate + self.slow_rate:
+                fault = "slow"
+            else:
+                return None
+            self.faults[fault] += 1
+            return fault
+
+    def configure(self, settings: dict):
+        with self.lock:
+            for field in RUNTIME_FIELDS:
+                if field in settings:
+                    setattr(self, field, type(getattr(self, field))(settings[field]))
+            return {field: getattr(self, field) for field in RUNTIME_FIELDS}
+
+    def enter(self):
+        with self.lock:
+            self.in_flight += 1
+            self.total += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def sample_latency(self) -> float:
+        """--distribution に従って応答時間（秒）を1つ引く
+
+        uniform: latency±jitter / normal: 平均latency・標準偏差jitter /
+        lognormal: 中央値latency・形状jitter / exponential: 平均latency
+        """
+        if self.distribution == "normal":
+            value = random.gauss(self.latency, self.jitter)
+        elif self.distribution == "lognormal":
+            value = self.latency * random.lognormvariate(0.0, self.jitter)
+        elif self.distribution == "exponential":
+            value = random.expovariate(1.0 / self.latency) if self.latency > 0 else 0.0
+        else:
+            value = self.latency + random.uniform(-self.jitter, self.jitter)
+        return max(0.0, value)
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: FakeLLMState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_stream(self, request: dict, text: str):
+        """SSE形式で2文字ずつ返す（初回までの待ちは--latency、以降は--token-interval）"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        for i in range(0, len(text), 2):
+            if i:
+                time.sleep(self.state.token_interval)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "fake-model"),
+                "choices": [{"index": 0, "delta": {"content": text[i:i + 2]}, "finish_reason": None}],
+            }
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "fake-model", "object": "model"}]})
+        elif self.path == "/stats":
+            with self.state.lock:
+                self._send_json(200, {
+                    "total": self.state.total,
+                    "in_flight": self.state.in_flight,
+                    "max_in_flight": self.state.max_in_flight,
+                    "faults": dict(self.state.faults),
+                })
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path == "/faults":
+            self._send_json(200, self.state.configure(request))
+            return
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        fault = self.state.pick_fault()
+        if fault == "outage":
+            self._send_json(503, {"error": {"message": "service unavailable", "type": "server_error"}})
+            return
+
+        self.state.enter()
+        try:
+            if fault == "slow":
+                time.sleep(self.state.slow_latency)
+            time.sleep(self.state.sample_latency())
+            if fault == "errors":
+                self._send_json(500, {"error": {"message": "injected failure", "type": "server_error"}})
+                return
+            if fault == "rate_limited":
+                self._send_json(
+                    429,
+                    {"error": {"message": "rate limit reached", "type": "rate_limit_error"}},
+                    headers={"Retry-After": "1"},
+                )
+                return
+            text = build_content(request)
+            if request.get("stream"):
+                self._send_stream(request, text)
+                return
+            prompt_chars = sum(len(m.get("content", "")) for m in request.get("messages", []))
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "fake-model"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_chars,
+                    "completion_tokens": len(text),
+                    "total_tokens": prompt_chars + len(text),
+                },
+            })
+        finally:
+            self.state.leave()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=1.0, help="平均応答時間（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="応答時間の揺らぎ幅（秒、lognormalでは形状）")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="uniform", help="応答時間の分布")
+    parser.add_argument("--token-interval", type=float, default=0.05, help="ストリーミング時のチャンク間隔（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="500を返す割合")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="429（Retry-After付き）を返す割合")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="応答を大きく遅らせる割合")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="遅らせる場合の追加の待ち（秒）")
+    parser.add_argument("--outage", action="store_true", help="全リクエストに503を返す")
+    args = parser.parse_args()
+
+    FakeLLMHandler.state = FakeLLMState(args.latency, args.jitter, args.token_interval, args.distribution)
+    FakeLLMHandler.state.configure({
+        "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "slow_rate": args.slow_rate,
+        "slow_latency": args.slow_latency,
+        "outage": args.outage,
+    })
+    server = ThreadingHTTPServer((args.host, args.port), FakeLLMHandler)
+    print(
+        f"Fake LLM server on http://{args.host}:{args.port}/v1 "
+        f"({args.distribution} latency={args.latency}s jitter={args.jitter})"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
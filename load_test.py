@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+"""
+会話サーバーの負荷試験
+N組の会話を同時に走らせて /dialog/turn と Socket.IO イベントを送り、
+レイテンシ（p50/p95/p99）・スループット・エラー率をJSONで出力します
+
+使い方（ネットワーク不要の構成）:
+    python fake_llm_server.py --port 8001 --distribution lognormal --latency 0.8 --jitter 0.4
+    # server/.env: OPENAI_API_KEY=dummy / OPENAI_BASE_URL=http://localhost:8001/v1
+    python load_test.py --url http://localhost:5000 --pairs 20 --duration 60 --output baseline.json
+
+    # サーバーを起動せず、アプリを同じプロセス内で直接呼ぶ
+    python load_test.py --in-process --pairs 20 --duration 30
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server")
+CONTEXT = "夏祭りで出会いました。"
+# 会話しないキャラクター同士の間隔（separation_distance より十分大きくする）
+AGENT_SPACING = 20.0
+HEALTH_KEYS = ("scheduler", "deadlines", "response_cache", "prefetch", "resilience", "dedup", "warm_pool")
+
+
+def percentile(values: list, q: float) -> float:
+    """最近傍順位法による分位点"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 1),
+        "p50": round(percentile(values, 0.50), 1),
+        "p95": round(percentile(values, 0.95), 1),
+        "p99": round(percentile(values, 0.99), 1),
+        "max": round(max(values), 1),
+    }
+
+
+class Recorder:
+    """操作ごとのレイテンシ（ミリ秒）とエラー数"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.error_samples = []
+        self.conversations = 0
+        self.socket_events = 0
+
+    def record(self, name: str, started: float, ok: bool, detail: str = None):
+        elapsed = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.latencies.setdefault(name, []).append(elapsed)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+                if detail and len(self.error_samples) < 10:
+                    self.error_samples.append(f"{name}: {detail}")
+
+
+class HttpTarget:
+    """起動中のサーバーにHTTP（とSocket.IO）で接続する"""
+
+    def __init__(self, url: str, timeout: float):
+        import httpx
+
+        self.url = url.rstrip("/")
+        self.client = httpx.Client(
+            base_url=self.url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=1000, max_keepalive_connections=1000),
+        )
+        try:
+            import socketio
+            self._socketio = socketio
+        except ImportError:
+            self._socketio = None
+
+    def post(self, path: str, payload: dict):
+        response = self.client.post(path, json=payload)
+        return response.status_code, response.json()
+
+    def get(self, path: str):
+        response = self.client.get(path)
+        return response.status_code, response.json()
+
+    def socket(self):
+        """Socket.IOクライアント（python-socketioのクライアント機能が無ければNone）"""
+        if self._socketio is None:
+            return None
+        try:
+            client = self._socketio.Client()
+            client.connect(self.url, transports=["websocket", "polling"], wait_timeout=5)
+            return client
+        except Exception:
+            return None
+
+
+class InProcessTarget:
+    """server/app.py を読み込み、テストクライアントで直接呼ぶ"""
+
+    def __init__(self):
+        sys.path.insert(0, SERVER_DIR)
+        os.chdir(SERVER_DIR)
+        import app as server_app
+
+        self.app = server_app
+        self._local = threading.local()
+
+    def _client(self):
+        if not hasattr(self._local, "client"):
+            self._local.client = self.app.app.test_client()
+        return self._local.client
+
+    def post(self, path: str, payload: dict):
+        response = self._client().post(path, json=payload)
+        return response.status_code, response.get_json()
+
+    def get(self, path: str):
+        response = self._client().get(path)
+        return response.status_code, response.get_json()
+
+    def socket(self):
+        return self.app.socketio.test_client(self.app.app)
+
+
+def run_pair(index: int, target, agents: list, locations: list, args, stop_at: float, recorder: Recorder):
+    """1組分の会話を締め切りまで繰り返す"""
+    rng = random.Random(index)
+    socket = target.socket() if args.socket else None
+    conversations = 0
+
+    while time.monotonic() < stop_at and (not args.conversations or conversations < args.conversations):
+        agent_ids = rng.sample(agents, 2)
+        location = rng.choice(locations)
+
+        if socket is not None:
+            # 2人が近づいた状態の位置をまとめて送る（他のキャラクターは互いに離れた場所）
+            base = 1000.0 * index
+            positions = [
+                [agent_id, base + AGENT_SPACING * i, 0.0] for i, agent_id in enumerate(agents)
+            ]
+            near = positions[agents.index(agent_ids[0])]
+            positions[agents.index(agent_ids[1])][1:] = [near[1] + 1.0, near[2]]
+            started = time.perf_counter()
+            try:
+                socket.emit("positions_update", {"positions": positions})
+                recorder.record("socket_positions_update", started, True)
+            except Exception as e:
+                recorder.record("socket_positions_update", started, False, str(e))
+            with recorder.lock:
+                recorder.socket_events += 1
+
+        session_id = None
+        for turn in range(1, args.turns + 1):
+            payload = {
+                "agent_ids": agent_ids,
+                "turn": turn,
+                "context": CONTEXT,
+                "location": location,
+                "session_id": session_id,
+                "max_turns": args.turns,
+            }
+            if args.stream:
+                payload["stream"] = True
+            if args.deadline_ms is not None:
+                payload["deadline_ms"] = args.deadline_ms
+
+            name = "dialog_turn_first" if turn == 1 else "dialog_turn"
+            started = time.perf_counter()
+            try:
+                status, body = target.post("/dialog/turn", payload)
+                ok = status == 200 and bool(body) and "text" in body
+                recorder.record(name, started, ok, None if ok else f"HTTP {status}")
+                if ok:
+                    session_id = body.get("session_id")
+            except Exception as e:
+                recorder.record(name, started, False, str(e))
+            if args.think > 0:
+                time.sleep(args.think)
+
+        started = time.perf_counter()
+        try:
+            if socket is not None:
+                socket.emit("conversation_ended", {"session_id": session_id, "agent_ids": agent_ids})
+                recorder.record("socket_conversation_ended", started, True)
+                with recorder.lock:
+                    recorder.socket_events += 1
+            else:
+                status, _ = target.post("/dialog/reset", {"session_id": session_id})
+                recorder.record("dialog_reset", started, status == 200, f"HTTP {status}")
+        except Exception as e:
+            recorder.record("socket_conversation_ended" if socket else "dialog_reset", started, False, str(e))
+
+        conversations += 1
+        with recorder.lock:
+            recorder.conversations += 1
+
+    if socket is not None:
+        try:
+            socket.disconnect()
+        except Exception:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dialog server load generator")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--in-process", action="store_true", help="サーバーを起動せずアプリを直接呼ぶ")
+    parser.add_argument("--pairs", type=int, default=10, help="同時に会話する組の数")
+    parser.add_argument("--duration", type=float, default=30.0, help="試験時間（秒）")
+    parser.add_argument("--conversations", type=int, default=0, help="1組あたりの会話数（0なら時間いっぱい）")
+    parser.add_argument("--turns", type=int, default=6, help="1会話のターン数")
+    parser.add_argument("--think", type=float, default=0.0, help="ターン間の待ち（秒、実機では turn_duration）")
+    parser.add_argument("--stream", action="store_true", help="ストリーミング表示を要求する")
+    parser.add_argument("--deadline-ms", type=float, default=None, help="ターンの締め切り（省略時はサーバーの既定値）")
+    parser.add_argument("--no-socket", dest="socket", action="store_false", help="Socket.IOイベントを送らない")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="結果のJSONを書き出すファイル")
+    args = parser.parse_args()
+
+    target = InProcessTarget() if args.in_process else HttpTarget(args.url, args.timeout)
+
+    status, config = target.get("/config/agents")
+    if status != 200:
+        sys.exit(f"Failed to load agents: HTTP {status}")
+    agents = [a["id"] for a in config["agents"]]
+    status, config = target.get("/config/locations")
+    locations = [l["display_name"] for l in config.get("locations", [])] if status == 200 else ["夏祭り会場"]
+
+    if args.socket:
+        probe = target.socket()
+        if probe is None:
+            print("Socket.IO client unavailable, sending HTTP requests only", file=sys.stderr)
+            args.socket = False
+        else:
+            probe.disconnect()
+
+    recorder = Recorder()
+    started = time.monotonic()
+    stop_at = started + args.duration
+    threads = [
+        threading.Thread(
+            target=run_pair,
+            args=(i, target, agents, locations, args, stop_at, recorder),
+            daemon=True,
+        )
+        for i in range(args.pairs)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    requests = sum(len(v) for v in recorder.latencies.values())
+    errors = sum(recorder.errors.values())
+    status, health = target.get("/healthz")
+
+    result = {
+        "config": {
+            "target": "in-process" if args.in_process else args.url,
+            "pairs": args.pairs,
+            "turns": args.turns,
+            "think_s": args.think,
+            "stream": args.stream,
+            "deadline_ms": args.deadline_ms,
+            "socket": args.socket,
+        },
+        "duration_s": round(elapsed, 2),
+        "conversations": recorder.conversations,
+        "requests": requests,
+        "socket_events": recorder.socket_events,
+        "errors": errors,
+        "error_rate": round(errors / requests, 4) if requests else 0.0,
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+        "turns_per_second": round(
+            sum(len(recorder.latencies.get(n, [])) for n in ("dialog_turn", "dialog_turn_first")) / elapsed, 2
+        ) if elapsed else 0.0,
+        "latency_ms": {
+            "dialog_turn_all": summarize(
+                recorder.latencies.get("dialog_turn", []) + recorder.latencies.get("dialog_turn_first", [])
+            ),
+            **{name: summarize(values) for name, values in sorted(recorder.latencies.items())},
+        },
+        "errors_by_operation": recorder.errors,
+        "error_samples": recorder.error_samples,
+        "server": {k: health.get(k) for k in HEALTH_KEYS} if status == 200 else None,
+    }
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
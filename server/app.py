@@ -1,38 +1,107 @@
 import os
-import json
+import time
 import logging
 from datetime import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
 from dotenv import load_dotenv
 import orjson
 
+from services.metrics import registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from services.tracing import tracer
+from services.log_pipeline import SAMPLED, configure_logging
+
 load_dotenv()
 
+SOCKET_EMITS = registry.counter('aiunitalk_socketio_emits', 'Socket.IOで送信したイベント数', ['event'])
+TURN_LATENCY = registry.histogram(
+    'aiunitalk_dialog_turn_seconds', '/dialog/turn の処理時間（秒）', ['status']
+)
+
+class InstrumentedSocketIO(SocketIO):
+    """送信したイベントを種類ごとに数えるSocketIO（emit()もここを通る）"""
+    
+    def emit(self, event, *args, **kwargs):
+        SOCKET_EMITS.inc(event)
+        return super().emit(event, *args, **kwargs)
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
 CORS(app, resources={r"/*": {"origins": "*"}})
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
-
-os.makedirs('logs', exist_ok=True)
-logging.basicConfig(
-    level=getattr(logging, os.getenv('LOG_LEVEL', 'INFO')),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/app.log'),
-        logging.StreamHandler()
-    ]
-)
+socketio = InstrumentedSocketIO(app, cors_allowed_origins="*", async_mode='threading')
+
+# ログはキューに積んで専用スレッドで書き出す（リクエストはディスクやコンソールを待たない）
+log_pipeline = configure_logging()
 logger = logging.getLogger(__name__)
 
 from services.dialog_service import DialogService
 from services.llm_service import LLMService
+from services.session_store import SessionStore
+from services.config_store import ConfigStore
+from services.request_coalescer import RequestCoalescer
+from services.proximity_tracker import ProximityTracker
+from services.profiler import Profiler, ProfilerBusy
+from services.transcript_store import TranscriptStore
+from services.replay_service import ReplayService
 
-dialog_service = DialogService()
+config_store = ConfigStore()
 llm_service = LLMService()
+transcript_store = TranscriptStore()
+replay_service = ReplayService(transcript_store)
+dialog_service = DialogService(
+    llm_service=llm_service,
+    config_store=config_store,
+    replay_service=replay_service
+)
+
+session_store = SessionStore()
+coalescer = RequestCoalescer()
+proximity_tracker = ProximityTracker(dialog_service)
+profiler = Profiler()
 
-active_sessions = {}
+def _register_metrics():
+    """各サービスの統計を /metrics で読めるようにする（値は集計時に読む）"""
+    registry.callback('aiunitalk_active_sessions', '保持している会話セッション数', lambda: len(session_store))
+    registry.callback('aiunitalk_llm_in_flight', 'LLMに問い合わせ中のリクエスト数', lambda: llm_service.in_flight)
+    registry.callback('aiunitalk_scheduler_depth', 'スケジューラで待機中の仕事の数', lambda: llm_service.scheduler.depth)
+    registry.callback(
+        'aiunitalk_circuit_open', 'LLMのサーキットブレーカーが開いていれば1',
+        lambda: 0 if llm_service.resilience.breaker.state == 'closed' else 1
+    )
+    
+    def cache_lookups():
+        response_cache = llm_service.response_cache.stats()
+        prefetch = dialog_service.prefetch_stats()
+        warm_pool = dialog_service.warm_pool.stats()
+        dedup = coalescer.stats()
+        return {
+            ('response_cache', 'hit'): response_cache['hits'],
+            ('response_cache', 'miss'): response_cache['misses'],
+            ('prefetch', 'hit'): prefetch['hits'],
+            ('prefetch', 'miss'): prefetch['misses'],
+            ('warm_pool', 'hit'): warm_pool['served'],
+            ('warm_pool', 'miss'): warm_pool['empty'],
+            ('dedup', 'hit'): dedup['coalesced'] + dedup['replayed'],
+            ('dedup', 'miss'): dedup['requests'] - dedup['coalesced'] - dedup['replayed']
+        }
+    registry.callback(
+        'aiunitalk_cache_lookups', 'キャッシュ類の参照回数（hit/miss）', cache_lookups,
+        labelnames=['cache', 'result'], kind='counter'
+    )
+    
+    def cache_hit_ratio():
+        totals = {}
+        for (cache, result), count in cache_lookups().items():
+            hits, lookups = totals.get(cache, (0, 0))
+            totals[cache] = (hits + (count if result == 'hit' else 0), lookups + count)
+        return {(cache,): hits / lookups if lookups else None for cache, (hits, lookups) in totals.items()}
+    registry.callback(
+        'aiunitalk_cache_hit_ratio', 'キャッシュ類のヒット率（起動からの累計）', cache_hit_ratio,
+        labelnames=['cache']
+    )
+
+_register_metrics()
 
 @app.route('/healthz', methods=['GET'])
 def health_check():
@@ -41,99 +110,400 @@ def health_check():
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'online_mode': os.getenv('ONLINE', 'true') == 'true',
-        'active_sessions': len(active_sessions)
+        'active_sessions': len(session_store),
+        'session_store': session_store.stats(),
+        'prefetch': dialog_service.prefetch_stats(),
+        'streaming': llm_service.stream_stats(),
+        'response_cache': llm_service.response_cache.stats(),
+        'token_usage': llm_service.usage_stats(),
+        'memory': llm_service.memory.stats(),
+        'dedup': coalescer.stats(),
+        'proximity': proximity_tracker.stats(),
+        'scheduler': llm_service.scheduler.stats(),
+        'deadlines': dialog_service.deadline_stats(),
+        'resilience': llm_service.resilience.stats(),
+        'tracing': tracer.stats(),
+        'profiler': profiler.stats(),
+        'logging': log_pipeline.stats(),
+        'transcripts': transcript_store.stats(),
+        'replay': replay_service.stats(),
+        'warm_pool': dialog_service.warm_pool.stats(),
+        'config': config_store.stats(),
+        'llm_max_concurrency': llm_service.max_concurrency
     })
 
+def _config_response(name: str):
+    """直列化済みの設定をETag付きで返す（一致すれば304）"""
+    snapshot = config_store.snapshot
+    body = snapshot.raw.get(name)
+    if not body:
+        logger.error("Config not available: %s", name)
+        return jsonify({'error': f'Failed to load {name} configuration'}), 500
+    
+    response = Response(body, mimetype='application/json')
+    response.set_etag(snapshot.etags[name])
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 @app.route('/config/agents', methods=['GET'])
 def get_agents():
     """キャラクター設定を取得"""
+    return _config_response('agents')
+
+@app.route('/config/locations', methods=['GET'])
+def get_locations():
+    """場所設定を取得"""
+    return _config_response('locations')
+
+def _notify_config_changed(snapshot, changed):
+    """設定の差し替えをクライアントに通知（必要なものだけ取り直してもらう）"""
+    socketio.emit('config_changed', {
+        'version': snapshot.version,
+        'changed': changed,
+        'etags': {name: snapshot.etags[name] for name in changed}
+    })
+
+config_store.subscribe(_notify_config_changed)
+
+@app.before_request
+def _profile_request_start():
+    profiler.request_started()
+
+@app.teardown_request
+def _profile_request_end(error=None):
+    profiler.request_finished()
+
+def _is_admin() -> bool:
+    """管理用エンドポイントの認可（ADMIN_TOKEN未設定ならローカルからのみ）"""
+    token = os.getenv('ADMIN_TOKEN')
+    if token:
+        return request.headers.get('X-Admin-Token') == token
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+@app.route('/admin/profile', methods=['POST'])
+def capture_profile():
+    """指定秒数だけプロファイルを取り、集計結果を返す"""
+    if not _is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'JSON body must be an object'}), 400
+    params = dict(request.args.items(), **data)
     try:
-        with open('config/agents.json', 'r', encoding='utf-8') as f:
-            agents = json.load(f)
-        return jsonify(agents)
-    except Exception as e:
-        logger.error(f"Failed to load agents config: {e}")
-        return jsonify({'error': 'Failed to load agents configuration'}), 500
+        result = profiler.capture(
+            seconds=float(params.get('seconds', 10)),
+            mode=params.get('mode', 'sample'),
+            interval=float(params['interval_ms']) / 1000 if params.get('interval_ms') else None,
+            limit=int(params.get('limit', 30))
+        )
+    except ProfilerBusy as e:
+        return jsonify({'error': str(e)}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus形式のメトリクス"""
+    return Response(registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+def _record_transcript(session_id: str, agent_ids: list, location: str, responses: list):
+    """生成した発言をトランスクリプトに追記（書き込みは別スレッド）"""
+    if replay_service.enabled:
+        return  # 再生した発言を記録し直さない
+    common = {
+        'session_id': session_id,
+        'pair': SessionStore.pair_key(agent_ids),
+        'agent_ids': agent_ids,
+        'location': location,
+        'location_id': dialog_service.location_service.resolve_location_id(location),
+        'time_bucket': dialog_service.get_time_bucket()
+    }
+    for response in responses:
+        transcript_store.append(dict(common, **response))
+
+def _idempotency_key(data: dict):
+    """クライアントが付けた冪等キー（ヘッダー優先、エンドポイントごとに別のキーとして扱う）"""
+    key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    return f"{request.path}:{key}" if key else None
 
 @app.route('/dialog/turn', methods=['POST'])
 def generate_dialog_turn():
     """会話の1ターンを生成"""
+    started = time.perf_counter()
+    with tracer.start('dialog_turn'):
+        response = _generate_dialog_turn()
+        status = response[1] if isinstance(response, tuple) else 200
+        tracer.annotate(status=status)
+    TURN_LATENCY.observe(time.perf_counter() - started, str(status))
+    return response
+
+def _generate_dialog_turn():
     try:
         data = request.json
         agent_ids = data.get('agent_ids', [])
         turn = data.get('turn', 1)
         context = data.get('context', '')
         location = data.get('location', '夏祭り会場')
+        deadline = dialog_service.turn_deadline(data.get('deadline_ms'))
         
         if len(agent_ids) < 2:
             return jsonify({'error': 'At least 2 agents required'}), 400
         
-        session_id = f"{'-'.join(agent_ids)}_{datetime.now().timestamp()}"
+        def run_turn() -> dict:
+            with tracer.span('resolve_session'):
+                session_id, session = session_store.resolve(
+                    data.get('session_id'), agent_ids, turn
+                )
+            session['turn'] = turn
+            session['location'] = location
+            tracer.annotate(session_id=session_id, turn=turn, stream=bool(data.get('stream')))
+            
+            started = time.perf_counter()
+            timing = {}
+            on_delta = None
+            if data.get('stream'):
+                def on_delta(delta: dict):
+                    if 'first_char_ms' not in timing:
+                        timing['first_char_ms'] = round((time.perf_counter() - started) * 1000, 1)
+                    socketio.emit('dialog_delta', dict(delta, session_id=session_id))
+            
+            with tracer.span('generate'):
+                response = dialog_service.generate_session_turn(
+                    session_id=session_id,
+                    agent_ids=agent_ids,
+                    turn=turn,
+                    context=context,
+                    location=location,
+                    history=session['history'],
+                    on_delta=on_delta,
+                    deadline=deadline
+                ).result()
+            
+            timing['total_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            timing.setdefault('first_char_ms', timing['total_ms'])
+            response = dict(response, session_id=session_id)
+            session_store.append_history(session, response)
+            _record_transcript(session_id, agent_ids, location, [response])
+            
+            with tracer.span('prefetch_next'):
+                dialog_service.prefetch_next(
+                    session_id=session_id,
+                    agent_ids=agent_ids,
+                    turn=turn,
+                    context=context,
+                    location=location,
+                    history=session['history'],
+                    max_turns=data.get('max_turns')
+                )
+            
+            with tracer.span('emit'):
+                socketio.emit('dialog_update', {
+                    'session_id': session_id,
+                    'response': response,
+                    'timing': timing
+                })
+            
+            logger.info(
+                "Generated dialog turn %s for session %s (first_char=%sms, total=%sms)",
+                turn, session_id, timing['first_char_ms'], timing['total_ms'],
+                extra=SAMPLED
+            )
+            return response
+        
+        response = coalescer.run(
+            ('turn', data.get('session_id') or SessionStore.pair_key(agent_ids), turn),
+            run_turn,
+            idempotency_key=_idempotency_key(data)
+        )
+        return jsonify(response)
+        
+    except Exception as e:
+        logger.error("Failed to generate dialog turn: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/dialog/conversation', methods=['POST'])
+def generate_dialog_conversation():
+    """会話全体を1回のLLM呼び出しで生成"""
+    try:
+        data = request.json
+        agent_ids = data.get('agent_ids', [])
+        context = data.get('context', '')
+        location = data.get('location', '夏祭り会場')
+        turns = data.get('turns', dialog_service.max_turns)
         
-        if session_id not in active_sessions:
-            active_sessions[session_id] = {
-                'agents': agent_ids,
-                'history': [],
-                'turn': 0
-            }
+        if len(agent_ids) < 2:
+            return jsonify({'error': 'At least 2 agents required'}), 400
+        if isinstance(turns, bool) or not isinstance(turns, int):
+            return jsonify({'error': 'turns must be an integer'}), 400
         
-        session = active_sessions[session_id]
-        session['turn'] = turn
+        def run_conversation() -> tuple:
+            session_id, session = session_store.resolve(
+                data.get('session_id'), agent_ids, 1
+            )
+            
+            responses = dialog_service.generate_conversation_async(
+                agent_ids=agent_ids,
+                context=context,
+                location=location,
+                turns=turns,
+                fair_key=session_id
+            ).result()
+            
+            responses = [dict(r, session_id=session_id) for r in responses]
+            for response in responses:
+                session_store.append_history(session, response)
+            session['turn'] = len(responses)
+            _record_transcript(session_id, agent_ids, location, responses)
+            
+            if data.get('push'):
+                interval = float(data.get(
+                    'interval',
+                    dialog_service.conversation_rules.get('turn_duration', 3000) / 1000
+                ))
+                socketio.start_background_task(
+                    _push_conversation, session_id, responses, interval
+                )
+            
+            logger.info("Generated %s-turn conversation for session %s", len(responses), session_id)
+            return session_id, responses
         
-        response = dialog_service.generate_turn(
-            agent_ids=agent_ids,
-            turn=turn,
-            context=context,
-            location=location,
-            history=session['history']
+        session_id, responses = coalescer.run(
+            ('conversation', data.get('session_id') or SessionStore.pair_key(agent_ids)),
+            run_conversation,
+            idempotency_key=_idempotency_key(data)
         )
+        return jsonify({'session_id': session_id, 'turns': responses})
         
-        session['history'].append(response)
-        
+    except Exception as e:
+        logger.error("Failed to generate conversation: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+def _push_conversation(session_id: str, responses: list, interval: float):
+    """生成済みの会話をターンごとにSocket.IOで配信"""
+    for i, response in enumerate(responses):
+        if i > 0:
+            socketio.sleep(interval)
         socketio.emit('dialog_update', {
             'session_id': session_id,
             'response': response
         })
-        
-        logger.info(f"Generated dialog turn {turn} for session {session_id}")
-        return jsonify(response)
-        
-    except Exception as e:
-        logger.error(f"Failed to generate dialog turn: {e}")
-        return jsonify({'error': str(e)}), 500
 
 @app.route('/dialog/reset', methods=['POST'])
 def reset_dialog():
     """会話セッションをリセット"""
     data = request.json
     session_id = data.get('session_id')
+    session = session_store.get(session_id)
     
-    if session_id in active_sessions:
-        del active_sessions[session_id]
-        logger.info(f"Reset session: {session_id}")
+    dialog_service.end_session(session_id, session)
+    if session is not None:
+        proximity_tracker.conversation_ended(session['agents'])
+    if session_store.remove(session_id):
+        logger.info("Reset session: %s", session_id)
     
     return jsonify({'status': 'reset', 'session_id': session_id})
 
+@app.route('/transcripts', methods=['GET'])
+def query_transcripts():
+    """記録した発言を検索（agent / location / pair / session_id / time_bucket / since / until / limit）"""
+    args = request.args
+    location = args.get('location')
+    pair = args.get('pair')
+    try:
+        lines = transcript_store.query(
+            limit=min(int(args.get('limit', 100)), 1000),
+            since=_parse_time(args.get('since')),
+            until=_parse_time(args.get('until')),
+            newest_first=args.get('order', 'desc') != 'asc',
+            speaker=args.get('agent'),
+            location=dialog_service.location_service.resolve_location_id(location) if location else None,
+            pair=SessionStore.pair_key(pair.split(',')) if pair else None,
+            session_id=args.get('session_id'),
+            time_bucket=args.get('time_bucket')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'count': len(lines), 'lines': lines})
+
+def _parse_time(value):
+    """UNIX秒かISO 8601の日時をUNIX秒に変換"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route('/location/resolve', methods=['POST'])
+def resolve_locations():
+    """ウェイポイント名・場所名をまとめて場所情報に変換"""
+    data = request.json or {}
+    names = data.get('names', [])
+    
+    if not isinstance(names, list):
+        return jsonify({'error': 'names must be a list'}), 400
+    
+    return jsonify({
+        'results': dialog_service.location_service.resolve_many([str(n) for n in names])
+    })
+
 @socketio.on('connect')
 def handle_connect():
     """WebSocket接続時"""
-    logger.info(f"Client connected: {request.sid}")
+    logger.info("Client connected: %s", request.sid)
     emit('connected', {'data': 'Connected to server'})
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """WebSocket切断時"""
-    logger.info(f"Client disconnected: {request.sid}")
+    proximity_tracker.forget_client(request.sid)
+    logger.info("Client disconnected: %s", request.sid)
 
 @socketio.on('proximity_detected')
 def handle_proximity(data):
     """キャラクター近接検知"""
     agent_ids = data.get('agent_ids', [])
-    distance = data.get('distance', 0)
+    try:
+        distance = float(data.get('distance', 0))
+    except (TypeError, ValueError):
+        emit('error', {'error': 'Invalid distance'})
+        return
+    if not isinstance(agent_ids, list):
+        emit('error', {'error': 'Invalid agent_ids'})
+        return
+    
+    logger.debug("Proximity detected: %s at distance %s", agent_ids, distance)
     
-    logger.info(f"Proximity detected: {agent_ids} at distance {distance}")
+    if proximity_tracker.observe(agent_ids, distance, client_id=request.sid):
+        logger.info("Starting conversation for %s (proximity)", agent_ids)
+        emit('start_conversation', {
+            'agent_ids': agent_ids,
+            'trigger': 'proximity'
+        }, broadcast=True)
+
+@socketio.on('positions_update')
+def handle_positions_update(data):
+    """全キャラクターの位置をまとめて受け取り、近接ペアの会話開始だけを配信
+    
+    positions は [[id, x, z], ...] または {id: [x, z]} の形式
+    """
+    raw = data.get('positions', [])
+    try:
+        if isinstance(raw, dict):
+            positions = {str(k): (float(v[0]), float(v[1])) for k, v in raw.items()}
+        else:
+            positions = {str(p[0]): (float(p[1]), float(p[2])) for p in raw}
+    except (TypeError, ValueError, IndexError, KeyError):
+        emit('error', {'error': 'Invalid positions'})
+        return
     
-    if distance < 2.0:
+    for agent_ids in proximity_tracker.observe_positions(positions, client_id=request.sid):
+        logger.info("Starting conversation for %s (positions)", agent_ids)
         emit('start_conversation', {
             'agent_ids': agent_ids,
             'trigger': 'proximity'
@@ -143,10 +513,14 @@ def handle_proximity(data):
 def handle_conversation_end(data):
     """会話終了通知"""
     session_id = data.get('session_id')
-    if session_id in active_sessions:
-        del active_sessions[session_id]
+    session = session_store.get(session_id)
+    dialog_service.end_session(session_id, session)
+    proximity_tracker.conversation_ended(
+        data.get('agent_ids') or (session['agents'] if session else [])
+    )
+    session_store.remove(session_id)
     
-    logger.info(f"Conversation ended: {session_id}")
+    logger.info("Conversation ended: %s", session_id)
     emit('agents_separate', {'session_id': session_id}, broadcast=True)
 
 if __name__ == '__main__':
@@ -156,5 +530,8 @@ if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('DEBUG', 'true') == 'true'
     
-    logger.info(f"Starting server on port {port}, debug={debug}")
+    logger.info("Starting server on port %s, debug=%s", port, debug)
+    if not replay_service.enabled:
+        dialog_service.warm_pool.start()
+    config_store.start()
     socketio.run(app, host='0.0.0.0', port=port, debug=debug)
\ No newline at end of file
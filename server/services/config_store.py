@@ -0,0 +1,171 @@
+import os
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+import orjson
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FILES = {
+    'agents': 'agents.json',
+    'locations': 'locations.json'
+}
+
+class ConfigSnapshot(NamedTuple):
+    """ある時点の設定一式（差し替え専用で中身は書き換えない）"""
+    version: int
+    data: Dict[str, Any]
+    raw: Dict[str, bytes]
+    etags: Dict[str, str]
+
+class ConfigError(ValueError):
+    pass
+
+class ConfigStore:
+    """agents.json / locations.json を読み込み、検証済みのスナップショットとして配る
+
+    ファイルの更新を監視し、検証に通ったものだけを丸ごと差し替えて購読者に通知する。
+    配信用のJSONはorjsonで直列化した状態で持っておき、ETagも事前に計算しておく。
+    """
+
+    def __init__(self, config_dir: Optional[str] = None):
+        self.config_dir = config_dir or os.getenv('CONFIG_DIR', 'config')
+        self.poll_interval = float(os.getenv('CONFIG_POLL_INTERVAL', '2'))
+
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[ConfigSnapshot, List[str]], None]] = []
+        self._stamps: Dict[str, Optional[Tuple[int, int]]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._reload_failures = 0
+
+        data, raw, etags = {}, {}, {}
+        for name in CONFIG_FILES:
+            self._stamps[name] = self._stat(name)
+            try:
+                data[name], raw[name] = self._load(name)
+            except FileNotFoundError:
+                logger.warning("%s not found", CONFIG_FILES[name])
+                data[name], raw[name] = None, b''
+            except Exception as e:
+                logger.error("Failed to load %s: %s", CONFIG_FILES[name], e)
+                data[name], raw[name] = None, b''
+            etags[name] = self._etag(raw[name])
+
+        self.snapshot = ConfigSnapshot(1, data, raw, etags)
+
+    def get(self, name: str) -> Optional[Dict]:
+        """設定の中身（読み込めていなければNone）"""
+        return self.snapshot.data.get(name)
+
+    def subscribe(self, listener: Callable[[ConfigSnapshot, List[str]], None]):
+        """差し替え時に (新しいスナップショット, 変更された設定名のリスト) で呼ばれる"""
+        self._listeners.append(listener)
+
+    def start(self):
+        """更新監視スレッドを起動"""
+        if self._thread is not None or self.poll_interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._watch, name='config-watch', daemon=True)
+        self._thread.start()
+        logger.info("Watching %s for config changes", self.config_dir)
+
+    def stop(self):
+        self._stop.set()
+
+    def reload(self, names: Optional[List[str]] = None) -> List[str]:
+        """指定した設定（省略時は全て）を読み直し、変更があれば差し替える"""
+        names = names or list(CONFIG_FILES)
+
+        with self._lock:
+            current = self.snapshot
+            data, raw, etags = dict(current.data), dict(current.raw), dict(current.etags)
+            changed = []
+            for name in names:
+                self._stamps[name] = self._stat(name)
+                try:
+                    new_data, new_raw = self._load(name)
+                except Exception as e:
+                    # 壊れた設定は採用せず、直前のスナップショットを使い続ける
+                    self._reload_failures += 1
+                    logger.error("Rejected %s: %s", CONFIG_FILES[name], e)
+                    continue
+                etag = self._etag(new_raw)
+                if etag == current.etags.get(name):
+                    continue
+                data[name], raw[name], etags[name] = new_data, new_raw, etag
+                changed.append(name)
+
+            if not changed:
+                return []
+            snapshot = ConfigSnapshot(current.version + 1, data, raw, etags)
+            self.snapshot = snapshot
+
+        logger.info("Config reloaded: %s (version %s)", ', '.join(changed), snapshot.version)
+        for listener in list(self._listeners):
+            try:
+                listener(snapshot, changed)
+            except Exception as e:
+                logger.error("Config listener failed: %s", e)
+        return changed
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                modified = [
+                    name for name in CONFIG_FILES
+                    if self._stat(name) != self._stamps.get(name)
+                ]
+                if modified:
+                    self.reload(modified)
+            except Exception as e:
+                logger.error("Config watch failed: %s", e)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.config_dir, CONFIG_FILES[name])
+
+    def _stat(self, name: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self._path(name))
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _load(self, name: str) -> Tuple[Dict, bytes]:
+        with open(self._path(name), 'rb') as f:
+            data = orjson.loads(f.read())
+        self._validate(name, data)
+        return data, orjson.dumps(data)
+
+    def _validate(self, name: str, data: Any):
+        """最低限の構造チェック（壊れた設定で稼働中のサーバーを止めないため）"""
+        key = 'agents' if name == 'agents' else 'locations'
+        required = ['id', 'name'] if name == 'agents' else ['id', 'display_name', 'context_description']
+
+        if not isinstance(data, dict) or not isinstance(data.get(key), list) or not data[key]:
+            raise ConfigError(f"'{key}' must be a non-empty list")
+
+        seen = set()
+        for item in data[key]:
+            if not isinstance(item, dict):
+                raise ConfigError(f"Each entry in '{key}' must be an object")
+            for field in required:
+                if not item.get(field):
+                    raise ConfigError(f"Entry {item.get('id', '?')} missing required field: {field}")
+            if item['id'] in seen:
+                raise ConfigError(f"Duplicate id: {item['id']}")
+            seen.add(item['id'])
+
+    def _etag(self, raw: bytes) -> str:
+        return hashlib.blake2b(raw, digest_size=12).hexdigest()
+
+    def stats(self) -> Dict:
+        """監視用の情報"""
+        snapshot = self.snapshot
+        return {
+            'version': snapshot.version,
+            'etags': dict(snapshot.etags),
+            'watching': self._thread is not None,
+            'reload_failures': self._reload_failures
+        }
@@ -0,0 +1,146 @@
+import os
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional
+
+from services.token_counter import TokenCounter, TOKENS_PER_MESSAGE
+
+logger = logging.getLogger(__name__)
+
+class ConversationMemory:
+    """LLMに渡す会話履歴の管理
+
+    直近の発言はトークン予算に収まる分だけ話者ごとの役割（自分=assistant / 相手=user）で渡し、
+    予算からあふれた古い発言はセッションごとの短い要約に畳み込む。
+    会話が終わったら、次に同じ組が出会ったとき用の「関係メモ」を残しておく。
+    """
+
+    def __init__(self, token_counter: TokenCounter):
+        self.token_counter = token_counter
+        self.token_budget = int(os.getenv('MEMORY_TOKEN_BUDGET', '300'))
+        self.summary_budget = int(os.getenv('MEMORY_SUMMARY_TOKENS', '80'))
+        self.max_sessions = int(os.getenv('MEMORY_MAX_SESSIONS', '1000'))
+        self.max_pairs = int(os.getenv('MEMORY_MAX_PAIRS', '500'))
+        self.notes_per_pair = int(os.getenv('MEMORY_NOTES_PER_PAIR', '3'))
+
+        # session_id -> {'upto': 畳み込み済みの最後のターン, 'fragments': 要約の断片}
+        self._summaries: "OrderedDict[str, Dict]" = OrderedDict()
+        # エージェントの組 -> 過去の会話のメモ（新しいものが末尾）
+        self._notes: "OrderedDict[str, Deque[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._stats = {'builds': 0, 'folded_turns': 0, 'history_tokens': 0}
+
+    def history_messages(
+        self,
+        speaker_id: Optional[str],
+        history: List[Dict],
+        session_id: Optional[str] = None
+    ) -> List[Dict]:
+        """話者から見た履歴メッセージ（要約 + 予算内の直近の発言）"""
+        recent: List[Dict] = []
+        used = 0
+        cut = len(history)
+        for entry in reversed(history):
+            message = self._to_message(entry, speaker_id)
+            cost = TOKENS_PER_MESSAGE + self.token_counter.count(message['content'])
+            if recent and used + cost > self.token_budget:
+                break
+            recent.append(message)
+            used += cost
+            cut -= 1
+        recent.reverse()
+
+        summary = self._fold(history[:cut], session_id)
+        if summary:
+            recent.insert(0, {"role": "system", "content": f"これまでの会話の要約：{summary}"})
+
+        with self._lock:
+            self._stats['builds'] += 1
+            self._stats['history_tokens'] += used
+        return recent
+
+    def _to_message(self, entry: Dict, speaker_id: Optional[str]) -> Dict:
+        text = entry.get('text', '')
+        if speaker_id is not None and entry.get('speaker') == speaker_id:
+            return {"role": "assistant", "content": text}
+        return {"role": "user", "content": f"{entry.get('speaker_name', '相手')}：{text}"}
+
+    def _fold(self, older: List[Dict], session_id: Optional[str]) -> str:
+        """予算外の発言を要約に畳み込む（セッションがあれば前回までの要約に追記）"""
+        if session_id is None or any('turn' not in e for e in older):
+            fragments = deque(self._fragment(e) for e in older)
+            self._trim(fragments)
+            return ' / '.join(fragments)
+
+        with self._lock:
+            state = self._summaries.get(session_id)
+            if state is None:
+                if not older:
+                    return ''
+                state = {'upto': 0, 'fragments': deque()}
+                self._summaries[session_id] = state
+                while len(self._summaries) > self.max_sessions:
+                    self._summaries.popitem(last=False)
+            else:
+                self._summaries.move_to_end(session_id)
+
+            for entry in older:
+                if entry['turn'] > state['upto']:
+                    state['fragments'].append(self._fragment(entry))
+                    state['upto'] = entry['turn']
+                    self._stats['folded_turns'] += 1
+            self._trim(state['fragments'])
+            return ' / '.join(state['fragments'])
+
+    def _fragment(self, entry: Dict) -> str:
+        text = entry.get('text', '')
+        if len(text) > 16:
+            text = text[:16] + '…'
+        return f"{entry.get('speaker_name', '相手')}「{text}」"
+
+    def _trim(self, fragments: Deque[str]):
+        """要約が予算を超えたら古い断片から捨てる"""
+        while len(fragments) > 1 and self.token_counter.count(' / '.join(fragments)) > self.summary_budget:
+            fragments.popleft()
+
+    def record_pair(self, pair: str, history: List[Dict], location: Optional[str] = None):
+        """終わった会話を組ごとの関係メモとして残す"""
+        if not history:
+            return
+        last = history[-1]
+        place = f"{location}で" if location else ''
+        note = f"前に{place}{len(history)}回やりとりした（最後は{self._fragment(last)}）"
+
+        with self._lock:
+            notes = self._notes.get(pair)
+            if notes is None:
+                notes = deque(maxlen=self.notes_per_pair)
+                self._notes[pair] = notes
+                while len(self._notes) > self.max_pairs:
+                    self._notes.popitem(last=False)
+            else:
+                self._notes.move_to_end(pair)
+            notes.append(note)
+
+    def pair_notes(self, pair: str) -> str:
+        """組の関係メモ（無ければ空文字）"""
+        with self._lock:
+            notes = self._notes.get(pair)
+            return '。'.join(notes) + '。' if notes else ''
+
+    def forget(self, session_id: str):
+        """終了したセッションの要約を捨てる"""
+        with self._lock:
+            self._summaries.pop(session_id, None)
+
+    def stats(self) -> Dict:
+        """監視用の統計情報"""
+        with self._lock:
+            stats = dict(self._stats, sessions=len(self._summaries), pairs=len(self._notes))
+        stats['token_budget'] = self.token_budget
+        stats['avg_history_tokens'] = (
+            round(stats['history_tokens'] / stats['builds'], 1) if stats['builds'] else None
+        )
+        return stats
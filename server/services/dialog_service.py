@@ -1,31 +1,118 @@
-import json
+import os
 import random
 import logging
-from typing import Dict, List, Optional
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
 from datetime import datetime
+from services.config_store import ConfigStore
 from services.location_service import LocationService
+from services.response_cache import fingerprint
+from services.session_store import SessionStore
+from services.scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, QueueFull
+from services.warm_pool import WarmPool
+from services.offline_engine import OfflineEngine
+from services.emotion_classifier import EmotionClassifier
+from services.tracing import tracer
+from services.log_pipeline import SAMPLED
 
 logger = logging.getLogger(__name__)
 
+TIME_CONTEXTS = {
+    "evening": "夕方で、空がオレンジ色に染まっています。",
+    "night": "夜になり、提灯の明かりが綺麗です。",
+    "late_night": "深夜で、お祭りも終わりに近づいています。",
+    "day": "昼間で、お祭りの準備が進んでいます。"
+}
+
 class DialogService:
-    def __init__(self):
+    def __init__(
+        self,
+        llm_service=None,
+        config_store: Optional[ConfigStore] = None,
+        replay_service=None
+    ):
+        self.config_store = config_store or ConfigStore()
+        self.conversation_rules = {}
+        self.emotion_lexicon = None
         self.agents = self._load_agents()
-        self.location_service = LocationService()
-        from services.llm_service import LLMService
-        self.llm_service = LLMService()
+        self.emotion_classifier = EmotionClassifier(self.emotion_lexicon, self.agents)
+        self.location_service = LocationService(self.config_store)
+        if llm_service is None:
+            from services.llm_service import LLMService
+            llm_service = LLMService()
+        self.llm_service = llm_service
+        self.offline_engine = OfflineEngine(self.agents, self.location_service)
+        self.llm_service.offline_engine = self.offline_engine
+        self.llm_service.compile_prompts(self.agents)
+        # REPLAY=true のとき記録済みの会話を再生する（未指定・無効なら通常の生成）
+        self.replay = replay_service
+        
+        # 先読み生成した次ターン: session_id -> (入力シグネチャ, Future)
+        self.prefetch_enabled = os.getenv('DIALOG_PREFETCH', 'true') == 'true'
+        self.prefetch_max = int(os.getenv('DIALOG_PREFETCH_MAX', '256'))
+        self._prefetched: "OrderedDict[str, tuple]" = OrderedDict()
+        self._prefetch_lock = threading.Lock()
+        self._prefetch_stats = {'started': 0, 'hits': 0, 'misses': 0, 'discarded': 0}
+        # ウォームプールから出した会話の続き: session_id -> 残りの応答dictのリスト
+        self._pending_exchange: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        
+        self.warm_pool = WarmPool(self)
+        
+        # ターンの締め切り（未指定時は turn_duration × 比率、DIALOG_DEADLINE_MS で固定も可）
+        self.deadline_ratio = float(os.getenv('DIALOG_DEADLINE_RATIO', '0.8'))
+        self._deadline_lock = threading.Lock()
+        self._deadline_stats = {
+            'requests': 0,
+            'on_time': 0,
+            'missed': 0,
+            'backfilled_cache': 0,
+            'backfilled_pool': 0,
+            'late_discarded': 0
+        }
+        
+        # LocationServiceより後に登録し、場所の索引が更新されてから呼ばれるようにする
+        self.config_store.subscribe(self._on_config_changed)
+    
+    @property
+    def max_turns(self) -> int:
+        """1回の会話の最大ターン数"""
+        return int(self.conversation_rules.get('max_turns', 6))
+    
+    def turn_deadline(self, deadline_ms: Optional[float] = None) -> Optional[float]:
+        """1ターンの締め切り（秒、0以下なら締め切りなし）"""
+        if deadline_ms is None:
+            deadline_ms = os.getenv('DIALOG_DEADLINE_MS')
+        if deadline_ms is None:
+            deadline_ms = float(self.conversation_rules.get('turn_duration', 3000)) * self.deadline_ratio
+        deadline_ms = float(deadline_ms)
+        return deadline_ms / 1000 if deadline_ms > 0 else None
     
     def _load_agents(self) -> Dict:
         """エージェント設定を読み込み"""
-        try:
-            with open('config/agents.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return {agent['id']: agent for agent in data['agents']}
-        except FileNotFoundError:
-            logger.warning("agents.json not found, using default agents")
-            return self._get_default_agents()
-        except Exception as e:
-            logger.error(f"Failed to load agents: {e}")
+        data = self.config_store.get('agents')
+        if data is None:
+            logger.warning("agents.json not available, using default agents")
             return self._get_default_agents()
+        self.conversation_rules = data.get('conversation_rules', {})
+        self.emotion_lexicon = data.get('emotion_lexicon')
+        return {agent['id']: agent for agent in data['agents']}
+    
+    def _on_config_changed(self, snapshot, changed: List[str]):
+        """設定の差し替え通知を受けてエージェント依存の状態を作り直す"""
+        if 'agents' in changed:
+            self.agents = self._load_agents()
+            self.emotion_classifier = EmotionClassifier(self.emotion_lexicon, self.agents)
+            logger.info("Loaded %s agents", len(self.agents))
+        
+        # 古い人物設定・場所で作った発言を残さない
+        self.offline_engine.compile(self.agents)
+        self.llm_service.compile_prompts(self.agents)
+        self.llm_service.response_cache.clear()
+        self.warm_pool.invalidate()
+        with self._prefetch_lock:
+            self._pending_exchange.clear()
     
     def _get_default_agents(self) -> Dict:
         """デフォルトのエージェント設定"""
@@ -65,44 +152,616 @@ class DialogService:
         history: List[Dict]
     ) -> Dict:
         """会話の1ターンを生成"""
+        return self.generate_turn_async(
+            agent_ids, turn, context, location, history
+        ).result()
+    
+    def generate_turn_async(
+        self,
+        agent_ids: List[str],
+        turn: int,
+        context: str,
+        location: str,
+        history: List[Dict],
+        on_delta: Optional[Callable[[Dict], None]] = None,
+        session_id: Optional[str] = None,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> Future:
+        """会話の1ターンを非同期に生成し、応答dictを返すFutureを返す
+        
+        on_deltaを渡すとストリーミング生成になり、部分文字列ごとに
+        {"speaker", "speaker_name", "turn", "delta"} を受け取る
+        返したFutureを取り消すと、まだ始まっていないLLM呼び出しも取り消される
+        バックグラウンドの生成がスケジューラに受け付けられなかった場合、Futureは取り消される
+        """
+        result = Future()
         
         try:
-            speaker_id = self._select_speaker(agent_ids, turn, history)
+            with tracer.span('select_speaker'):
+                speaker_id = self._select_speaker(agent_ids, turn, history)
             
             if speaker_id not in self.agents:
-                logger.error(f"Unknown agent: {speaker_id}")
+                logger.error("Unknown agent: %s", speaker_id)
                 speaker_id = agent_ids[0]
             
             agent = self.agents[speaker_id]
             
-            conversation_context = self._build_context(
-                agent, context, location, history
-            )
+            with tracer.span('build_context'):
+                conversation_context = self._build_context(
+                    agent, context, location, agent_ids
+                )
+            
+            text_delta = None
+            if on_delta is not None:
+                def text_delta(delta: str):
+                    on_delta({
+                        "speaker": speaker_id,
+                        "speaker_name": agent['name'],
+                        "turn": turn,
+                        "delta": delta
+                    })
             
-            response_text = self.llm_service.generate_response(
+            llm_future = self.llm_service.generate_response_async(
                 agent_data=agent,
                 context=conversation_context,
                 history=history,
-                location=location
+                location=location,
+                on_delta=text_delta,
+                cache_key=self._cache_key(speaker_id, context, location, history),
+                session_id=session_id,
+                priority=priority
             )
-            
-            emotion = self._detect_emotion(response_text)
-            
-            response = {
-                "speaker": speaker_id,
-                "speaker_name": agent['name'],
-                "text": response_text,
-                "emotion": emotion,
-                "turn": turn,
-                "timestamp": datetime.now().isoformat()
-            }
-            
-            logger.info(f"Turn {turn}: {agent['name']} says: {response_text}")
-            return response
-            
         except Exception as e:
-            logger.error(f"Failed to generate turn: {e}")
+            logger.error("Failed to generate turn: %s", e)
+            result.set_result(self._generate_fallback_response(agent_ids[0], turn))
+            return result
+        
+        def _on_done(f: Future):
+            if result.cancelled():  # 破棄された先読み
+                return
+            if not f.cancelled() and isinstance(f.exception(), QueueFull):
+                # 混雑で断られた先読みは代わりの発言で埋めず、表示時に生成し直させる
+                result.cancel()
+                return
+            try:
+                reply = f.result()
+                result.set_result(
+                    self._build_response(speaker_id, agent, reply.text, turn, source=reply.source)
+                )
+            except Exception as e:
+                logger.error("Failed to generate turn: %s", e)
+                result.set_result(self._generate_fallback_response(agent_ids[0], turn))
+        
+        def _on_cancel(r: Future):
+            if r.cancelled():
+                llm_future.cancel()
+        
+        llm_future.add_done_callback(_on_done)
+        result.add_done_callback(_on_cancel)
+        return result
+    
+    def generate_session_turn(
+        self,
+        session_id: str,
+        agent_ids: List[str],
+        turn: int,
+        context: str,
+        location: str,
+        history: List[Dict],
+        on_delta: Optional[Callable[[Dict], None]] = None,
+        deadline: Optional[float] = None
+    ) -> Future:
+        """セッションの1ターンを生成（先読み済みの結果があればそれを使う）
+        
+        deadline（秒）までに生成が終わらなければ、キャッシュかオフラインの発言で先に返す
+        """
+        if deadline is None:
+            return self._session_turn(session_id, agent_ids, turn, context, location, history, on_delta)
+        
+        history = list(history)
+        # open: 締め切り前か / streamed: 生成中の文字列を既に渡したか
+        gate = {'open': True, 'streamed': False, 'lock': threading.Lock()}
+        gated_delta = None
+        if on_delta is not None:
+            def gated_delta(delta: Dict):
+                with gate['lock']:
+                    if gate['open']:
+                        gate['streamed'] = True
+                        on_delta(delta)
+        
+        inner = self._session_turn(session_id, agent_ids, turn, context, location, history, gated_delta)
+        return self._with_deadline(
+            inner, deadline, gate, on_delta,
+            session_id, agent_ids, turn, context, location, history
+        )
+    
+    def _with_deadline(
+        self,
+        inner: Future,
+        deadline: float,
+        gate: Dict,
+        on_delta: Optional[Callable[[Dict], None]],
+        session_id: str,
+        agent_ids: List[str],
+        turn: int,
+        context: str,
+        location: str,
+        history: List[Dict]
+    ) -> Future:
+        """締め切りまでに終わった方を返し、遅れて届いた生成結果は再利用に回す
+        
+        生成中の文字列を渡し始めていた場合、代わりの発言は replace=True の差分として送り、
+        表示中の文字列に継ぎ足さず置き換えさせる
+        """
+        result = Future()
+        lock = gate['lock']
+        
+        with self._deadline_lock:
+            self._deadline_stats['requests'] += 1
+        
+        def _on_timeout():
+            with lock:
+                if not gate['open']:
+                    return
+                gate['open'] = False
+                streamed = gate['streamed']
+            # 呼び出し側は結果を時間制限なしで待つので、ここで失敗してもFutureは必ず解決する
+            try:
+                response = self._deadline_fallback(session_id, agent_ids, turn, context, location, history)
+            except Exception as e:
+                logger.error("Deadline fallback failed for session %s: %s", session_id, e)
+                response = self._generate_fallback_response(agent_ids[0], turn)
+            try:
+                if on_delta is not None:
+                    delta = {
+                        "speaker": response['speaker'],
+                        "speaker_name": response['speaker_name'],
+                        "turn": turn,
+                        "delta": response['text']
+                    }
+                    if streamed:
+                        delta['replace'] = True
+                    on_delta(delta)
+            except Exception as e:
+                logger.error("Failed to send deadline delta for session %s: %s", session_id, e)
+            finally:
+                with self._deadline_lock:
+                    self._deadline_stats['missed'] += 1
+                logger.info("Turn %s for session %s missed its %.2fs deadline", turn, session_id, deadline)
+                result.set_result(response)
+        
+        timer = threading.Timer(deadline, _on_timeout)
+        timer.daemon = True
+        
+        def _on_done(f: Future):
+            with lock:
+                on_time = gate['open']
+                gate['open'] = False
+            if on_time:
+                timer.cancel()
+                with self._deadline_lock:
+                    self._deadline_stats['on_time'] += 1
+                if f.cancelled():
+                    result.cancel()
+                elif f.exception() is not None:
+                    result.set_exception(f.exception())
+                else:
+                    result.set_result(f.result())
+                return
+            if not f.cancelled() and f.exception() is None:
+                self._backfill(f.result(), agent_ids, turn, context, location, history)
+        
+        timer.start()
+        inner.add_done_callback(_on_done)
+        return result
+    
+    def _deadline_fallback(
+        self,
+        session_id: str,
+        agent_ids: List[str],
+        turn: int,
+        context: str,
+        location: str,
+        history: List[Dict]
+    ) -> Dict:
+        """締め切りに間に合わないときの即答（キャッシュの候補、無ければオフラインの発言）"""
+        speaker_id = self._select_speaker(agent_ids, turn, history)
+        agent = self.agents.get(speaker_id)
+        if agent is None:
             return self._generate_fallback_response(agent_ids[0], turn)
+        
+        source = 'cache'
+        text = self.llm_service.response_cache.peek(
+            self._cache_key(speaker_id, context, location, history)
+        )
+        if text is None:
+            source = 'offline'
+            text = self.offline_engine.generate(
+                speaker_id, location, session_id, opening=turn == 1 and not history
+            )
+        if text is None:
+            return self._generate_fallback_response(speaker_id, turn)
+        return self._build_response(speaker_id, agent, text, turn, source=source)
+    
+    def _backfill(
+        self,
+        response: Dict,
+        agent_ids: List[str],
+        turn: int,
+        context: str,
+        location: str,
+        history: List[Dict]
+    ):
+        """遅れて届いた生成結果を、次に使えるところへ預ける
+        
+        ウォームプールにはLLMで生成できた発言だけを預ける（代わりの発言は出所を隠して配られてしまう）
+        """
+        if (
+            turn == 1 and not history and response.get('source') == 'llm'
+            and self.warm_pool.offer(agent_ids, location, [response])
+        ):
+            outcome = 'backfilled_pool'
+        elif self.llm_service.response_cache.contains(
+            self._cache_key(response['speaker'], context, location, history), response['text']
+        ):
+            # LLMで生成できた発言は generate_response がキャッシュに入れている
+            outcome = 'backfilled_cache'
+        else:
+            outcome = 'late_discarded'
+        with self._deadline_lock:
+            self._deadline_stats[outcome] += 1
+    
+    def deadline_stats(self) -> Dict:
+        """締め切りの統計情報"""
+        with self._deadline_lock:
+            stats = dict(self._deadline_stats)
+        decided = stats['on_time'] + stats['missed']
+        stats['on_time_rate'] = round(stats['on_time'] / decided, 3) if decided else None
+        default = self.turn_deadline()
+        stats['default_deadline_ms'] = round(default * 1000) if default else None
+        return stats
+    
+    def _session_turn(
+        self,
+        session_id: str,
+        agent_ids: List[str],
+        turn: int,
+        context: str,
+        location: str,
+        history: List[Dict],
+        on_delta: Optional[Callable[[Dict], None]]
+    ) -> Future:
+        if self.replay is not None and self.replay.enabled:
+            replayed = self._serve_from_replay(session_id, agent_ids, turn, location, on_delta)
+            if replayed is not None:
+                return replayed
+        
+        if turn == 1 and not history:
+            drawn = self.warm_pool.draw(agent_ids, location, context)
+            if drawn:
+                tracer.annotate(source='warm_pool')
+                return self._serve_from_warm_pool(session_id, drawn, on_delta)
+        
+        signature = self._prefetch_signature(agent_ids, turn, context, location, history)
+        
+        with self._prefetch_lock:
+            entry = self._prefetched.pop(session_id, None)
+            if entry is not None and entry[0] == signature and not entry[1].cancelled():
+                self._prefetch_stats['hits'] += 1
+                prefetched = entry[1]
+            else:
+                if entry is not None:
+                    self._prefetch_stats['discarded'] += 1
+                    entry[1].cancel()
+                self._prefetch_stats['misses'] += 1
+                prefetched = None
+        
+        if prefetched is None:
+            tracer.annotate(source='generate')
+            return self.generate_turn_async(
+                agent_ids, turn, context, location, history,
+                on_delta=on_delta, session_id=session_id
+            )
+        
+        logger.debug("Serving prefetched turn %s for session %s", turn, session_id)
+        tracer.annotate(source='prefetch', prefetch_ready=prefetched.done())
+        if not prefetched.done():
+            # 先読みの生成がまだ待機中なら、表示待ちの仕事として先に回す
+            self.llm_service.scheduler.promote(session_id)
+        result = Future()
+        
+        def _on_done(f: Future):
+            try:
+                response = dict(f.result(), timestamp=datetime.now().isoformat())
+            except Exception as e:
+                logger.error("Prefetched turn failed: %s", e)
+                response = self._generate_fallback_response(agent_ids[0], turn)
+            try:
+                # 先読みは差分なしで生成しているので、ストリーミング要求には全文を1回で渡す
+                if on_delta is not None:
+                    on_delta({
+                        "speaker": response['speaker'],
+                        "speaker_name": response['speaker_name'],
+                        "turn": turn,
+                        "delta": response['text']
+                    })
+            finally:
+                result.set_result(response)
+        
+        prefetched.add_done_callback(_on_done)
+        return result
+    
+    def _serve_from_warm_pool(
+        self,
+        session_id: str,
+        lines: List[Dict],
+        on_delta: Optional[Callable[[Dict], None]]
+    ) -> Future:
+        """ウォームプールの出だしを返し、続きを次ターンの先読み候補として預かる"""
+        lines = [dict(line, source='warm') for line in lines]
+        first = dict(lines[0], timestamp=datetime.now().isoformat())
+        if on_delta is not None:
+            on_delta({
+                "speaker": first['speaker'],
+                "speaker_name": first['speaker_name'],
+                "turn": first['turn'],
+                "delta": first['text']
+            })
+        
+        with self._prefetch_lock:
+            self._pending_exchange.pop(session_id, None)
+            if len(lines) > 1:
+                self._pending_exchange[session_id] = lines[1:]
+                while len(self._pending_exchange) > self.prefetch_max:
+                    self._pending_exchange.popitem(last=False)
+        
+        logger.debug("Serving turn 1 for session %s from warm pool", session_id)
+        result = Future()
+        result.set_result(first)
+        return result
+    
+    def _serve_from_replay(
+        self,
+        session_id: str,
+        agent_ids: List[str],
+        turn: int,
+        location: str,
+        on_delta: Optional[Callable[[Dict], None]]
+    ) -> Optional[Future]:
+        """記録済みの会話から該当ターンの発言を返す（記録が無ければNone）"""
+        line = self.replay.turn(
+            session_id,
+            SessionStore.pair_key(agent_ids),
+            turn,
+            self.location_service.resolve_location_id(location),
+            self.get_time_bucket(),
+            self.max_turns
+        )
+        if line is None or line['speaker'] not in self.agents:
+            return None
+        
+        tracer.annotate(source='replay')
+        response = self._build_response(
+            line['speaker'], self.agents[line['speaker']], line['text'], turn, line.get('emotion'),
+            source='replay'
+        )
+        if on_delta is not None:
+            on_delta({
+                "speaker": response['speaker'],
+                "speaker_name": response['speaker_name'],
+                "turn": turn,
+                "delta": response['text']
+            })
+        
+        result = Future()
+        result.set_result(response)
+        return result
+    
+    def prefetch_next(
+        self,
+        session_id: str,
+        agent_ids: List[str],
+        turn: int,
+        context: str,
+        location: str,
+        history: List[Dict],
+        max_turns: Optional[int] = None
+    ):
+        """表示中のターンの裏で次のターンを先に生成しておく"""
+        next_turn = turn + 1
+        if not self.prefetch_enabled or next_turn > (max_turns or self.max_turns):
+            return
+        if self.replay is not None and self.replay.covers(SessionStore.pair_key(agent_ids)):
+            return  # 再生は記録を読むだけなので先読みしない
+        
+        history = list(history)
+        signature = self._prefetch_signature(agent_ids, next_turn, context, location, history)
+        
+        with self._prefetch_lock:
+            pending = self._pending_exchange.pop(session_id, None)
+        if pending and pending[0]['turn'] == next_turn:
+            future = Future()
+            future.set_result(pending[0])
+            if len(pending) > 1:
+                with self._prefetch_lock:
+                    self._pending_exchange[session_id] = pending[1:]
+        else:
+            # 先読みは表示中のターンとは別の仕事なので、そのトレースに含めない
+            with tracer.detached():
+                future = self.generate_turn_async(
+                    agent_ids, next_turn, context, location, history,
+                    session_id=session_id, priority=PRIORITY_BACKGROUND
+                )
+        
+        with self._prefetch_lock:
+            old = self._prefetched.pop(session_id, None)
+            if old is not None:
+                old[1].cancel()
+            self._prefetched[session_id] = (signature, future)
+            self._prefetch_stats['started'] += 1
+            while len(self._prefetched) > self.prefetch_max:
+                _, (_, dropped) = self._prefetched.popitem(last=False)
+                dropped.cancel()
+                self._prefetch_stats['discarded'] += 1
+    
+    def end_session(self, session_id: str, session: Optional[Dict] = None):
+        """終了・リセットされたセッションに紐づく状態を破棄（会話内容は関係メモとして残す）"""
+        self.discard_prefetch(session_id)
+        if self.replay is not None:
+            self.replay.forget(session_id)
+        self.offline_engine.forget(session_id)
+        self.llm_service.memory.forget(session_id)
+        if session is not None:
+            self.llm_service.memory.record_pair(
+                session['pair'], session['history'], session.get('location')
+            )
+    
+    def discard_prefetch(self, session_id: str):
+        """終了・リセットされたセッションの先読み結果を破棄"""
+        with self._prefetch_lock:
+            self._pending_exchange.pop(session_id, None)
+            entry = self._prefetched.pop(session_id, None)
+            if entry is not None:
+                entry[1].cancel()
+                self._prefetch_stats['discarded'] += 1
+    
+    def prefetch_stats(self) -> Dict:
+        """先読みの統計情報"""
+        with self._prefetch_lock:
+            return dict(self._prefetch_stats, pending=len(self._prefetched))
+    
+    def _prefetch_signature(
+        self,
+        agent_ids: List[str],
+        turn: int,
+        context: str,
+        location: str,
+        history: List[Dict]
+    ) -> tuple:
+        """先読み結果を使ってよいか判定するための入力シグネチャ"""
+        last = history[-1] if history else {}
+        return (
+            tuple(agent_ids),
+            turn,
+            context,
+            location,
+            len(history),
+            last.get('speaker'),
+            last.get('text')
+        )
+    
+    def generate_conversation_async(
+        self,
+        agent_ids: List[str],
+        context: str,
+        location: str,
+        turns: Optional[int] = None,
+        fallback: bool = True,
+        priority: int = PRIORITY_NORMAL,
+        fair_key: Optional[str] = None
+    ) -> Future:
+        """会話全体を1回のLLM呼び出しで生成し、ターンごとの応答dictのリストを返すFutureを返す
+        
+        fallback=Falseの場合、生成に失敗するとFutureは例外で完了する
+        turnsは 1〜max_turns に収める（LLMの max_tokens やオフラインの台本の長さがこれで決まる）
+        """
+        turns = max(1, min(self.max_turns if turns is None else turns, self.max_turns))
+        agents = [self.agents[aid] for aid in agent_ids if aid in self.agents]
+        result = Future()
+        
+        if len(agents) < 2:
+            result.set_exception(ValueError(f"Unknown agents in {agent_ids}"))
+            return result
+        
+        if self.replay is not None and self.replay.enabled:
+            lines = self.replay.conversation(
+                SessionStore.pair_key(agent_ids),
+                turns,
+                self.location_service.resolve_location_id(location),
+                self.get_time_bucket(),
+                self.max_turns
+            )
+            if lines and all(line['speaker'] in self.agents for line in lines):
+                result.set_result([
+                    self._build_response(
+                        line['speaker'], self.agents[line['speaker']], line['text'], turn, line.get('emotion'),
+                        source='replay'
+                    )
+                    for turn, line in enumerate(lines, start=1)
+                ])
+                return result
+        
+        location_context = self._get_location_context(location)
+        time_context = self._get_time_context()
+        script_context = " ".join(p for p in [context, location_context, time_context] if p)
+        
+        llm_future = self.llm_service.generate_conversation_async(
+            agents=agents,
+            context=script_context,
+            location=location,
+            turns=turns,
+            fallback=fallback,
+            priority=priority,
+            fair_key=fair_key
+        )
+        
+        def _on_done(f: Future):
+            try:
+                lines = f.result()
+                emotions = self.emotion_classifier.classify_many(
+                    [line['text'] for line in lines],
+                    [line['speaker'] for line in lines]
+                )
+                result.set_result([
+                    self._build_response(
+                        line['speaker'], self.agents[line['speaker']], line['text'], turn, emotion,
+                        source=line['source']
+                    )
+                    for turn, (line, emotion) in enumerate(zip(lines, emotions), start=1)
+                ])
+            except Exception as e:
+                logger.error("Failed to generate conversation: %s", e)
+                if not fallback:
+                    result.set_exception(e)
+                    return
+                result.set_result([
+                    self._generate_fallback_response(agent_ids[(turn - 1) % len(agent_ids)], turn)
+                    for turn in range(1, turns + 1)
+                ])
+        
+        llm_future.add_done_callback(_on_done)
+        return result
+    
+    def _build_response(
+        self,
+        speaker_id: str,
+        agent: Dict,
+        response_text: str,
+        turn: int,
+        emotion: Optional[str] = None,
+        *,
+        source: str
+    ) -> Dict:
+        """LLMの出力からクライアント向けの応答dictを組み立てる
+        
+        sourceは発言の出どころ（llm / cache / offline / partial / warm / replay）で、トランスクリプトにも残る
+        """
+        if emotion is None:
+            with tracer.span('detect_emotion'):
+                emotion = self._detect_emotion(response_text, speaker_id)
+        
+        response = {
+            "speaker": speaker_id,
+            "speaker_name": agent['name'],
+            "text": response_text,
+            "emotion": emotion,
+            "turn": turn,
+            "source": source,
+            "timestamp": datetime.now().isoformat()
+        }
+        
+        logger.info("Turn %s: %s says: %s", turn, agent['name'], response_text, extra=SAMPLED)
+        return response
     
     def _select_speaker(
         self,
@@ -127,19 +786,17 @@ class DialogService:
         agent: Dict,
         context: str,
         location: str,
-        history: List[Dict]
+        agent_ids: List[str]
     ) -> str:
-        """会話のコンテキストを構築"""
+        """会話のコンテキストを構築（直前の発言は履歴メッセージ側で渡す）"""
         context_parts = []
         
         if context:
             context_parts.append(context)
         
-        if history:
-            last_message = history[-1]
-            context_parts.append(
-                f"{last_message.get('speaker_name', '相手')}が「{last_message.get('text', '')}」と言いました。"
-            )
+        notes = self.llm_service.memory.pair_notes(SessionStore.pair_key(agent_ids))
+        if notes:
+            context_parts.append(notes)
         
         # 場所に応じたコンテキストを追加
         location_context = self._get_location_context(location)
@@ -155,31 +812,42 @@ class DialogService:
         """場所に応じたコンテキストを生成"""
         return self.location_service.build_location_context(location)
     
-    def _get_time_context(self) -> str:
-        """時間帯に応じたコンテキスト"""
+    def get_time_bucket(self) -> str:
+        """現在の時間帯の区分"""
         hour = datetime.now().hour
         
         if 17 <= hour < 19:
-            return "夕方で、空がオレンジ色に染まっています。"
+            return "evening"
         elif 19 <= hour < 22:
-            return "夜になり、提灯の明かりが綺麗です。"
+            return "night"
         elif 22 <= hour or hour < 5:
-            return "深夜で、お祭りも終わりに近づいています。"
+            return "late_night"
         else:
-            return "昼間で、お祭りの準備が進んでいます。"
+            return "day"
+    
+    def _get_time_context(self) -> str:
+        """時間帯に応じたコンテキスト"""
+        return TIME_CONTEXTS[self.get_time_bucket()]
+    
+    def _cache_key(
+        self,
+        speaker_id: str,
+        context: str,
+        location: str,
+        history: List[Dict]
+    ) -> tuple:
+        """応答キャッシュのキー（話者・場所・時間帯・直前の発言）"""
+        last_text = history[-1].get('text', '') if history else ''
+        return (
+            speaker_id,
+            self.location_service.resolve_location_id(location),
+            self.get_time_bucket(),
+            fingerprint(context, last_text)
+        )
     
-    def _detect_emotion(self, text: str) -> str:
+    def _detect_emotion(self, text: str, agent_id: Optional[str] = None) -> str:
         """テキストから感情を推定"""
-        if any(word in text for word in ['嬉しい', '楽しい', 'わぁ', '♪']):
-            return 'happy'
-        elif any(word in text for word in ['悲しい', '寂しい', 'つらい']):
-            return 'sad'
-        elif any(word in text for word in ['怒', 'むか', 'イライラ']):
-            return 'angry'
-        elif any(word in text for word in ['びっくり', 'え？', '！？']):
-            return 'surprised'
-        else:
-            return 'neutral'
+        return self.emotion_classifier.classify(text, agent_id)
     
     def _generate_fallback_response(self, agent_id: str, turn: int) -> Dict:
         """エラー時のフォールバック応答"""
@@ -189,5 +857,6 @@ class DialogService:
             "text": "そうですね...",
             "emotion": "neutral",
             "turn": turn,
+            "source": "fallback",
             "timestamp": datetime.now().isoformat()
         }
\ No newline at end of file
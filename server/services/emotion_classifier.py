@@ -0,0 +1,116 @@
+import re
+import logging
+from typing import Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# 同点のときはこの順で優先する
+EMOTIONS = ['happy', 'sad', 'angry', 'surprised']
+
+DEFAULT_LEXICON = {
+    'happy': {'嬉しい': 1.0, '楽しい': 1.0, 'わぁ': 0.5, '♪': 0.5},
+    'sad': {'悲しい': 1.0, '寂しい': 1.0, 'つらい': 1.0},
+    'angry': {'怒': 1.0, 'むか': 1.0, 'イライラ': 1.0},
+    'surprised': {'びっくり': 1.0, 'え？': 1.0, '！？': 1.0}
+}
+
+LexiconSpec = Dict[str, Union[Dict[str, float], List[str]]]
+
+class _Matcher:
+    """語彙全体を1本の正規表現にまとめたもの"""
+
+    def __init__(self, lexicon: Dict[str, Dict[str, float]]):
+        # 語 -> [(感情, 重み)]（同じ語が複数の感情に属してもよい）
+        self.weights: Dict[str, List[Tuple[str, float]]] = {}
+        for emotion, words in lexicon.items():
+            for word, weight in words.items():
+                self.weights.setdefault(word, []).append((emotion, weight))
+
+        words = sorted(self.weights, key=len, reverse=True)
+        self.pattern = re.compile('|'.join(map(re.escape, words))) if words else None
+
+    def scores(self, text: str) -> Dict[str, float]:
+        return self.tally(self.pattern.findall(text) if self.pattern else ())
+
+    def tally(self, found) -> Dict[str, float]:
+        result: Dict[str, float] = {}
+        for word in found:
+            for emotion, weight in self.weights[word]:
+                result[emotion] = result.get(emotion, 0.0) + weight
+        return result
+
+class EmotionClassifier:
+    """発言から感情を推定する分類器
+
+    起動時に語彙（agents.json の emotion_lexicon）から1本の正規表現を作り、
+    1回の走査で全感情の重み付きスコアを集計して最大のものを返す。
+    エージェントごとの emotion_lexicon は全体の語彙に上書き・追加される。
+    """
+
+    def __init__(self, lexicon: Optional[LexiconSpec] = None, agents: Optional[Dict] = None):
+        self.lexicon = self._normalize(lexicon or DEFAULT_LEXICON)
+        self._default = _Matcher(self.lexicon)
+        self._per_agent: Dict[str, _Matcher] = {}
+
+        for agent_id, agent in (agents or {}).items():
+            overrides = agent.get('emotion_lexicon')
+            if overrides:
+                merged = {emotion: dict(words) for emotion, words in self.lexicon.items()}
+                for emotion, words in self._normalize(overrides).items():
+                    merged.setdefault(emotion, {}).update(words)
+                self._per_agent[agent_id] = _Matcher(merged)
+
+    def _normalize(self, lexicon: LexiconSpec) -> Dict[str, Dict[str, float]]:
+        """語のリストは重み1.0の辞書として扱う"""
+        normalized = {}
+        for emotion, words in lexicon.items():
+            if isinstance(words, dict):
+                normalized[emotion] = {w: float(v) for w, v in words.items() if w}
+            else:
+                normalized[emotion] = {w: 1.0 for w in words if w}
+        return normalized
+
+    def _matcher(self, agent_id: Optional[str]) -> _Matcher:
+        return self._per_agent.get(agent_id, self._default)
+
+    def scores(self, text: str, agent_id: Optional[str] = None) -> Dict[str, float]:
+        """感情ごとのスコア"""
+        return self._matcher(agent_id).scores(text or '')
+
+    def classify(self, text: str, agent_id: Optional[str] = None) -> str:
+        """最もスコアの高い感情（該当なしは neutral）"""
+        matcher = self._per_agent.get(agent_id, self._default)
+        if matcher.pattern is None or not text:
+            return 'neutral'
+        found = matcher.pattern.findall(text)
+        if not found:
+            return 'neutral'
+        return self._pick(matcher.tally(found))
+
+    def classify_many(
+        self,
+        texts: List[str],
+        agent_ids: Optional[List[Optional[str]]] = None
+    ) -> List[str]:
+        """複数の発言をまとめて分類（会話全体の台本やウォームプール向け）"""
+        if agent_ids is None:
+            agent_ids = [None] * len(texts)
+
+        results = []
+        per_agent, default, pick = self._per_agent, self._default, self._pick
+        for text, agent_id in zip(texts, agent_ids):
+            matcher = per_agent.get(agent_id, default)
+            found = matcher.pattern.findall(text) if text and matcher.pattern else None
+            results.append(pick(matcher.tally(found)) if found else 'neutral')
+        return results
+
+    def _pick(self, scores: Dict[str, float]) -> str:
+        best, best_score = 'neutral', 0.0
+        for emotion in EMOTIONS:
+            score = scores.get(emotion, 0.0)
+            if score > best_score:
+                best, best_score = emotion, score
+        for emotion, score in scores.items():
+            if emotion not in EMOTIONS and score > best_score:
+                best, best_score = emotion, score
+        return best
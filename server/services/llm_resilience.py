@@ -0,0 +1,286 @@
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+import openai
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(RuntimeError):
+    """ブレーカーが開いている間は呼び出さずに失敗させる"""
+
+class RateLimitedLocally(RuntimeError):
+    """トークン数の上限により送らなかった"""
+
+# 再試行してよい失敗（レート制限・一時的な障害）
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError
+)
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+def hedge_slots(max_concurrency: int) -> int:
+    """同時に投げるヘッジの上限（ワーカー数の半分）
+
+    HTTPのコネクションプールとヘッジ用スレッドはどちらも max_concurrency + この値で用意する。
+    """
+    return max(1, max_concurrency // 2)
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    return getattr(error, 'status_code', None) in RETRYABLE_STATUS
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Retry-Afterヘッダーの秒数（無ければNone）"""
+    response = getattr(error, 'response', None)
+    value = response.headers.get('retry-after') if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+class CircuitBreaker:
+    """連続失敗で開き、一定時間後に1件だけ試して閉じるか判断する"""
+
+    def __init__(self):
+        self.failure_threshold = int(os.getenv('LLM_BREAKER_FAILURES', '5'))
+        self.open_seconds = float(os.getenv('LLM_BREAKER_OPEN_SECONDS', '30'))
+
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'rejected': 0}
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.open_seconds:
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                logger.info("Circuit breaker half-open, probing LLM")
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def release_probe(self):
+        """試行枠を取ったが呼び出さなかった場合に返す"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info("Circuit breaker closed, LLM recovered")
+            self.state = 'closed'
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == 'half_open' or (
+                self.state == 'closed' and self._failures >= self.failure_threshold
+            ):
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+                self._probing = False
+                self._stats['opened'] += 1
+                logger.warning("Circuit breaker opened after %s failures, using offline responses", self._failures)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, state=self.state, consecutive_failures=self._failures)
+
+class TokenRateLimiter:
+    """1分あたりのトークン数で送信を絞るトークンバケット（0なら無制限）"""
+
+    def __init__(self, tokens_per_minute: int):
+        self.tokens_per_minute = tokens_per_minute
+        self._available = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._stats = {'waited': 0, 'rejected': 0}
+
+    def acquire(self, tokens: int, timeout: float) -> bool:
+        if self.tokens_per_minute <= 0:
+            return True
+        tokens = min(tokens, self.tokens_per_minute)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            waited = False
+            while True:
+                now = time.monotonic()
+                self._available = min(
+                    self.tokens_per_minute,
+                    self._available + (now - self._updated) * self.tokens_per_minute / 60
+                )
+                self._updated = now
+                if self._available >= tokens:
+                    self._available -= tokens
+                    if waited:
+                        self._stats['waited'] += 1
+                    return True
+                shortfall = (tokens - self._available) * 60 / self.tokens_per_minute
+                if now + shortfall > deadline:
+                    self._stats['rejected'] += 1
+                    return False
+                waited = True
+                self._cond.wait(shortfall)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return dict(self._stats, tokens_per_minute=self.tokens_per_minute)
+
+class ResilientCaller:
+    """LLM呼び出しの耐障害レイヤー
+
+    分類した上での再試行（ジッター付き指数バックオフ、Retry-After優先）、サーキットブレーカー、
+    直近のp95を超えたら2本目を投げるヘッジ、1分あたりのトークン数による送信制限をまとめて行う。
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_retries = int(os.getenv('LLM_MAX_RETRIES', '2'))
+        self.backoff_base = float(os.getenv('LLM_BACKOFF_BASE', '0.25'))
+        self.backoff_cap = float(os.getenv('LLM_BACKOFF_CAP', '4'))
+        self.hedge_enabled = os.getenv('LLM_HEDGE', 'true') == 'true'
+        self.hedge_min_samples = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20'))
+        self.hedge_quantile = float(os.getenv('LLM_HEDGE_QUANTILE', '0.95'))
+        self.limiter_timeout = float(os.getenv('LLM_TPM_WAIT', '5'))
+
+        self.breaker = CircuitBreaker()
+        self.limiter = TokenRateLimiter(int(os.getenv('LLM_TOKENS_PER_MINUTE', '0')))
+
+        # 同時に投げるヘッジはワーカー数の半分まで（枠は元の呼び出しとヘッジの両方が終わるまで持つ）
+        self.hedge_slots = hedge_slots(max_concurrency) if self.hedge_enabled else 0
+        self._hedge_slots = threading.BoundedSemaphore(max(1, self.hedge_slots))
+        self._hedge_executor = ThreadPoolExecutor(
+            max_workers=max_concurrency + self.hedge_slots,
+            thread_name_prefix='llm-hedge'
+        )
+        self._latencies: deque = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self._stats = {
+            'calls': 0,
+            'retries': 0,
+            'failures': 0,
+            'hedged': 0,
+            'hedge_wins': 0
+        }
+
+    def call(self, fn: Callable[[], Any], tokens: int = 0, hedge: bool = True) -> Any:
+        """fnを耐障害付きで実行する（失敗時は最後の例外を送出）"""
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM circuit breaker is open")
+        if not self.limiter.acquire(tokens, self.limiter_timeout):
+            self.breaker.release_probe()
+            raise RateLimitedLocally(f"Token budget exhausted ({tokens} tokens)")
+
+        with self._lock:
+            self._stats['calls'] += 1
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                if hedge and self.hedge_enabled:
+                    result = self._hedged(fn)
+                else:
+                    result = fn()
+            except Exception as e:
+                retryable = is_retryable(e)
+                if attempt >= self.max_retries or not retryable:
+                    with self._lock:
+                        self._stats['failures'] += 1
+                    # リクエスト自体の誤り（400など）は障害として数えない
+                    if retryable:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.release_probe()
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    # フルジッター：再試行が一斉に押し寄せないよう待ち時間をばらす
+                    delay = random.uniform(0, self.backoff_base * (2 ** attempt))
+                delay = min(delay, self.backoff_cap)
+                attempt += 1
+                with self._lock:
+                    self._stats['retries'] += 1
+                logger.warning("LLM call failed (%s), retry %s in %.2fs", type(e).__name__, attempt, delay)
+                time.sleep(delay)
+                continue
+
+            with self._lock:
+                self._latencies.append(time.perf_counter() - started)
+            self.breaker.record_success()
+            return result
+
+    def hedge_delay(self) -> Optional[float]:
+        """ヘッジを投げるまでの待ち時間（直近のレイテンシのp95、サンプル不足ならNone）"""
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_quantile))]
+
+    def _hedged(self, fn: Callable[[], Any]) -> Any:
+        delay = self.hedge_delay()
+        if delay is None:
+            return fn()
+
+        primary = self._hedge_executor.submit(fn)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._hedge_slots.acquire(blocking=False):
+            return primary.result()
+
+        with self._lock:
+            self._stats['hedged'] += 1
+        backup = self._hedge_executor.submit(fn)
+        # 負けた方もコネクションを使い続けるので、両方終わってから枠を返す
+        running = [2]
+
+        def _release(_):
+            with self._lock:
+                running[0] -= 1
+                finished = running[0] == 0
+            if finished:
+                self._hedge_slots.release()
+
+        primary.add_done_callback(_release)
+        backup.add_done_callback(_release)
+
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        with self._lock:
+                            self._stats['hedge_wins'] += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def shutdown(self):
+        self._hedge_executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        """監視用の統計情報"""
+        delay = self.hedge_delay()
+        with self._lock:
+            stats = dict(self._stats)
+        stats['hedge_after_ms'] = round(delay * 1000, 1) if delay is not None else None
+        stats['breaker'] = self.breaker.stats()
+        stats['rate_limiter'] = self.limiter.stats()
+        return stats
@@ -1,26 +1,100 @@
 import os
+import json
 import logging
 import random
-from typing import Dict, List, Optional
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import Future
+from typing import Callable, Dict, List, NamedTuple, Optional
+import httpx
 from openai import OpenAI
 from dotenv import load_dotenv
+from services.response_cache import ResponseCache
+from services.token_counter import TokenCounter
+from services.conversation_memory import ConversationMemory
+from services.scheduler import Scheduler, PRIORITY_BACKGROUND, PRIORITY_NORMAL
+from services.llm_resilience import CircuitOpenError, ResilientCaller
+from services.metrics import registry
+from services.tracing import tracer
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+LLM_LATENCY = registry.histogram(
+    'aiunitalk_llm_request_seconds', 'LLM呼び出しのレイテンシ（再試行込み、秒）', ['kind']
+)
+LLM_TOKENS = registry.counter('aiunitalk_llm_tokens', 'LLMに送った・受け取ったトークン数', ['type'])
+OFFLINE_FALLBACKS = registry.counter(
+    'aiunitalk_offline_fallbacks', 'オフライン応答に切り替えた回数', ['kind', 'reason']
+)
+TRUNCATIONS = registry.counter('aiunitalk_truncated_utterances', '40文字で切り詰めた発言の数')
+
+class Reply(NamedTuple):
+    """生成した発言と出どころ（llm / cache / offline / partial）"""
+    text: str
+    source: str
+
+class _StreamInterrupted(Exception):
+    """文字を渡し始めた後にストリームが途切れた（textは渡し済みの文字列）"""
+
+    def __init__(self, text: str):
+        super().__init__(text)
+        self.text = text
+
 class LLMService:
     def __init__(self):
         self.online_mode = os.getenv('ONLINE', 'true') == 'true'
         self.client = None
+        self.http_client = None
+        self.model = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+        self.max_concurrency = max(1, int(os.getenv('LLM_MAX_CONCURRENCY', '8')))
+        self.response_cache = ResponseCache()
+        self.token_counter = TokenCounter(self.model)
+        self.memory = ConversationMemory(self.token_counter)
+        
+        # 設定読み込み時に作っておくシステムプロンプト（毎ターン同一のバイト列にする）
+        self._system_prompts: Dict[str, str] = {}
+        self._script_prompts: Dict[tuple, str] = {}
+        self._usage_lock = threading.Lock()
+        self._usage = {
+            'calls': 0,
+            'local_prompt_tokens': 0,
+            'api_prompt_tokens': 0,
+            'api_cached_tokens': 0,
+            'completion_tokens': 0
+        }
+        # DialogServiceが設定読み込み後に差し込む（未設定なら従来のテンプレート）
+        self.offline_engine = None
+        
+        # 同時に飛ばすLLMリクエスト数の上限（同期呼び出しも含めて共有）
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        # 生成はすべて優先度付きのスケジューラ経由で実行する
+        self.scheduler = Scheduler(self.max_concurrency, name='llm')
+        # 再試行・ブレーカー・ヘッジ・トークン数制限（再試行はOpenAIクライアントではなくこちらで行う）
+        self.resilience = ResilientCaller(self.max_concurrency)
+        
+        # ストリーミング時の最初の1文字までの時間と全体時間（秒）の累計
+        self._stream_lock = threading.Lock()
+        self._stream_stats = {'count': 0, 'first_char_sum': 0.0, 'total_sum': 0.0}
         
         if self.online_mode:
             api_key = os.getenv('OPENAI_API_KEY')
             if api_key and api_key != 'your-api-key-here':
                 try:
-                    self.client = OpenAI(api_key=api_key)
-                    logger.info("OpenAI client initialized successfully")
+                    self.http_client = self._create_http_client()
+                    self.client = OpenAI(
+                        api_key=api_key,
+                        base_url=os.getenv('OPENAI_BASE_URL') or None,
+                        http_client=self.http_client,
+                        max_retries=0
+                    )
+                    logger.info("OpenAI client initialized successfully (base_url=%s)", self.client.base_url)
+                    self._warm_up()
                 except Exception as e:
-                    logger.error(f"Failed to initialize OpenAI client: {e}")
+                    logger.error("Failed to initialize OpenAI client: %s", e)
                     self.online_mode = False
             else:
                 logger.warning("No valid API key found, switching to offline mode")
@@ -28,45 +102,452 @@ class LLMService:
         else:
             logger.info("Running in offline mode")
     
+    def _create_http_client(self) -> httpx.Client:
+        """全リクエストで共有するコネクションプール付きHTTPクライアントを作成
+        
+        ヘッジは遅い元の呼び出しを追い越すためのものなので、その分の接続も確保しておく
+        """
+        timeout = float(os.getenv('LLM_TIMEOUT', '10'))
+        connections = self.max_concurrency + self.resilience.hedge_slots
+        return httpx.Client(
+            limits=httpx.Limits(
+                max_connections=connections,
+                max_keepalive_connections=connections,
+                keepalive_expiry=float(os.getenv('LLM_KEEPALIVE', '60'))
+            ),
+            timeout=httpx.Timeout(timeout, connect=5.0)
+        )
+    
+    def _warm_up(self):
+        """起動時にTLS接続を張っておき、最初のターンの接続コストを隠す"""
+        count = min(self.max_concurrency, int(os.getenv('LLM_WARM_CONNECTIONS', '2')))
+        url = f"{self.client.base_url}models"
+        headers = {"Authorization": f"Bearer {self.client.api_key}"}
+        
+        def _touch():
+            try:
+                self.http_client.get(url, headers=headers)
+            except Exception as e:
+                logger.debug("Connection warm-up failed: %s", e)
+        
+        for _ in range(count):
+            self.scheduler.submit(_touch, priority=PRIORITY_BACKGROUND)
+    
+    @contextmanager
+    def _slot(self):
+        """同時実行枠を1つ確保し、実行中のリクエスト数を数える"""
+        with self._slots:
+            with self._in_flight_lock:
+                self._in_flight += 1
+            try:
+                yield
+            finally:
+                with self._in_flight_lock:
+                    self._in_flight -= 1
+    
+    @property
+    def in_flight(self) -> int:
+        """現在LLMに問い合わせ中のリクエスト数"""
+        return self._in_flight
+    
+    def generate_response_async(
+        self,
+        agent_data: Dict,
+        context: str,
+        history: List[Dict],
+        location: str = "夏祭り会場",
+        on_delta: Optional[Callable[[str], None]] = None,
+        cache_key: Optional[tuple] = None,
+        session_id: Optional[str] = None,
+        priority: int = PRIORITY_NORMAL
+    ) -> Future:
+        """応答生成をスケジューラに投入し、Futureを返す
+        
+        cache_keyがキャッシュに当たればワーカーを使わず完了済みのFutureを返す
+        キューが混んでいて受け付けられなかった場合はオフライン応答で完了する
+        （先読みなどバックグラウンドの仕事は代わりの発言を作らず QueueFull で完了する）
+        """
+        if self.online_mode and cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                tracer.annotate(response_cache='hit')
+                future = Future()
+                future.set_result(Reply(self._deliver_whole(cached, on_delta), 'cache'))
+                return future
+        
+        shed = None
+        if priority < PRIORITY_BACKGROUND:
+            shed = lambda: self._offline_fallback(agent_data, location, session_id, on_delta, 'shed', not history)
+        return self.scheduler.submit(
+            self.generate_response,
+            agent_data,
+            context,
+            list(history),
+            location,
+            on_delta,
+            cache_key,
+            session_id,
+            priority=priority,
+            fair_key=session_id,
+            shed=shed
+        )
+    
     def generate_response(
         self,
         agent_data: Dict,
         context: str,
         history: List[Dict],
-        location: str = "夏祭り会場"
-    ) -> str:
-        """AIキャラクターの応答を生成"""
+        location: str = "夏祭り会場",
+        on_delta: Optional[Callable[[str], None]] = None,
+        cache_key: Optional[tuple] = None,
+        session_id: Optional[str] = None
+    ) -> Reply:
+        """AIキャラクターの応答を生成
+        
+        on_deltaを渡すとストリーミングで生成し、届いた部分文字列を順に渡す
+        cache_keyを渡すとLLMで生成できた応答をキャッシュ候補に加える
+        """
         
         if not self.online_mode:
-            return self._generate_offline_response(agent_data, location)
+            return self._offline_fallback(agent_data, location, session_id, on_delta, 'offline_mode', not history)
         
         try:
-            system_prompt = self._create_system_prompt(agent_data, location)
-            messages = self._prepare_messages(system_prompt, context, history)
+            with tracer.span('prompt_assembly'):
+                system_prompt = self._system_prompt(agent_data)
+                messages = self._prepare_messages(
+                    system_prompt, context, history, location,
+                    speaker_id=agent_data.get('id'), session_id=session_id
+                )
             
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                max_tokens=100,
-                temperature=0.8,
-                presence_penalty=0.6,
-                frequency_penalty=0.3
-            )
+            if on_delta is not None:
+                with tracer.span('llm_stream'):
+                    text = self._stream_completion(messages, on_delta)
+                prompt_tokens = self._record_usage(messages)
+            else:
+                with self._slot(), tracer.span('llm_call'):
+                    started = time.perf_counter()
+                    response = self.resilience.call(
+                        lambda: self.client.chat.completions.create(
+                            model=self.model,
+                            messages=messages,
+                            max_tokens=100,
+                            temperature=0.8,
+                            presence_penalty=0.6,
+                            frequency_penalty=0.3
+                        ),
+                        tokens=self.token_counter.count_messages(messages) + 100
+                    )
+                    LLM_LATENCY.observe(time.perf_counter() - started, 'turn')
+                text = self._truncate(response.choices[0].message.content.strip())
+                prompt_tokens = self._record_usage(messages, response)
             
-            text = response.choices[0].message.content.strip()
+            if cache_key is not None:
+                self.response_cache.put(cache_key, text)
+            
+            # 発言内容はDialogServiceでも記録するので、こちらはトークン数の確認用にDEBUGで出す
+            logger.debug("Generated response for %s: %s (prompt_tokens=%s)", agent_data['name'], text, prompt_tokens)
+            return Reply(text, 'llm')
+            
+        except _StreamInterrupted as e:
+            # 表示済みの文字列にオフライン応答を継ぎ足さず、届いた所までで終える
+            logger.error("Stream interrupted after %d chars: %s", len(e.text), e.__cause__)
+            return Reply(e.text, 'partial')
+        except CircuitOpenError:
+            return self._offline_fallback(agent_data, location, session_id, on_delta, 'circuit_open', not history)
+        except Exception as e:
+            logger.error("Failed to generate response: %s", e)
+            return self._offline_fallback(agent_data, location, session_id, on_delta, 'error', not history)
+    
+    def _stream_completion(self, messages: List[Dict], on_delta: Callable[[str], None]) -> str:
+        """ストリーミングで生成し、40文字までを逐次on_deltaに渡す
+        
+        文字を渡した後に失敗した場合は、渡し済みの文字列を持つ _StreamInterrupted を送出する
+        """
+        started = time.perf_counter()
+        first_char = None
+        text = ""
+        sent = 0
+        
+        with self._slot():
+            # 再試行は最初の応答が届くまで（文字を渡し始めた後はやり直さない）
+            stream = self.resilience.call(
+                lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=100,
+                    temperature=0.8,
+                    presence_penalty=0.6,
+                    frequency_penalty=0.3,
+                    stream=True
+                ),
+                tokens=self.token_counter.count_messages(messages) + 100,
+                hedge=False
+            )
+            try:
+                for chunk in stream:
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    text = (text + chunk.choices[0].delta.content).lstrip()
+                    visible = text[:40]
+                    if len(visible) > sent:
+                        if first_char is None:
+                            first_char = time.perf_counter() - started
+                        on_delta(visible[sent:])
+                        sent = len(visible)
+                    if len(text) > 40:
+                        break
+            except Exception as e:
+                if sent:
+                    raise _StreamInterrupted(text[:sent].strip()) from e
+                raise
+            finally:
+                stream.close()
+        
+        self._record_stream(first_char, time.perf_counter() - started)
+        LLM_LATENCY.observe(time.perf_counter() - started, 'stream')
+        return self._truncate(text.strip())
+    
+    def _offline_fallback(
+        self,
+        agent_data: Dict,
+        location: str,
+        session_id: Optional[str],
+        on_delta: Optional[Callable[[str], None]],
+        reason: str,
+        opening: bool = False
+    ) -> Reply:
+        """オフライン応答に切り替える（理由ごとに数える）"""
+        OFFLINE_FALLBACKS.inc('turn', reason)
+        return Reply(self._deliver_whole(
+            self._generate_offline_response(agent_data, location, session_id, opening), on_delta
+        ), 'offline')
+    
+    def _deliver_whole(self, text: str, on_delta: Optional[Callable[[str], None]]) -> str:
+        """ストリーミング要求に対して完成済みの文を1回で渡す"""
+        if on_delta is not None:
+            on_delta(text)
+        return text
+    
+    def _record_stream(self, first_char: Optional[float], total: float):
+        with self._stream_lock:
+            self._stream_stats['count'] += 1
+            self._stream_stats['first_char_sum'] += first_char if first_char is not None else total
+            self._stream_stats['total_sum'] += total
+    
+    def stream_stats(self) -> Dict:
+        """ストリーミング生成の平均レイテンシ（ミリ秒）"""
+        with self._stream_lock:
+            count = self._stream_stats['count']
+            return {
+                'count': count,
+                'avg_first_char_ms': round(self._stream_stats['first_char_sum'] / count * 1000, 1) if count else None,
+                'avg_total_ms': round(self._stream_stats['total_sum'] / count * 1000, 1) if count else None
+            }
+    
+    def generate_conversation_async(
+        self,
+        agents: List[Dict],
+        context: str,
+        location: str,
+        turns: int,
+        fallback: bool = True,
+        priority: int = PRIORITY_NORMAL,
+        fair_key: Optional[str] = None
+    ) -> Future:
+        """会話全体の台本生成をスケジューラに投入し、Futureを返す"""
+        shed = None
+        if fallback:
+            shed = lambda: self._generate_offline_conversation(agents, location, turns, 'shed')
+        return self.scheduler.submit(
+            self.generate_conversation, agents, context, location, turns, fallback,
+            priority=priority,
+            fair_key=fair_key,
+            shed=shed
+        )
+    
+    def generate_conversation(
+        self,
+        agents: List[Dict],
+        context: str,
+        location: str,
+        turns: int,
+        fallback: bool = True
+    ) -> List[Dict]:
+        """1回のLLM呼び出しで会話全体の台本を生成
+        
+        戻り値は [{"speaker": agent_id, "text": 発言, "source": "llm" / "offline"}, ...] の形式
+        fallback=Falseの場合、失敗時はテンプレートに切り替えず例外を送出する
+        """
+        if not self.online_mode:
+            return self._generate_offline_conversation(agents, location, turns, 'offline_mode')
+        
+        try:
+            messages = [
+                {"role": "system", "content": self._script_prompt(agents)},
+                {"role": "user", "content": (
+                    f"現在地：{location}\n{turns}行の会話を書いてください。\n"
+                    f"{context or f'{location}で偶然出会いました。'}"
+                )}
+            ]
             
-            if len(text) > 40:
-                text = text[:40] + "..."
+            # 台本は1ターン分とレイテンシの分布が違うのでヘッジしない
+            with self._slot(), tracer.span('llm_script', turns=turns):
+                started = time.perf_counter()
+                response = self.resilience.call(
+                    lambda: self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        max_tokens=60 * turns + 50,
+                        temperature=0.8,
+                        presence_penalty=0.6,
+                        frequency_penalty=0.3,
+                        response_format={"type": "json_object"}
+                    ),
+                    tokens=self.token_counter.count_messages(messages) + 60 * turns + 50,
+                    hedge=False
+                )
+                LLM_LATENCY.observe(time.perf_counter() - started, 'script')
             
-            logger.info(f"Generated response for {agent_data['name']}: {text}")
-            return text
+            prompt_tokens = self._record_usage(messages, response)
+            lines = self._parse_script(response.choices[0].message.content, agents, turns)
+            logger.info("Generated %s-turn script at %s (prompt_tokens=%s)", len(lines), location, prompt_tokens)
+            return lines
             
         except Exception as e:
-            logger.error(f"Failed to generate response: {e}")
-            return self._generate_offline_response(agent_data, location)
+            logger.error("Failed to generate conversation: %s", e)
+            if not fallback:
+                raise
+            reason = 'circuit_open' if isinstance(e, CircuitOpenError) else 'error'
+            return self._generate_offline_conversation(agents, location, turns, reason)
+    
+    def compile_prompts(self, agents: Dict):
+        """全エージェントのシステムプロンプトを作り直す（設定読み込み時に呼ぶ）"""
+        self._system_prompts = {
+            agent_id: self._create_system_prompt(agent)
+            for agent_id, agent in agents.items()
+        }
+        self._script_prompts = {}
+    
+    def _system_prompt(self, agent_data: Dict) -> str:
+        prompt = self._system_prompts.get(agent_data.get('id'))
+        if prompt is None:
+            prompt = self._create_system_prompt(agent_data)
+        return prompt
+    
+    def _script_prompt(self, agents: List[Dict]) -> str:
+        key = tuple(a['id'] for a in agents)
+        prompt = self._script_prompts.get(key)
+        if prompt is None:
+            prompt = self._create_script_prompt(agents)
+            self._script_prompts[key] = prompt
+        return prompt
+    
+    def _record_usage(self, messages: List[Dict], response=None) -> int:
+        """入力トークン数を記録し、APIの値（無ければローカルの値）を返す"""
+        local = self.token_counter.count_messages(messages)
+        usage = getattr(response, 'usage', None)
+        api_prompt = getattr(usage, 'prompt_tokens', 0) or 0
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached = getattr(details, 'cached_tokens', 0) or 0
+        completion = getattr(usage, 'completion_tokens', 0) or 0
+        
+        LLM_TOKENS.inc('prompt', amount=api_prompt or local)
+        LLM_TOKENS.inc('completion', amount=completion)
+        LLM_TOKENS.inc('cached', amount=cached)
+        
+        with self._usage_lock:
+            self._usage['calls'] += 1
+            self._usage['local_prompt_tokens'] += local
+            self._usage['api_prompt_tokens'] += api_prompt
+            self._usage['api_cached_tokens'] += cached
+            self._usage['completion_tokens'] += completion
+        
+        return api_prompt or local
+    
+    def usage_stats(self) -> Dict:
+        """トークン使用量の累計"""
+        with self._usage_lock:
+            stats = dict(self._usage)
+        stats['tokenizer'] = 'tiktoken' if self.token_counter.exact else 'estimate'
+        stats['avg_local_prompt_tokens'] = (
+            round(stats['local_prompt_tokens'] / stats['calls'], 1) if stats['calls'] else None
+        )
+        return stats
+    
+    def _create_script_prompt(self, agents: List[Dict]) -> str:
+        """会話台本用のシステムプロンプトを作成"""
+        profiles = "\n".join(
+            f"- {a['id']}（{a['name']}）: 性格：{a.get('personality', '明るく元気')} / "
+            f"口調：{a.get('speaking_style', 'です・ます調')} / "
+            f"好きな話題：{', '.join(a.get('topics', ['夏祭り']))}"
+            for a in agents
+        )
+        
+        return f"""夏祭りで出会ったキャラクター同士の会話を書いてください。
+
+登場キャラクター：
+{profiles}
+
+ルール：
+1. 1行は15〜40文字の短い発言にする
+2. 話者は交互に入れ替える
+3. 夏祭りの雰囲気とキャラクターの個性を表現する
+4. 次のJSON形式だけで出力する
+{{"lines": [{{"speaker": "キャラクターID", "text": "発言"}}]}}"""
+    
+    def _parse_script(self, content: str, agents: List[Dict], turns: int) -> List[Dict]:
+        """LLMが返したJSON台本を検証して発言リストに変換"""
+        data = json.loads(content)
+        raw_lines = data.get('lines', []) if isinstance(data, dict) else data
+        
+        agent_ids = [a['id'] for a in agents]
+        lines = []
+        for i, line in enumerate(raw_lines[:turns]):
+            if not isinstance(line, dict):
+                continue
+            text = str(line.get('text', '')).strip()
+            if not text:
+                continue
+            speaker = line.get('speaker')
+            if speaker not in agent_ids:
+                speaker = agent_ids[i % len(agent_ids)]
+            lines.append({"speaker": speaker, "text": self._truncate(text), "source": "llm"})
+        
+        if not lines:
+            raise ValueError("Script contained no lines")
+        return lines
+    
+    def _generate_offline_conversation(
+        self,
+        agents: List[Dict],
+        location: str,
+        turns: int,
+        reason: str = 'offline_mode'
+    ) -> List[Dict]:
+        """オフラインモード用の会話台本"""
+        OFFLINE_FALLBACKS.inc('script', reason)
+        return [
+            {
+                "speaker": agents[i % len(agents)]['id'],
+                "text": self._generate_offline_response(agents[i % len(agents)], location, opening=i == 0),
+                "source": "offline"
+            }
+            for i in range(turns)
+        ]
     
-    def _create_system_prompt(self, agent_data: Dict, location: str) -> str:
-        """システムプロンプトを作成"""
+    def _truncate(self, text: str) -> str:
+        """吹き出しに収まるよう発言を切り詰める"""
+        if len(text) > 40:
+            text = text[:40] + "..."
+            TRUNCATIONS.inc()
+        return text
+    
+    def _create_system_prompt(self, agent_data: Dict) -> str:
+        """システムプロンプトを作成
+        
+        プロバイダ側のプレフィックスキャッシュが効くよう、ここにはエージェントごとに
+        不変の内容だけを置く（場所・時間・履歴はメッセージの末尾に回す）
+        """
         topics = ', '.join(agent_data.get('topics', ['夏祭り']))
         
         return f"""あなたは「{agent_data['name']}」というキャラクターです。
@@ -74,7 +555,6 @@ class LLMService:
 性格：{agent_data.get('personality', '明るく元気')}
 口調：{agent_data.get('speaking_style', 'です・ます調')}
 好きな話題：{topics}
-現在地：{location}
 
 ルール：
 1. 15〜40文字の短い返答をする
@@ -87,24 +567,31 @@ class LLMService:
         self,
         system_prompt: str,
         context: str,
-        history: List[Dict]
+        history: List[Dict],
+        location: str = "夏祭り会場",
+        speaker_id: Optional[str] = None,
+        session_id: Optional[str] = None
     ) -> List[Dict]:
         """ChatGPT用のメッセージリストを準備"""
         messages = [{"role": "system", "content": system_prompt}]
-        
-        for h in history[-6:]:
-            messages.append({
-                "role": "assistant" if h.get('is_self') else "user",
-                "content": h.get('text', '')
-            })
-        
-        if context:
-            messages.append({"role": "user", "content": context})
+        messages.extend(self.memory.history_messages(speaker_id, history, session_id))
+        messages.append({"role": "user", "content": f"現在地：{location}\n{context}".rstrip()})
         
         return messages
     
-    def _generate_offline_response(self, agent_data: Dict, location: str) -> str:
-        """オフラインモード用のテンプレート応答"""
+    def _generate_offline_response(
+        self,
+        agent_data: Dict,
+        location: str,
+        session_id: Optional[str] = None,
+        opening: bool = False
+    ) -> str:
+        """オフラインモード用のテンプレート応答（openingは会話の最初の発言か）"""
+        if self.offline_engine is not None:
+            text = self.offline_engine.generate(agent_data.get('id'), location, session_id, opening)
+            if text:
+                return text
+        
         templates = [
             f"わぁ、{location}は賑やかですね！",
             "屋台がたくさんあって楽しいです！",
@@ -123,4 +610,11 @@ class LLMService:
         if agent_data.get('speaking_style') == 'タメ口':
             response = response.replace('ですね', 'だね').replace('ます', 'るよ')
         
-        return response
\ No newline at end of file
+        return response
+    
+    def shutdown(self):
+        """ワーカープールとHTTPクライアントを解放"""
+        self.scheduler.shutdown()
+        self.resilience.shutdown()
+        if self.http_client is not None:
+            self.http_client.close()
\ No newline at end of file
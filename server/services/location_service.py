@@ -1,26 +1,55 @@
-import json
+import os
 import logging
-from typing import Dict, List, Optional
+import threading
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
+from services.config_store import ConfigStore
 
 logger = logging.getLogger(__name__)
 
 class LocationService:
-    def __init__(self):
+    def __init__(self, config_store: Optional[ConfigStore] = None):
+        self.config_store = config_store or ConfigStore()
+        self.max_resolve_cache = int(os.getenv('LOCATION_RESOLVE_CACHE', '1024'))
+        self._lock = threading.Lock()
         self.locations = self._load_locations()
+        self._build_indexes()
+        self.config_store.subscribe(self._on_config_changed)
+    
+    def _on_config_changed(self, snapshot, changed: List[str]):
+        """設定の差し替え通知を受けて索引を作り直す"""
+        if 'locations' in changed:
+            self.locations = self._load_locations()
+            self._build_indexes()
+            logger.info("Loaded %s locations", len(self.locations))
+    
+    def _build_indexes(self):
+        """表示名の索引・小文字化したキーワードの一覧を作り、メモを空にする"""
+        by_display_name = {}
+        # (小文字化したキーワード, 場所) を優先順に並べる（設定ファイルで先に書かれた場所が優先）
+        keywords: List[Tuple[str, Dict]] = []
+        seen = set()
+        for location in self.locations.values():
+            by_display_name.setdefault(location.get('display_name'), location)
+            for keyword in location.get('waypoint_keywords', []):
+                lowered = keyword.lower() if keyword else ''
+                if lowered and lowered not in seen:
+                    seen.add(lowered)
+                    keywords.append((lowered, location))
+        
+        with self._lock:
+            self._by_display_name = by_display_name
+            self._keywords = keywords
+            self._resolve_cache: Dict[str, Optional[Dict]] = {}
+            self._context_cache: Dict[str, str] = {}
         
     def _load_locations(self) -> Dict:
         """場所設定を読み込み"""
-        try:
-            with open('config/locations.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return {loc['id']: loc for loc in data['locations']}
-        except FileNotFoundError:
-            logger.warning("locations.json not found, using default locations")
-            return self._get_default_locations()
-        except Exception as e:
-            logger.error(f"Failed to load locations: {e}")
+        data = self.config_store.get('locations')
+        if data is None:
+            logger.warning("locations.json not available, using default locations")
             return self._get_default_locations()
+        return {loc['id']: loc for loc in data['locations']}
     
     def _get_default_locations(self) -> Dict:
         """デフォルトの場所設定"""
@@ -36,35 +65,73 @@ class LocationService:
     
     def get_location_by_waypoint_name(self, waypoint_name: str) -> Optional[Dict]:
         """ウェイポイント名から場所情報を取得"""
-        waypoint_name = waypoint_name.lower()
+        lowered = waypoint_name.lower()
         
-        for location_id, location in self.locations.items():
-            keywords = location.get('waypoint_keywords', [])
-            for keyword in keywords:
-                if keyword.lower() in waypoint_name:
-                    return location
+        # 含まれるキーワードのうち優先順で最初のもの（結果は resolve_location でメモ化される）
+        for keyword, location in self._keywords:
+            if keyword in lowered:
+                return location
         
         # デフォルト
         return self.locations.get('central_plaza')
     
     def get_location_by_display_name(self, display_name: str) -> Optional[Dict]:
         """表示名から場所情報を取得"""
-        for location_id, location in self.locations.items():
-            if location.get('display_name') == display_name:
-                return location
-        return None
+        return self._by_display_name.get(display_name)
+    
+    def get_location_by_id(self, location_id: str) -> Optional[Dict]:
+        """場所IDから場所情報を取得"""
+        return self.locations.get(location_id)
+    
+    def resolve_location(self, location_name: str) -> Optional[Dict]:
+        """場所名（ID・表示名・ウェイポイント名）から場所情報を取得（結果はメモ化）"""
+        try:
+            return self._resolve_cache[location_name]
+        except KeyError:
+            pass
+        
+        location = (
+            self.locations.get(location_name)
+            or self._by_display_name.get(location_name)
+            or self.get_location_by_waypoint_name(location_name or '')
+        )
+        
+        with self._lock:
+            if len(self._resolve_cache) >= self.max_resolve_cache:
+                self._resolve_cache.clear()
+            self._resolve_cache[location_name] = location
+        return location
+    
+    def resolve_many(self, names: List[str]) -> List[Dict]:
+        """複数の場所名をまとめて解決"""
+        results = []
+        for name in names:
+            location = self.resolve_location(name)
+            results.append({
+                'name': name,
+                'location_id': location['id'] if location else None,
+                'display_name': location.get('display_name') if location else None
+            })
+        return results
+    
+    def resolve_location_id(self, location_name: str) -> str:
+        """場所名（表示名・ウェイポイント名）を場所IDに正規化"""
+        location = self.resolve_location(location_name)
+        return location['id'] if location else location_name
     
     def build_location_context(self, location_name: str) -> str:
         """場所に応じた詳細なコンテキストを生成"""
         
         # 場所情報を取得
-        location = self.get_location_by_display_name(location_name)
-        if not location:
-            location = self.get_location_by_waypoint_name(location_name)
+        location = self.resolve_location(location_name)
         
         if not location:
             return f"場所は{location_name}です。"
         
+        cached = self._context_cache.get(location['id'])
+        if cached is not None:
+            return cached
+        
         context_parts = []
         
         # 基本の場所説明
@@ -80,7 +147,10 @@ class LocationService:
         if smells:
             context_parts.append(f"{' 、'.join(smells)}。")
         
-        return " ".join(context_parts)
+        context = " ".join(context_parts)
+        with self._lock:
+            self._context_cache[location['id']] = context
+        return context
     
     def get_time_of_day(self) -> str:
         """現在の時間帯を取得"""
@@ -107,8 +177,7 @@ class LocationService:
     def reload_locations(self):
         """場所設定を再読み込み（設定変更後用）"""
         logger.info("Reloading location configuration...")
-        self.locations = self._load_locations()
-        logger.info(f"Loaded {len(self.locations)} locations")
+        self.config_store.reload(['locations'])
     
     def validate_location_config(self) -> List[str]:
         """設定ファイルの妥当性をチェック"""
@@ -0,0 +1,112 @@
+import os
+import queue
+import random
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import Dict, Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 発言ごとに出る大量のログに付ける印（logger.info(..., extra=SAMPLED)）
+SAMPLED = {'sampled': True}
+
+class NonBlockingQueueHandler(QueueHandler):
+    """ログをキューに積むだけのハンドラ
+
+    書式化（%による埋め込み・例外の整形）は書き込みスレッドで行い、
+    キューが溢れたら待たずに捨てる。
+    """
+
+    def __init__(self, log_queue: queue.Queue, sample_rate: float):
+        super().__init__(log_queue)
+        self.sample_rate = sample_rate
+        self.dropped = 0
+        self.sampled_out = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record: logging.LogRecord):
+        if getattr(record, 'sampled', False) and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return
+        super().emit(record)
+
+class LogPipeline:
+    """キュー経由の非同期ログ（ファイルはサイズか時刻でローテーション）"""
+
+    def __init__(self):
+        self.level = getattr(logging, os.getenv('LOG_LEVEL', 'INFO'))
+        self.path = os.getenv('LOG_FILE', 'logs/app.log')
+        self.max_bytes = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+        self.backups = int(os.getenv('LOG_BACKUPS', '5'))
+        # 'midnight' や 'H' を指定すると時刻でローテーション（未指定ならサイズ）
+        self.rotate_when = os.getenv('LOG_ROTATE_WHEN', '')
+        self.sample_rate = float(os.getenv('LOG_UTTERANCE_SAMPLE_RATE', '0.1'))
+        self.console = os.getenv('LOG_CONSOLE', 'true') == 'true'
+
+        self._queue: queue.Queue = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+        self.handler = NonBlockingQueueHandler(self._queue, self.sample_rate)
+        self._listener: Optional[QueueListener] = None
+
+    def _file_handler(self) -> logging.Handler:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.rotate_when:
+            return TimedRotatingFileHandler(
+                self.path, when=self.rotate_when, backupCount=self.backups, encoding='utf-8'
+            )
+        return RotatingFileHandler(
+            self.path, maxBytes=self.max_bytes, backupCount=self.backups, encoding='utf-8'
+        )
+
+    def start(self):
+        """ルートロガーをキューにつなぎ、書き込みスレッドを開始する"""
+        formatter = logging.Formatter(LOG_FORMAT)
+        outputs = [self._file_handler()]
+        if self.console:
+            outputs.append(logging.StreamHandler())
+        for output in outputs:
+            output.setFormatter(formatter)
+
+        root = logging.getLogger()
+        root.setLevel(self.level)
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(self.handler)
+
+        self._listener = QueueListener(self._queue, *outputs, respect_handler_level=True)
+        self._listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """キューに残ったログを書き出して止める"""
+        if self._listener is not None:
+            try:
+                self._listener.stop()
+            except queue.Full:
+                pass
+            self._listener = None
+
+    def stats(self) -> Dict:
+        """監視用の統計情報"""
+        return {
+            'queued': self._queue.qsize(),
+            'dropped': self.handler.dropped,
+            'sampled_out': self.handler.sampled_out,
+            'utterance_sample_rate': self.sample_rate,
+            'rotation': self.rotate_when or f'{self.max_bytes} bytes'
+        }
+
+def configure_logging() -> LogPipeline:
+    pipeline = LogPipeline()
+    pipeline.start()
+    return pipeline
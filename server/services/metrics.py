@@ -0,0 +1,219 @@
+import math
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# 応答時間用の既定のバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 書き込み領域の数（OSのスレッドIDで振り分ける）
+SHARD_COUNT = 16
+
+class _Sharded:
+    """スレッドIDで振り分けた固定数の書き込み領域
+
+    領域ごとにロックを持つので、別の領域に当たったスレッド同士は競合しない。
+    領域の数は固定で、リクエストごとにスレッドが作られても増えない。
+    """
+
+    def __init__(self):
+        self._shards: List[Tuple[threading.Lock, dict]] = [
+            (threading.Lock(), {}) for _ in range(SHARD_COUNT)
+        ]
+
+    def _shard(self) -> Tuple[threading.Lock, dict]:
+        return self._shards[threading.get_native_id() % SHARD_COUNT]
+
+    def _merge(self, into: dict, shard: dict):
+        raise NotImplementedError
+
+    def _collect(self) -> dict:
+        total: dict = {}
+        for lock, shard in self._shards:
+            with lock:
+                self._merge(total, shard)
+        return total
+
+class Counter(_Sharded):
+    """単調増加するカウンター"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, *labels: str, amount: float = 1):
+        lock, shard = self._shard()
+        with lock:
+            shard[labels] = shard.get(labels, 0) + amount
+
+    def _merge(self, into: dict, shard: dict):
+        for labels, value in shard.items():
+            into[labels] = into.get(labels, 0) + value
+
+    def samples(self) -> List[Tuple[str, Tuple, float]]:
+        return [(self.name + '_total', labels, value) for labels, value in sorted(self._collect().items())]
+
+class Histogram(_Sharded):
+    """バケットごとの件数・合計・件数を持つヒストグラム"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        lock, shard = self._shard()
+        with lock:
+            slot = shard.get(labels)
+            if slot is None:
+                # バケットごとの件数（最後は+Inf）、合計
+                slot = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            slot[index] += 1
+            slot[-1] += value
+
+    def _merge(self, into: dict, shard: dict):
+        for labels, slot in shard.items():
+            slot = list(slot)
+            merged = into.get(labels)
+            if merged is None:
+                into[labels] = slot
+            else:
+                for i, value in enumerate(slot):
+                    merged[i] += value
+
+    def samples(self) -> List[Tuple[str, Tuple, float]]:
+        samples = []
+        for labels, slot in sorted(self._collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), slot[:-1]):
+                cumulative += count
+                samples.append((self.name + '_bucket', labels + (_format_value(bound),), cumulative))
+            samples.append((self.name + '_sum', labels, slot[-1]))
+            samples.append((self.name + '_count', labels, cumulative))
+        return samples
+
+class _Callback:
+    """集計時に関数を呼んで値を読む（セッション数やキャッシュの統計など）"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        fn: Callable[[], object],
+        labelnames: Sequence[str] = (),
+        kind: str = 'gauge'
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def samples(self) -> List[Tuple[str, Tuple, float]]:
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        name = self.name + '_total' if self.kind == 'counter' else self.name
+        return [
+            (name, labels if isinstance(labels, tuple) else (labels,), value)
+            for labels, value in sorted(values.items())
+            if value is not None
+        ]
+
+class Registry:
+    """メトリクスの登録先。Prometheusのテキスト形式で書き出す"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name: str, factory: Callable[[], object]):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(name, lambda: Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(name, lambda: Histogram(name, documentation, labelnames, buckets))
+
+    def callback(
+        self,
+        name: str,
+        documentation: str,
+        fn: Callable[[], object],
+        labelnames: Sequence[str] = (),
+        kind: str = 'gauge'
+    ):
+        """集計時に読む値を登録（fnは数値か {ラベル値のタプル: 数値} を返す）"""
+        with self._lock:
+            self._metrics[name] = _Callback(name, documentation, fn, labelnames, kind)
+
+    def render(self) -> str:
+        """Prometheusのテキスト形式（version 0.0.4）"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            if isinstance(metric, Histogram):
+                kind, labelnames = 'histogram', metric.labelnames
+            elif isinstance(metric, Counter):
+                kind, labelnames = 'counter', metric.labelnames
+            else:
+                kind, labelnames = metric.kind, metric.labelnames
+            try:
+                samples = metric.samples()
+            except Exception:
+                continue
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {kind}")
+            for sample_name, labels, value in samples:
+                names = labelnames + ('le',) if sample_name.endswith('_bucket') else labelnames
+                lines.append(f"{sample_name}{_format_labels(names, labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+def _format_labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(
+        f'{name}="{_escape_label(str(value))}"' for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _escape_help(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n')
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value)
+
+# アプリ全体で共有する登録先
+registry = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
@@ -0,0 +1,177 @@
+import os
+import re
+import math
+import random
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# どの場所でも使える夏祭りの定番セリフ（です・ます調で書き、タメ口には起動時に変換）
+COMMON_TEMPLATES = [
+    "屋台がたくさんあって楽しいですね！",
+    "花火が楽しみですね〜",
+    "浴衣、とても似合ってますよ！",
+    "たこ焼き食べたいなぁ...",
+    "金魚すくい、やってみます？",
+    "今日は涼しくていいですね",
+    "お祭りの音楽が聞こえますね♪",
+    "りんご飴が美味しそうですね！",
+    "一緒に回りませんか？",
+    "提灯の明かりが綺麗ですね"
+]
+
+# タメ口への変換規則（上から順に適用）
+CASUAL_RULES = [
+    (re.compile(r'(?<=い)です(?=よ?ね|よ)'), ''),
+    (re.compile(r'ですよね'), 'だよね'),
+    (re.compile(r'ですね'), 'だね'),
+    (re.compile(r'ですよ'), 'だよ'),
+    (re.compile(r'です(?=[！!？?。♪〜…]|$)'), ''),
+    (re.compile(r'りますね'), 'るね'),
+    (re.compile(r'えますね'), 'えるね'),
+    (re.compile(r'しますね'), 'するね'),
+    (re.compile(r'てますよ'), 'てるよ'),
+    (re.compile(r'てます'), 'てる'),
+    (re.compile(r'みます'), 'みる'),
+    (re.compile(r'しませんか'), 'しない'),
+    (re.compile(r'りませんか'), 'らない'),
+    (re.compile(r'ませんか'), 'ない')
+]
+
+# 「〜がしますね」に入れられる匂いの名詞（「夜の空気」や文になっている記述は使わない）
+SMELL_SUFFIXES = ('匂い', 'におい', '香り', '香')
+
+class OfflineEngine:
+    """オフライン時の応答エンジン
+
+    起動時に (エージェント × 場所) ごとのセリフ表を口調変換済みで作っておき、
+    生成時は表から添字で1つ選ぶだけにする。セッションごとに表を重複なく一巡する。
+    挨拶（greeting_patterns）は会話の最初の発言にだけ使い、表には入れない。
+    場所の定型文に差し込むのは名詞の項目（表示名・音・匂い）だけで、
+    品詞の混ざる topics の代わりに locations.json の offline_lines をそのまま使う。
+    """
+
+    def __init__(self, agents: Dict, location_service):
+        self.location_service = location_service
+        self.max_states = int(os.getenv('OFFLINE_MAX_STATES', '4096'))
+
+        # (セリフ表, 表の長さ -> 歩幅の候補, エージェント -> 挨拶) を1つの組で差し替える
+        self._compiled: Tuple[Dict, Dict, Dict] = ({}, {}, {})
+        # (session_id, agent_id, location_id) -> [開始位置, 歩幅, 何個目か]
+        self._states: "OrderedDict[Tuple, List[int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.compile(agents)
+
+    def compile(self, agents: Dict):
+        """全ての (エージェント × 場所) のセリフ表を作り直す"""
+        locations = self.location_service.get_all_locations()
+        tables = {}
+        greetings = {}
+
+        for agent_id, agent in agents.items():
+            greetings[agent_id] = self._dedupe(agent.get('greeting_patterns', []))
+            casual = self._is_casual(agent)
+            agent_lines = self._agent_lines(agent)
+            common = [self._apply_style(t, casual) for t in COMMON_TEMPLATES]
+
+            tables[(agent_id, '')] = self._dedupe(agent_lines + common)
+            for location_id, location in locations.items():
+                location_lines = [
+                    self._apply_style(t, casual) for t in self._location_templates(location)
+                ]
+                tables[(agent_id, location_id)] = self._dedupe(location_lines + agent_lines + common)
+
+        strides = {n: self._coprime_strides(n) for n in {len(t) for t in tables.values()}}
+
+        with self._lock:
+            self._compiled = (tables, strides, greetings)
+            self._states.clear()
+
+        logger.info("Compiled offline templates for %s agent/location pairs", len(tables))
+
+    def generate(
+        self,
+        agent_id: str,
+        location_name: str,
+        session_id: Optional[str] = None,
+        opening: bool = False
+    ) -> Optional[str]:
+        """セリフを1つ返す（未知のエージェントならNone）
+
+        opening=True（会話の最初の発言）なら、設定された挨拶から選ぶ
+        """
+        # compile() と入れ替わっても表と歩幅が食い違わないよう、同じ組から読む
+        tables, strides, greetings = self._compiled
+        if opening and greetings.get(agent_id):
+            return random.choice(greetings[agent_id])
+
+        location_id = self.location_service.resolve_location_id(location_name)
+        table = tables.get((agent_id, location_id)) or tables.get((agent_id, ''))
+        if not table:
+            return None
+
+        if session_id is None:
+            return table[random.randrange(len(table))]
+
+        n = len(table)
+        key = (session_id, agent_id, location_id)
+        with self._lock:
+            state = self._states.get(key)
+            if state is None or state[2] >= n:
+                state = [random.randrange(n), random.choice(strides[n]), 0]
+                self._states[key] = state
+                while len(self._states) > self.max_states:
+                    self._states.popitem(last=False)
+            else:
+                self._states.move_to_end(key)
+            index = (state[0] + state[1] * state[2]) % n
+            state[2] += 1
+
+        return table[index]
+
+    def forget(self, session_id: str):
+        """終了したセッションの重複回避状態を捨てる"""
+        with self._lock:
+            for key in [k for k in self._states if k[0] == session_id]:
+                del self._states[key]
+
+    def _location_templates(self, location: Dict) -> List[str]:
+        """場所のセリフ（定型文に入れるのは名詞の項目だけ）"""
+        name = location.get('display_name', '')
+        lines = [f"{name}っていいですね！", f"{name}、いい雰囲気ですね"]
+        lines += list(location.get('offline_lines', []))
+        lines += [f"{sound}が聞こえますね" for sound in location.get('sounds', [])]
+        lines += [
+            f"{smell}がしますね！" for smell in location.get('smells', [])
+            if smell.endswith(SMELL_SUFFIXES)
+        ]
+        return lines
+
+    def _agent_lines(self, agent: Dict) -> List[str]:
+        """キャラクター固有のセリフ（挨拶と idle_actions のト書きは会話の途中に使わない）"""
+        casual = self._is_casual(agent)
+        return [
+            self._apply_style(f"{topic}の話、しませんか？", casual)
+            for topic in agent.get('topics', [])
+        ]
+
+    def _is_casual(self, agent: Dict) -> bool:
+        return 'タメ口' in agent.get('speaking_style', '')
+
+    def _apply_style(self, text: str, casual: bool) -> str:
+        if not casual:
+            return text
+        for pattern, replacement in CASUAL_RULES:
+            text = pattern.sub(replacement, text)
+        return text
+
+    def _dedupe(self, lines: List[str]) -> Tuple[str, ...]:
+        return tuple(dict.fromkeys(line for line in lines if line))
+
+    def _coprime_strides(self, n: int) -> Tuple[int, ...]:
+        """表を重複なく一巡できる歩幅の候補"""
+        return tuple(s for s in range(1, n) if math.gcd(s, n) == 1) or (1,)
@@ -0,0 +1,187 @@
+import os
+import io
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MODES = ('sample', 'cprofile')
+# cprofileで計測する範囲（結果にも入れて、ワーカー側の時間が含まれないことを示す）
+CPROFILE_SCOPE = 'request_threads'
+
+class ProfilerBusy(RuntimeError):
+    """別の計測が実行中"""
+
+class Profiler:
+    """稼働中のサーバーを再起動せずに一定時間だけ計測する
+
+    sample: 全スレッドのスタックを一定間隔で取り、関数ごとの出現回数を集計する（低負荷）
+    cprofile: 計測中に処理したHTTPリクエストをcProfileで計測し、まとめた結果を返す
+              （リクエストを処理したスレッドだけが対象で、スケジューラ・LLMワーカー・
+              ヘッジ用のスレッドは含まない。それらの時間は sample で見る）
+    """
+
+    def __init__(self):
+        self.max_seconds = float(os.getenv('PROFILE_MAX_SECONDS', '60'))
+        self.default_interval = float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000
+
+        self._lock = threading.Lock()
+        self._active = False
+        self._request_stats: Optional[pstats.Stats] = None
+        self._profiled = 0
+        self._request_lock = threading.Lock()
+        self._local = threading.local()
+        self._captures = 0
+
+    def capture(
+        self,
+        seconds: float,
+        mode: str = 'sample',
+        interval: Optional[float] = None,
+        limit: int = 30
+    ) -> Dict:
+        """seconds秒計測して集計結果を返す（計測が終わるまで戻らない）"""
+        if mode not in MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        seconds = max(0.1, min(seconds, self.max_seconds))
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("Another profile capture is running")
+
+        try:
+            self._captures += 1
+            logger.info("Profiling for %.1fs (mode=%s)", seconds, mode)
+            if mode == 'sample':
+                return self._sample(seconds, interval or self.default_interval, limit)
+            return self._cprofile(seconds, limit)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds: float, interval: float, limit: int) -> Dict:
+        own = threading.get_ident()
+        names = {}
+        inclusive: Counter = Counter()
+        exclusive: Counter = Counter()
+        threads: Counter = Counter()
+        samples = 0
+
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                samples += 1
+                threads[names.get(ident, str(ident))] += 1
+                exclusive[_location(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    key = _location(frame, line=False)
+                    if key not in seen:
+                        seen.add(key)
+                        inclusive[key] += 1
+                    frame = frame.f_back
+            time.sleep(interval)
+
+        def top(counter: Counter) -> List[Dict]:
+            return [
+                {'function': key, 'samples': count, 'ratio': round(count / samples, 4)}
+                for key, count in counter.most_common(limit)
+            ]
+
+        return {
+            'mode': 'sample',
+            'seconds': seconds,
+            'interval_ms': round(interval * 1000, 2),
+            'samples': samples,
+            'threads': dict(threads.most_common()),
+            'self': top(exclusive),
+            'cumulative': top(inclusive)
+        }
+
+    def _cprofile(self, seconds: float, limit: int) -> Dict:
+        with self._request_lock:
+            self._request_stats = None
+            self._profiled = 0
+        self._active = True
+        try:
+            time.sleep(seconds)
+        finally:
+            self._active = False
+        with self._request_lock:
+            stats, self._request_stats = self._request_stats, None
+            profiled = self._profiled
+
+        if stats is None:
+            return {
+                'mode': 'cprofile', 'seconds': seconds, 'scope': CPROFILE_SCOPE, 'requests': 0, 'functions': []
+            }
+
+        stats.sort_stats('cumulative')
+        functions = []
+        for func in stats.fcn_list[:limit]:
+            calls, primitive, total, cumulative, _ = stats.stats[func]
+            functions.append({
+                'function': f"{func[0]}:{func[1]}({func[2]})",
+                'calls': calls,
+                'total_ms': round(total * 1000, 2),
+                'cumulative_ms': round(cumulative * 1000, 2)
+            })
+        text = io.StringIO()
+        stats.stream = text
+        stats.print_stats(limit)
+        return {
+            'mode': 'cprofile',
+            'seconds': seconds,
+            'scope': CPROFILE_SCOPE,
+            'requests': profiled,
+            'functions': functions,
+            'text': text.getvalue()
+        }
+
+    def request_started(self):
+        """リクエスト開始時に呼ぶ（cprofileの計測中だけ計測する）"""
+        if not self._active:
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12以降はプロファイラを同時に1つしか有効にできない
+            return
+        self._local.profile = profile
+
+    def request_finished(self):
+        """リクエスト終了時に呼ぶ"""
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            return
+        profile.disable()
+        self._local.profile = None
+        with self._request_lock:
+            if self._request_stats is None:
+                self._request_stats = pstats.Stats(profile)
+            else:
+                self._request_stats.add(profile)
+            self._profiled += 1
+
+    def stats(self) -> Dict:
+        """監視用の統計情報"""
+        return {
+            'running': self._lock.locked(),
+            'captures': self._captures,
+            'max_seconds': self.max_seconds
+        }
+
+def _location(frame, line: bool = True) -> str:
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    if line:
+        return f"{filename}:{frame.f_lineno}({code.co_name})"
+    return f"{filename}({code.co_name})"
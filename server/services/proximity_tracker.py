@@ -0,0 +1,236 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from services.session_store import SessionStore
+from services.spatial_grid import Position, SpatialGrid
+
+logger = logging.getLogger(__name__)
+
+# 組ごとの状態
+APART = 'apart'          # 離れている
+NEAR = 'near'            # 近づいたが会話は始めていない（どちらかが別の相手と会話中）
+TALKING = 'talking'      # 会話中
+COOLDOWN = 'cooldown'    # 会話終了直後（PROXIMITY_COOLDOWN秒は再開しない）
+
+class ProximityTracker:
+    """近接イベントから会話開始を判定する状態機械
+
+    Unityは毎フレーム距離を送ってくるため、組ごとに状態を持ち、
+    proximity_radius で入り separation_distance で出るヒステリシスで1回の遭遇を1回の開始にまとめる。
+    会話終了後のクールダウン、エージェントごとの同時会話数の上限、クライアントごとのレート制限も行う。
+    """
+
+    def __init__(self, dialog_service):
+        self.dialog_service = dialog_service
+        self.cooldown = float(os.getenv('PROXIMITY_COOLDOWN', '30'))
+        self.max_per_agent = int(os.getenv('PROXIMITY_MAX_PER_AGENT', '1'))
+        self.talk_timeout = float(os.getenv('PROXIMITY_TALK_TIMEOUT', '120'))
+        self.rate = float(os.getenv('PROXIMITY_RATE', '10'))
+        self.burst = float(os.getenv('PROXIMITY_BURST', '20'))
+        self.max_pairs = int(os.getenv('PROXIMITY_MAX_PAIRS', '10000'))
+
+        # 組のキー -> {'state', 'agents', 'since'}
+        self._pairs: "OrderedDict[str, Dict]" = OrderedDict()
+        # エージェントID -> 会話中の組の数
+        self._active: Dict[str, int] = {}
+        # クライアントID -> [残りトークン, 最終補充時刻]
+        self._buckets: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+        self._stats = {
+            'events': 0,
+            'batches': 0,
+            'rate_limited': 0,
+            'started': 0,
+            'debounced': 0,
+            'cooldown_suppressed': 0,
+            'busy_suppressed': 0,
+            'ended': 0,
+            'timed_out': 0
+        }
+
+    @property
+    def enter_radius(self) -> float:
+        return float(self.dialog_service.conversation_rules.get('proximity_radius', 2.0))
+
+    @property
+    def exit_radius(self) -> float:
+        return max(
+            float(self.dialog_service.conversation_rules.get('separation_distance', 5.0)),
+            self.enter_radius
+        )
+
+    def observe(self, agent_ids: List[str], distance: float, client_id: Optional[str] = None) -> bool:
+        """近接イベントを1件処理し、会話を開始すべきならTrueを返す"""
+        if len(agent_ids) < 2:
+            return False
+
+        now = time.monotonic()
+        enter, leave = self.enter_radius, self.exit_radius
+
+        with self._lock:
+            self._stats['events'] += 1
+            if client_id is not None and not self._take_token(client_id, now):
+                self._stats['rate_limited'] += 1
+                return False
+            return self._observe(agent_ids, distance, enter, leave, now)
+
+    def observe_positions(
+        self,
+        positions: Dict[str, Position],
+        client_id: Optional[str] = None
+    ) -> List[List[str]]:
+        """全キャラクターの位置から近接ペアを求め、会話を開始すべき組のリストを返す"""
+        enter, leave = self.enter_radius, self.exit_radius
+        found = SpatialGrid(leave).pairs_within(positions, leave)
+        found.sort(key=lambda f: f[2])  # 近い組から埋める
+
+        now = time.monotonic()
+        started = []
+        with self._lock:
+            self._stats['events'] += 1
+            self._stats['batches'] += 1
+            if client_id is not None and not self._take_token(client_id, now):
+                self._stats['rate_limited'] += 1
+                return []
+
+            seen = set()
+            for a, b, distance in found:
+                seen.add(SessionStore.pair_key([a, b]))
+                if self._observe([a, b], distance, enter, leave, now):
+                    started.append([a, b])
+
+            # 位置が届いたのに近傍に無かった組は離れたものとして扱う（近接の統計には数えない）
+            for pair, entry in list(self._pairs.items()):
+                if pair not in seen and all(a in positions for a in entry['agents']):
+                    self._depart(pair, entry, now)
+
+        return started
+
+    def _depart(self, pair: str, entry: Dict, now: float):
+        """離れた組の状態を進める（会話中・クールダウン中の組は期限が来るまで残す）"""
+        state = self._expire(entry, now, near=False)
+        if state in (APART, NEAR):
+            del self._pairs[pair]
+
+    def _expire(self, entry: Dict, now: float, near: bool) -> str:
+        """期限切れの会話・クールダウンを片付けて現在の状態を返す"""
+        state = entry['state']
+
+        if state == TALKING and now - entry['since'] > self.talk_timeout:
+            # 終了通知が来なかった会話は期限で片付ける
+            self._release(entry['agents'])
+            self._stats['timed_out'] += 1
+            state = self._set(entry, COOLDOWN, now)
+
+        if state == COOLDOWN and now - entry['since'] >= self.cooldown:
+            state = self._set(entry, NEAR if near else APART, now)
+        return state
+
+    def _observe(self, agent_ids: List[str], distance: float, enter: float, leave: float, now: float) -> bool:
+        pair = SessionStore.pair_key(agent_ids)
+        entry = self._pairs.get(pair)
+        if entry is None:
+            if distance >= enter:
+                return False
+            entry = {'state': APART, 'agents': list(agent_ids), 'since': now}
+            self._pairs[pair] = entry
+            while len(self._pairs) > self.max_pairs:
+                _, dropped = self._pairs.popitem(last=False)
+                if dropped['state'] == TALKING:
+                    self._release(dropped['agents'])
+        else:
+            self._pairs.move_to_end(pair)
+
+        state = self._expire(entry, now, near=distance < leave)
+
+        if distance > leave:
+            if state in (APART, NEAR):
+                del self._pairs[pair]
+            return False
+
+        if state == TALKING:
+            self._stats['debounced'] += 1
+            return False
+        if state == COOLDOWN:
+            self._stats['cooldown_suppressed'] += 1
+            return False
+        if state == APART and distance >= enter:
+            return False
+
+        # 入った（または近くで待っていた）組を開始できるか
+        if any(self._active.get(a, 0) >= self.max_per_agent for a in entry['agents']):
+            if state == APART:
+                self._set(entry, NEAR, now)
+            self._stats['busy_suppressed'] += 1
+            return False
+
+        for agent_id in entry['agents']:
+            self._active[agent_id] = self._active.get(agent_id, 0) + 1
+        self._set(entry, TALKING, now)
+        self._stats['started'] += 1
+        logger.debug("Proximity started conversation for %s at distance %s", pair, distance)
+        return True
+
+    def conversation_ended(self, agent_ids: List[str]):
+        """会話終了を記録し、組をクールダウンに入れる"""
+        if len(agent_ids) < 2:
+            return
+        pair = SessionStore.pair_key(agent_ids)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._pairs.get(pair)
+            if entry is None:
+                entry = {'state': APART, 'agents': list(agent_ids), 'since': now}
+                self._pairs[pair] = entry
+            elif entry['state'] == TALKING:
+                self._release(entry['agents'])
+            self._set(entry, COOLDOWN, now)
+            self._stats['ended'] += 1
+
+    def forget_client(self, client_id: str):
+        """切断したクライアントのレート制限状態を捨てる"""
+        with self._lock:
+            self._buckets.pop(client_id, None)
+
+    def _set(self, entry: Dict, state: str, now: float) -> str:
+        entry['state'] = state
+        entry['since'] = now
+        return state
+
+    def _release(self, agent_ids: List[str]):
+        for agent_id in agent_ids:
+            count = self._active.get(agent_id, 0) - 1
+            if count > 0:
+                self._active[agent_id] = count
+            else:
+                self._active.pop(agent_id, None)
+
+    def _take_token(self, client_id: str, now: float) -> bool:
+        """トークンバケットで1件分の枠を取る"""
+        bucket = self._buckets.get(client_id)
+        if bucket is None:
+            bucket = [self.burst, now]
+            self._buckets[client_id] = bucket
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+    def stats(self) -> Dict:
+        """監視用の統計情報"""
+        with self._lock:
+            states: Dict[str, int] = {}
+            for entry in self._pairs.values():
+                states[entry['state']] = states.get(entry['state'], 0) + 1
+            return dict(
+                self._stats,
+                pairs=states,
+                active_agents=len(self._active),
+                clients=len(self._buckets)
+            )
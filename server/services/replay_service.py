@@ -0,0 +1,207 @@
+import os
+import random
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class ReplayService:
+    """記録済みのLLM会話をそのまま再生する（REPLAY=true）
+
+    トランスクリプトストアの会話を (ペア, 場所, 時間帯) で分類し、同じ条件の会話を
+    順番に使い回す（全部使い切るまで同じ会話を出さない）。条件に合う会話が無ければ
+    時間帯→場所の順に条件を緩め、それでも無ければNoneを返して通常の生成に任せる。
+    並び順は REPLAY_SEED で決まり、同じ記録・同じ順のリクエストなら同じ会話を返す。
+    """
+
+    def __init__(self, transcript_store):
+        self.enabled = os.getenv('REPLAY', 'false') == 'true'
+        self.min_lines = max(1, int(os.getenv('REPLAY_MIN_LINES', '2')))
+        self.max_sessions = int(os.getenv('REPLAY_MAX_SESSIONS', '1000'))
+        self.seed = int(os.getenv('REPLAY_SEED', '0'))
+        self.store = transcript_store
+
+        # (pair, location, time_bucket) / (pair, location) / (pair,) -> 記録済みセッションIDの巡回順
+        self._rotations: Dict[tuple, Deque[str]] = {}
+        # 再生中のセッション: session_id -> 再生する発言（ターン順、足りなくなったら次の会話をつなぐ）
+        self._sessions: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        # 一度読んだ会話は再生用の形で持っておく（記録済みの会話は変わらない）
+        self._loaded: Dict[str, List[Dict]] = {}
+        self._lock = threading.Lock()
+        self._stats = {'served': 0, 'conversations_served': 0, 'misses': 0, 'skipped': 0}
+
+        if self.enabled:
+            self.reload()
+
+    def reload(self):
+        """トランスクリプトストアから会話の一覧を作り直す"""
+        recorded = sorted(
+            (c for c in self.store.conversations() if c['lines'] >= self.min_lines),
+            key=lambda c: (c['started'], c['session_id'])
+        )
+        rotations: Dict[tuple, List[str]] = {}
+        for conversation in recorded:
+            pair, location, bucket = conversation['pair'], conversation['location'], conversation['time_bucket']
+            for key in ((pair, location, bucket), (pair, location), (pair,)):
+                rotations.setdefault(key, []).append(conversation['session_id'])
+
+        rng = random.Random(self.seed)
+        with self._lock:
+            self._rotations = {}
+            self._loaded = {}
+            for key, session_ids in rotations.items():
+                rng.shuffle(session_ids)
+                self._rotations[key] = deque(session_ids)
+        logger.info("Replay mode: %s recorded conversations available", len(recorded))
+
+    def covers(self, pair: str) -> bool:
+        """このペアの記録があるか（場所が違っても再生できる）"""
+        return self.enabled and bool(self._rotations.get((pair,)))
+
+    def turn(
+        self,
+        session_id: str,
+        pair: str,
+        turn: int,
+        location: str,
+        time_bucket: str,
+        max_turns: int
+    ) -> Optional[Dict]:
+        """セッションのturn番目の発言（範囲外・記録が無ければNone）
+
+        turnはクライアントが送る値なので max_turns を超えるものは再生しない。
+        足りない分の会話はロックの外で読み、最後に追記する。
+        """
+        if not self.enabled:
+            return None
+        if not 1 <= turn <= max_turns:
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+
+        with self._lock:
+            lines = self._sessions.get(session_id)
+            if lines is None or turn == 1:
+                lines = self._sessions[session_id] = []
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            if len(lines) >= turn:
+                self._stats['served'] += 1
+                return lines[turn - 1]
+            needed = turn - len(lines)
+
+        more = self._take_lines(pair, location, time_bucket, needed)
+
+        with self._lock:
+            lines = self._sessions.get(session_id)
+            if lines is None:
+                lines = self._sessions[session_id] = []
+            if more and len(lines) < turn:
+                lines.extend(more)
+            if len(lines) < turn:
+                self._stats['misses'] += 1
+                return None
+            self._stats['served'] += 1
+            return lines[turn - 1]
+
+    def conversation(
+        self,
+        pair: str,
+        turns: int,
+        location: str,
+        time_bucket: str,
+        max_turns: int
+    ) -> Optional[List[Dict]]:
+        """turns行の会話（1つで足りなければ次の会話をつなぐ。max_turnsを超える長さは再生しない）"""
+        if not self.enabled:
+            return None
+
+        lines = self._take_lines(pair, location, time_bucket, turns) if 1 <= turns <= max_turns else None
+        with self._lock:
+            if not lines:
+                self._stats['misses'] += 1
+                return None
+            self._stats['served'] += turns
+        return lines[:turns]
+
+    def _take_lines(self, pair: str, location: str, time_bucket: str, needed: int) -> Optional[List[Dict]]:
+        """条件に合う会話を順に取り出し、needed行以上つないで返す（足りなければNone）
+
+        needed は max_turns 以下、1会話は min_lines 行以上なので取り出す回数は限られる。
+        """
+        lines: List[Dict] = []
+        while len(lines) < needed:
+            more = self._next_conversation(pair, location, time_bucket)
+            if not more:
+                return None
+            lines.extend(more)
+        return lines
+
+    def _next_conversation(self, pair: str, location: str, time_bucket: str) -> Optional[List[Dict]]:
+        """条件に合う次の会話の発言（巡回順の更新だけロックを取り、読み込みはロックの外）"""
+        for key in ((pair, location, time_bucket), (pair, location), (pair,)):
+            while True:
+                with self._lock:
+                    rotation = self._rotations.get(key)
+                    if not rotation:
+                        break
+                    session_id = rotation[0]
+                    rotation.rotate(-1)
+                lines = self._load(session_id)
+                with self._lock:
+                    if lines:
+                        self._stats['conversations_served'] += 1
+                        return lines
+                    # LLM以外（オフライン応答・キャッシュ・ウォームプールなど）の発言を含む会話は以後使わない
+                    self._discard(session_id)
+                    self._stats['skipped'] += 1
+        return None
+
+    def _load(self, session_id: str) -> List[Dict]:
+        """記録済みの会話をターン順に読む（メモリマップから該当行だけ）"""
+        with self._lock:
+            cached = self._loaded.get(session_id)
+        if cached is not None:
+            return cached
+        lines = self.store.query(limit=10000, newest_first=False, session_id=session_id)
+        if not lines or not all(line.get('source') == 'llm' for line in lines):
+            return []
+        loaded = [
+            {
+                'speaker': line['speaker'],
+                'speaker_name': line.get('speaker_name'),
+                'text': line['text'],
+                'emotion': line.get('emotion')
+            }
+            for line in sorted(lines, key=lambda line: line.get('turn', 0))
+        ]
+        with self._lock:
+            self._loaded[session_id] = loaded
+        return loaded
+
+    def _discard(self, session_id: str):
+        for rotation in self._rotations.values():
+            try:
+                rotation.remove(session_id)
+            except ValueError:
+                pass
+
+    def forget(self, session_id: str):
+        """終了したセッションの再生位置を破棄"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict:
+        """監視用の統計情報"""
+        with self._lock:
+            return dict(
+                self._stats,
+                enabled=self.enabled,
+                pairs=sum(1 for key in self._rotations if len(key) == 1),
+                conversations=sum(len(r) for key, r in self._rotations.items() if len(key) == 1),
+                active_sessions=len(self._sessions)
+            )
@@ -0,0 +1,89 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class RequestCoalescer:
+    """重複リクエストの抑止
+
+    同じキー（セッション × ターン）のリクエストが処理中なら新たに生成せず、
+    先行のリクエストの結果を待って共有する（シングルフライト）。
+    クライアントが冪等キーを付けていれば、完了済みの結果をTTLの間そのまま返す。
+    """
+
+    def __init__(self):
+        self.max_keys = int(os.getenv('IDEMPOTENCY_MAX_KEYS', '2000'))
+        self.ttl_seconds = float(os.getenv('IDEMPOTENCY_TTL', '300'))
+
+        self._in_flight: Dict[Hashable, Future] = {}
+        # 冪等キー -> (期限, 結果)
+        self._completed: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._stats = {'requests': 0, 'coalesced': 0, 'replayed': 0, 'failed': 0}
+
+    def run(
+        self,
+        flight_key: Hashable,
+        fn: Callable[[], Any],
+        idempotency_key: Optional[str] = None
+    ) -> Any:
+        """fnを実行して結果を返す（重複なら先行分の結果を返す）"""
+        now = time.monotonic()
+        with self._lock:
+            self._stats['requests'] += 1
+
+            if idempotency_key:
+                stored = self._completed.get(idempotency_key)
+                if stored is not None and stored[0] > now:
+                    self._stats['replayed'] += 1
+                    logger.debug("Replaying stored result for idempotency key %s", idempotency_key)
+                    return stored[1]
+
+            future = self._in_flight.get(flight_key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[flight_key] = future
+            else:
+                self._stats['coalesced'] += 1
+
+        if not owner:
+            logger.debug("Coalesced duplicate request %s", flight_key)
+            return future.result()
+
+        try:
+            result = fn()
+        except Exception as e:
+            with self._lock:
+                self._stats['failed'] += 1
+                self._in_flight.pop(flight_key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._in_flight.pop(flight_key, None)
+            if idempotency_key:
+                self._completed[idempotency_key] = (time.monotonic() + self.ttl_seconds, result)
+                self._completed.move_to_end(idempotency_key)
+                while self._completed and (
+                    len(self._completed) > self.max_keys
+                    or next(iter(self._completed.values()))[0] <= now
+                ):
+                    self._completed.popitem(last=False)
+        future.set_result(result)
+        return result
+
+    def stats(self) -> Dict:
+        """監視用の統計情報"""
+        with self._lock:
+            return dict(
+                self._stats,
+                in_flight=len(self._in_flight),
+                stored_keys=len(self._completed)
+            )
@@ -0,0 +1,151 @@
+import os
+import re
+import time
+import random
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_NORMALIZE_PATTERN = re.compile(r'[\s、。！？!?…・〜~♪「」.,]+')
+
+def fingerprint(*texts: str) -> str:
+    """発言を表記ゆれに強い短いハッシュに変換（空なら空文字）"""
+    normalized = '|'.join(
+        _NORMALIZE_PATTERN.sub('', unicodedata.normalize('NFKC', t or '')).lower()
+        for t in texts
+    )
+    if not normalized.strip('|'):
+        return ''
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).hexdigest()
+
+class ResponseCache:
+    """生成済み発言のキャッシュ（キーごとに複数候補・LRU・TTL付き）
+
+    キーは (話者ID, 場所ID, 時間帯, 直前の発言の指紋) のタプル。
+    1キーあたり fill 件の候補が揃うまではミス扱いにしてLLMで補充し、
+    揃った後は直前に返したもの以外からランダムに返す。
+    """
+
+    def __init__(
+        self,
+        max_keys: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        fill: Optional[int] = None
+    ):
+        self.enabled = os.getenv('RESPONSE_CACHE', 'true') == 'true'
+        self.max_keys = max_keys or int(os.getenv('RESPONSE_CACHE_MAX_KEYS', '2000'))
+        self.ttl_seconds = ttl_seconds or float(os.getenv('RESPONSE_CACHE_TTL', '1800'))
+        self.fill = fill or int(os.getenv('RESPONSE_CACHE_FILL', '3'))
+
+        # key -> {'candidates': [(text, stored_at)], 'last': text}
+        self._entries: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key: Tuple) -> Optional[str]:
+        """候補が揃っていれば1つ返す、なければNone"""
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._expire_candidates(entry, now)
+                if not entry['candidates']:
+                    del self._entries[key]
+                    entry = None
+
+            if entry is None or len(entry['candidates']) < self.fill:
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            choices = [t for t, _ in entry['candidates'] if t != entry['last']] or [entry['candidates'][0][0]]
+            text = random.choice(choices)
+            entry['last'] = text
+            self._hits += 1
+            return text
+
+    def peek(self, key: Tuple) -> Optional[str]:
+        """候補数に関わらず有効な候補を1つ返す（締め切りに間に合わないときの代替用、統計には数えない）"""
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            fresh = [t for t, at in entry['candidates'] if now - at < self.ttl_seconds]
+            choices = [t for t in fresh if t != entry['last']] or fresh
+            if not choices:
+                return None
+            text = random.choice(choices)
+            entry['last'] = text
+            return text
+
+    def contains(self, key: Tuple, text: str) -> bool:
+        """その発言が候補として保存されているか"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and any(t == text for t, _ in entry['candidates'])
+
+    def put(self, key: Tuple, text: str):
+        """候補を追加（同じ文は重複させない、上限を超えたら最古を入れ替え）"""
+        if not self.enabled or not text:
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = {'candidates': [], 'last': None}
+                self._entries[key] = entry
+            else:
+                self._entries.move_to_end(key)
+
+            candidates = entry['candidates']
+            if any(t == text for t, _ in candidates):
+                return
+            candidates.append((text, now))
+            if len(candidates) > self.fill:
+                del candidates[0]
+
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def _expire_candidates(self, entry: Dict, now: float):
+        fresh = [(t, at) for t, at in entry['candidates'] if now - at < self.ttl_seconds]
+        self._expirations += len(entry['candidates']) - len(fresh)
+        entry['candidates'] = fresh
+
+    def clear(self):
+        """全候補を破棄"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """監視用の統計情報"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'keys': len(self._entries),
+                'max_keys': self.max_keys,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 3) if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations
+            }
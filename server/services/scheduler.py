@@ -0,0 +1,247 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Optional
+from services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# 優先度（小さいほど先に実行）
+PRIORITY_INTERACTIVE = 0   # 画面に表示中・1ターン目など、クライアントが待っているもの
+PRIORITY_NORMAL = 1        # 会話全体の生成など、多少待てるもの
+PRIORITY_BACKGROUND = 2    # 先読み・ウォームプールの補充
+PRIORITY_NAMES = ['interactive', 'normal', 'background']
+
+class QueueFull(RuntimeError):
+    """キューが深く、shedも指定されていないため受け付けなかった"""
+
+class _Task:
+    __slots__ = ('future', 'fn', 'args', 'priority', 'key', 'enqueued', 'context')
+
+    def __init__(self, future, fn, args, priority, key, enqueued):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.priority = priority
+        self.key = key
+        self.enqueued = enqueued
+        # 投入した側のトレースをワーカーに引き継ぐ
+        self.context = contextvars.copy_context()
+
+class Scheduler:
+    """LLM呼び出しの全体スケジューラ
+
+    固定数のワーカーが優先度の高いキューから順に取り出す。同じ優先度の中では
+    セッション（fair_key）ごとのキューを順番に回し、1つのセッションが枠を占有しないようにする。
+    キューが深いときは低優先度の仕事を受け付けず、shed（オフライン応答など）か QueueFull で即座に返す。
+    """
+
+    def __init__(self, workers: int, name: str = 'llm'):
+        self.workers = max(1, workers)
+        self.shed_depth = int(os.getenv('SCHEDULER_SHED_DEPTH', str(self.workers * 2)))
+        self.max_queue = int(os.getenv('SCHEDULER_MAX_QUEUE', '64'))
+
+        # 優先度ごとに fair_key -> タスクの列（キーの並びが巡回順）
+        self._queues: List["OrderedDict[str, Deque[_Task]]"] = [
+            OrderedDict() for _ in PRIORITY_NAMES
+        ]
+        self._depth = 0
+        self._busy = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self._stats = {
+            'submitted': [0] * len(PRIORITY_NAMES),
+            'completed': [0] * len(PRIORITY_NAMES),
+            'shed': [0] * len(PRIORITY_NAMES),
+            'cancelled': 0,
+            'promoted': 0,
+            'max_depth': 0
+        }
+        self._wait_sum = [0.0] * len(PRIORITY_NAMES)
+        self._wait_max = [0.0] * len(PRIORITY_NAMES)
+
+        self._threads = [
+            threading.Thread(target=self._worker, name=f'{name}-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(
+        self,
+        fn: Callable,
+        *args,
+        priority: int = PRIORITY_NORMAL,
+        fair_key: Optional[str] = None,
+        shed: Optional[Callable[[], Any]] = None
+    ) -> Future:
+        """仕事を投入してFutureを返す
+
+        キューが深すぎる場合は実行せず、shedの結果（shedが無ければQueueFull）で完了させる
+        """
+        future = Future()
+        with self._cond:
+            limit = self.shed_depth if priority >= PRIORITY_BACKGROUND else self.max_queue
+            if self._closed or self._depth >= limit:
+                self._stats['shed'][priority] += 1
+                admitted = False
+            else:
+                task = _Task(future, fn, args, priority, fair_key or '', time.monotonic())
+                self._queues[priority].setdefault(task.key, deque()).append(task)
+                self._depth += 1
+                self._stats['submitted'][priority] += 1
+                self._stats['max_depth'] = max(self._stats['max_depth'], self._depth)
+                self._cond.notify()
+                admitted = True
+
+        if admitted:
+            future.add_done_callback(lambda f: self._withdraw(task) if f.cancelled() else None)
+
+        if not admitted:
+            logger.debug("Shed %s task (queue depth %s)", PRIORITY_NAMES[priority], self._depth)
+            self._run_shed(future, shed)
+        return future
+
+    def promote(self, fair_key: str, priority: int = PRIORITY_INTERACTIVE) -> int:
+        """待機中のセッションの仕事を高い優先度に移す（先読みを実際に待ち始めたときなど）"""
+        moved = 0
+        with self._cond:
+            for level in range(priority + 1, len(self._queues)):
+                tasks = self._queues[level].pop(fair_key or '', None)
+                if not tasks:
+                    continue
+                for task in tasks:
+                    task.priority = priority
+                self._stats['submitted'][level] -= len(tasks)
+                self._stats['submitted'][priority] += len(tasks)
+                self._queues[priority].setdefault(fair_key or '', deque()).extend(tasks)
+                moved += len(tasks)
+            self._stats['promoted'] += moved
+        return moved
+
+    def _withdraw(self, task: _Task):
+        """待機中に取り消された仕事をキューから外す（待ち件数に数えたままにしない）"""
+        with self._cond:
+            if self._closed:
+                return
+            queue = self._queues[task.priority]
+            tasks = queue.get(task.key)
+            if not tasks or task not in tasks:
+                return  # ワーカーが取り出し済み
+            tasks.remove(task)
+            if not tasks:
+                del queue[task.key]
+            self._depth -= 1
+            self._stats['cancelled'] += 1
+
+    def _next_task(self) -> Optional[_Task]:
+        """優先度の高い順に、セッションを巡回しながら1件取り出す（ロック保持中に呼ぶ）"""
+        for queue in self._queues:
+            if not queue:
+                continue
+            key, tasks = next(iter(queue.items()))
+            task = tasks.popleft()
+            if tasks:
+                queue.move_to_end(key)
+            else:
+                del queue[key]
+            self._depth -= 1
+            return task
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                    task = self._next_task()
+                waited = time.monotonic() - task.enqueued
+                self._wait_sum[task.priority] += waited
+                self._wait_max[task.priority] = max(self._wait_max[task.priority], waited)
+
+            if not task.future.set_running_or_notify_cancel():
+                with self._cond:
+                    self._stats['cancelled'] += 1
+                continue
+
+            with self._cond:
+                self._busy += 1
+            try:
+                # 完了時のコールバックも投入した側のトレースの中で動かす
+                task.context.run(self._execute, task, waited)
+            finally:
+                with self._cond:
+                    self._busy -= 1
+                    self._stats['completed'][task.priority] += 1
+
+    def _execute(self, task: _Task, waited: float):
+        tracer.record(
+            'queue_wait', time.perf_counter() - waited, waited,
+            priority=PRIORITY_NAMES[task.priority]
+        )
+        try:
+            task.future.set_result(task.fn(*task.args))
+        except BaseException as e:
+            task.future.set_exception(e)
+
+    def _run_shed(self, future: Future, shed: Optional[Callable[[], Any]]):
+        if shed is None:
+            future.set_exception(QueueFull("Scheduler queue is full"))
+            return
+        try:
+            future.set_result(shed())
+        except Exception as e:
+            future.set_exception(e)
+
+    @property
+    def depth(self) -> int:
+        """待機中の仕事の数"""
+        return self._depth
+
+    def shutdown(self):
+        """新規の受付を止め、待機中の仕事を取り消す"""
+        with self._cond:
+            self._closed = True
+            for queue in self._queues:
+                for tasks in queue.values():
+                    for task in tasks:
+                        task.future.cancel()
+                queue.clear()
+            self._depth = 0
+            self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        """監視用の統計情報"""
+        with self._cond:
+            per_priority = {}
+            for level, name in enumerate(PRIORITY_NAMES):
+                started = self._stats['submitted'][level] - sum(
+                    len(tasks) for tasks in self._queues[level].values()
+                )
+                per_priority[name] = {
+                    'queued': sum(len(tasks) for tasks in self._queues[level].values()),
+                    'submitted': self._stats['submitted'][level],
+                    'completed': self._stats['completed'][level],
+                    'shed': self._stats['shed'][level],
+                    'avg_wait_ms': round(self._wait_sum[level] / started * 1000, 1) if started > 0 else None,
+                    'max_wait_ms': round(self._wait_max[level] * 1000, 1)
+                }
+            return {
+                'workers': self.workers,
+                'busy': self._busy,
+                'depth': self._depth,
+                'max_depth': self._stats['max_depth'],
+                'shed_depth': self.shed_depth,
+                'max_queue': self.max_queue,
+                'cancelled': self._stats['cancelled'],
+                'promoted': self._stats['promoted'],
+                'priorities': per_priority
+            }
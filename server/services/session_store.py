@@ -0,0 +1,144 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class SessionStore:
+    """会話セッションの保管庫（上限件数・TTL・LRU追い出し付き）"""
+
+    def __init__(
+        self,
+        max_sessions: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        max_history: Optional[int] = None
+    ):
+        self.max_sessions = max_sessions or int(os.getenv('SESSION_MAX', '1000'))
+        self.ttl_seconds = ttl_seconds or float(os.getenv('SESSION_TTL', '600'))
+        self.max_history = max_history or int(os.getenv('SESSION_MAX_HISTORY', '20'))
+
+        # 最終アクセス順（先頭が最も古い）
+        self._sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        # エージェントの組 -> 最新セッションID（session_idを送らないクライアント用）
+        self._pair_index: Dict[str, str] = {}
+        self._lock = threading.RLock()
+
+        self._created = 0
+        self._expired = 0
+        self._evicted = 0
+        self._removed = 0
+
+    @staticmethod
+    def pair_key(agent_ids: List[str]) -> str:
+        """エージェントの組を順序に依存しないキーに変換"""
+        return '-'.join(sorted(agent_ids))
+
+    def resolve(
+        self,
+        session_id: Optional[str],
+        agent_ids: List[str],
+        turn: int
+    ) -> Tuple[str, Dict]:
+        """リクエストに対応するセッションを取得、なければ作成"""
+        now = time.monotonic()
+        pair = self.pair_key(agent_ids)
+
+        with self._lock:
+            self._purge_expired(now)
+
+            if not session_id and turn > 1:
+                session_id = self._pair_index.get(pair)
+
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                if not session_id:
+                    session_id = f"{pair}_{uuid.uuid4().hex[:12]}"
+                session = self._create(session_id, agent_ids, pair, now)
+            else:
+                session['last_access'] = now
+                self._sessions.move_to_end(session_id)
+
+            self._pair_index[pair] = session_id
+            return session_id, session
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """セッションを取得（期限切れならNone）"""
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            return self._sessions.get(session_id)
+
+    def append_history(self, session: Dict, entry: Dict):
+        """履歴を追加し、上限を超えた古い発言を切り捨てる"""
+        with self._lock:
+            history = session['history']
+            history.append(entry)
+            if len(history) > self.max_history:
+                del history[:len(history) - self.max_history]
+
+    def remove(self, session_id: Optional[str]) -> bool:
+        """セッションを削除"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None) if session_id else None
+            if session is None:
+                return False
+            self._drop_pair_index(session_id, session)
+            self._removed += 1
+            return True
+
+    def _create(self, session_id: str, agent_ids: List[str], pair: str, now: float) -> Dict:
+        session = {
+            'session_id': session_id,
+            'agents': list(agent_ids),
+            'pair': pair,
+            'history': [],
+            'turn': 0,
+            'created_at': now,
+            'last_access': now
+        }
+        self._sessions[session_id] = session
+        self._created += 1
+
+        while len(self._sessions) > self.max_sessions:
+            old_id, old_session = self._sessions.popitem(last=False)
+            self._drop_pair_index(old_id, old_session)
+            self._evicted += 1
+            logger.debug("Evicted session (LRU): %s", old_id)
+
+        return session
+
+    def _purge_expired(self, now: float):
+        """TTLを過ぎたセッションを先頭から削除"""
+        while self._sessions:
+            old_id, old_session = next(iter(self._sessions.items()))
+            if now - old_session['last_access'] < self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+            self._drop_pair_index(old_id, old_session)
+            self._expired += 1
+
+    def _drop_pair_index(self, session_id: str, session: Dict):
+        if self._pair_index.get(session['pair']) == session_id:
+            del self._pair_index[session['pair']]
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            return len(self._sessions)
+
+    def stats(self) -> Dict:
+        """監視用の統計情報"""
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            return {
+                'size': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'ttl_seconds': self.ttl_seconds,
+                'created': self._created,
+                'expired': self._expired,
+                'evicted': self._evicted,
+                'removed': self._removed
+            }
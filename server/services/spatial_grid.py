@@ -0,0 +1,54 @@
+import math
+from typing import Dict, List, Tuple
+
+Position = Tuple[float, float]
+
+# 自分のセルと、重複なく隣接セルを調べるための半分の近傍（右・右上・上・左上）
+_FORWARD_NEIGHBORS = ((1, 0), (1, 1), (0, 1), (-1, 1))
+
+class SpatialGrid:
+    """一様グリッドによる近傍ペア検出
+
+    セルの一辺を検出半径以上にしておけば、半径内のペアは同じセルか隣接セルにしか居ないので、
+    全ペアの距離計算（O(n²)）をせずに候補を絞り込める。座標は地面上の (x, z) を使う。
+    """
+
+    def __init__(self, cell_size: float):
+        if cell_size <= 0:
+            raise ValueError("cell_size must be positive")
+        self.cell_size = cell_size
+
+    def pairs_within(
+        self,
+        positions: Dict[str, Position],
+        radius: float
+    ) -> List[Tuple[str, str, float]]:
+        """距離がradius未満の (id, id, 距離) を全て返す"""
+        size = max(self.cell_size, radius)
+        cells: Dict[Tuple[int, int], List[Tuple[str, float, float]]] = {}
+        for agent_id, (x, z) in positions.items():
+            cells.setdefault((math.floor(x / size), math.floor(z / size)), []).append((agent_id, x, z))
+
+        r2 = radius * radius
+        found = []
+        for (cx, cz), members in cells.items():
+            self._collect(members, members, r2, found, same_cell=True)
+            for dx, dz in _FORWARD_NEIGHBORS:
+                others = cells.get((cx + dx, cz + dz))
+                if others:
+                    self._collect(members, others, r2, found, same_cell=False)
+        return found
+
+    def _collect(
+        self,
+        members: List[Tuple[str, float, float]],
+        others: List[Tuple[str, float, float]],
+        r2: float,
+        found: List[Tuple[str, str, float]],
+        same_cell: bool
+    ):
+        for i, (a, ax, az) in enumerate(members):
+            for b, bx, bz in (others[i + 1:] if same_cell else others):
+                d2 = (ax - bx) ** 2 + (az - bz) ** 2
+                if d2 < r2:
+                    found.append((a, b, math.sqrt(d2)))
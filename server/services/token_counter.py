@@ -0,0 +1,49 @@
+import os
+import logging
+from typing import Dict, List
+
+try:
+    import tiktoken
+except ImportError:  # 任意依存: 無ければ文字種からの概算になる
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# メッセージ1件ごとの区切りトークン（OpenAIのチャット形式の目安）
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+class TokenCounter:
+    """プロンプトの入力トークン数をローカルで数える
+
+    tiktokenがあればモデルのエンコーディングで正確に、無ければ
+    「ASCIIは4文字で1トークン、それ以外は1文字1トークン」で概算する。
+    """
+
+    def __init__(self, model: str = 'gpt-4o-mini'):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding(os.getenv('TIKTOKEN_ENCODING', 'o200k_base'))
+        else:
+            logger.info("tiktoken not installed, estimating token counts")
+
+    @property
+    def exact(self) -> bool:
+        return self.encoding is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        ascii_chars = sum(1 for c in text if c < '\x80')
+        return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+    def count_messages(self, messages: List[Dict]) -> int:
+        return sum(
+            TOKENS_PER_MESSAGE + self.count(m.get('content', ''))
+            for m in messages
+        ) + TOKENS_PER_REPLY
@@ -0,0 +1,167 @@
+import os
+import time
+import queue
+import random
+import logging
+import threading
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional
+import orjson
+
+logger = logging.getLogger(__name__)
+
+class Trace:
+    """1リクエスト分のスパンの集まり"""
+
+    __slots__ = ('trace_id', 'name', 'attrs', 'started', 'timestamp', 'spans', 'closed')
+
+    def __init__(self, name: str, attrs: Dict):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.timestamp = datetime.now().isoformat()
+        self.spans: List[Dict] = []
+        self.closed = False
+
+    def add(self, name: str, started: float, duration: float, attrs: Dict):
+        # 終了後に届いたスパン（応答を返した後の後処理など）は捨てる
+        if self.closed:
+            return
+        span = {
+            'name': name,
+            'start_ms': round((started - self.started) * 1000, 2),
+            'duration_ms': round(duration * 1000, 2),
+            'thread': threading.current_thread().name
+        }
+        if attrs:
+            span['attrs'] = attrs
+        self.spans.append(span)
+
+_current: ContextVar[Optional[Trace]] = ContextVar('trace', default=None)
+
+class Tracer:
+    """処理段階ごとのスパンを記録し、ローテーションするJSONLファイルに書き出す
+
+    トレースはcontextvarsで引き継ぐ（スケジューラのワーカーにも渡る）。
+    書き込みは専用スレッドで行い、キューが溢れたら記録を捨ててリクエストを待たせない。
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv('TRACE_ENABLED', 'true') == 'true'
+        self.sample_rate = float(os.getenv('TRACE_SAMPLE_RATE', '1.0'))
+        self.path = os.getenv('TRACE_FILE', 'logs/trace.jsonl')
+        self.max_bytes = int(os.getenv('TRACE_MAX_BYTES', str(10 * 1024 * 1024)))
+        self.backups = int(os.getenv('TRACE_BACKUPS', '5'))
+
+        self._queue: queue.Queue = queue.Queue(maxsize=int(os.getenv('TRACE_QUEUE_SIZE', '1000')))
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self._stats = {'written': 0, 'dropped': 0}
+
+    @contextmanager
+    def start(self, name: str, **attrs):
+        """トレースを開始する（サンプリングで外れた場合やトレース中の場合はNone）"""
+        if not self.enabled or _current.get() is not None or random.random() >= self.sample_rate:
+            yield None
+            return
+
+        trace = Trace(name, attrs)
+        token = _current.set(trace)
+        try:
+            yield trace
+        finally:
+            _current.reset(token)
+            self._finish(trace)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """現在のトレースに処理段階を1つ記録する（トレース外なら何もしない）"""
+        trace = _current.get()
+        if trace is None:
+            yield
+            return
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            trace.add(name, started, time.perf_counter() - started, attrs)
+
+    def record(self, name: str, started: float, duration: float, **attrs):
+        """計測済みの区間を記録する（キューの待ち時間など）"""
+        trace = _current.get()
+        if trace is not None:
+            trace.add(name, started, duration, attrs)
+
+    def annotate(self, **attrs):
+        """現在のトレースに属性を追加する"""
+        trace = _current.get()
+        if trace is not None:
+            trace.attrs.update(attrs)
+
+    @contextmanager
+    def detached(self):
+        """トレースを引き継がせずに処理する（先読みなど、応答と無関係な仕事の投入）"""
+        token = _current.set(None)
+        try:
+            yield
+        finally:
+            _current.reset(token)
+
+    def _finish(self, trace: Trace):
+        trace.closed = True
+        record = {
+            'trace_id': trace.trace_id,
+            'name': trace.name,
+            'timestamp': trace.timestamp,
+            'duration_ms': round((time.perf_counter() - trace.started) * 1000, 2),
+            'attrs': trace.attrs,
+            'spans': list(trace.spans)
+        }
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._stats['dropped'] += 1
+
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name='trace-writer', daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handler = RotatingFileHandler(
+            self.path, maxBytes=self.max_bytes, backupCount=self.backups, encoding='utf-8'
+        )
+        while True:
+            record = self._queue.get()
+            try:
+                line = orjson.dumps(record, default=str).decode('utf-8')
+                handler.emit(logging.makeLogRecord({'msg': line}))
+                self._stats['written'] += 1
+            except Exception as e:
+                logger.error("Failed to write trace: %s", e)
+
+    def stats(self) -> Dict:
+        """監視用の統計情報"""
+        return dict(
+            self._stats,
+            enabled=self.enabled,
+            sample_rate=self.sample_rate,
+            queued=self._queue.qsize(),
+            path=self.path
+        )
+
+# アプリ全体で共有するトレーサー
+tracer = Tracer()
@@ -0,0 +1,397 @@
+import os
+import mmap
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# インデックスの1行: [offset, length, ts, session, pair, location, speaker, time_bucket]
+OFFSET, LENGTH, TS, SESSION, PAIR, LOCATION, SPEAKER, BUCKET = range(8)
+INDEXED_FIELDS = {
+    'session_id': SESSION,
+    'pair': PAIR,
+    'location': LOCATION,
+    'speaker': SPEAKER,
+    'time_bucket': BUCKET
+}
+
+class _Segment:
+    """1つのセグメントファイル（JSONL）と、その中の発言の位置"""
+
+    def __init__(self, number: int, directory: str):
+        self.number = number
+        self.path = os.path.join(directory, f'segment-{number:06d}.jsonl')
+        self.index_path = os.path.join(directory, f'segment-{number:06d}.idx')
+        self.size = 0
+        self._map: Optional[mmap.mmap] = None
+        self._map_lock = threading.Lock()
+
+    def read(self, offset: int, length: int) -> bytes:
+        """メモリマップ経由で1行読む（書き足された分はマップし直す）"""
+        with self._map_lock:
+            if self._map is None or offset + length > len(self._map):
+                if self._map is not None:
+                    self._map.close()
+                with open(self.path, 'rb') as f:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return self._map[offset:offset + length]
+
+    def close(self):
+        with self._map_lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+class TranscriptStore:
+    """生成した全発言の追記専用ストア
+
+    発言はサイズ上限付きのセグメントファイルにJSONLで追記し、fsyncはまとめて行う。
+    セッション・ペア・場所・話者・時間帯からバイト位置を引くインデックスをメモリに持ち
+    （セグメントごとの .idx ファイルに保存）、本文はメモリマップで必要な行だけ読む。
+    追記はキューに積むだけで、書き込みは専用スレッドが行う。
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.enabled = os.getenv('TRANSCRIPT_ENABLED', 'true') == 'true'
+        self.directory = directory or os.getenv('TRANSCRIPT_DIR', 'data/transcripts')
+        self.segment_bytes = int(os.getenv('TRANSCRIPT_SEGMENT_BYTES', str(16 * 1024 * 1024)))
+        self.fsync_interval = float(os.getenv('TRANSCRIPT_FSYNC_INTERVAL', '1.0'))
+        self.batch_size = int(os.getenv('TRANSCRIPT_BATCH_SIZE', '256'))
+
+        self._segments: List[_Segment] = []
+        # (セグメント番号, インデックス行) を書き込み順に並べたもの
+        self._entries: List[Tuple[int, list]] = []
+        self._postings: Dict[int, Dict[str, List[int]]] = {field: {} for field in INDEXED_FIELDS.values()}
+        self._lock = threading.RLock()
+
+        self._queue: queue.Queue = queue.Queue(maxsize=int(os.getenv('TRANSCRIPT_QUEUE_SIZE', '10000')))
+        self._stats = {'appended': 0, 'dropped': 0, 'fsyncs': 0, 'recovered': 0}
+        self._thread: Optional[threading.Thread] = None
+
+        if not self.enabled:
+            logger.info("Transcript store disabled")
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+        self._thread = threading.Thread(target=self._write_loop, name='transcript-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---- 書き込み ----
+
+    def append(self, record: Dict):
+        """発言を1件追記する（キューに積むだけで待たない）"""
+        if not self.enabled:
+            return
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._stats['dropped'] += 1
+
+    def _write_loop(self):
+        data_file = index_file = None
+        last_fsync = time.monotonic()
+        dirty = False
+        closing = False
+
+        while not closing:
+            try:
+                batch = [self._queue.get(timeout=self.fsync_interval)]
+            except queue.Empty:
+                batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            waiters = [r for r in batch if isinstance(r, threading.Event)]
+            if None in batch:
+                closing = True
+            batch = [r for r in batch if isinstance(r, dict)]
+
+            try:
+                data_file, index_file, wrote = self._write_batch(batch, data_file, index_file)
+            except OSError as e:
+                logger.error("Failed to write transcripts: %s", e)
+                wrote = False
+            dirty = dirty or wrote
+            for waiter in waiters:
+                waiter.set()
+
+            if dirty and data_file is not None and (
+                closing or time.monotonic() - last_fsync >= self.fsync_interval
+            ):
+                self._sync(data_file, index_file)
+                last_fsync = time.monotonic()
+                dirty = False
+
+        if data_file is not None:
+            self._sync(data_file, index_file)
+            data_file.close()
+            index_file.close()
+
+    def _write_batch(self, batch: List[Dict], data_file, index_file):
+        """まとめて書き込み、開いているファイルと書いたかどうかを返す"""
+        pending: List[Tuple[int, list]] = []
+        for record in batch:
+            try:
+                line = orjson.dumps(record, default=str) + b'\n'
+            except Exception as e:
+                logger.error("Failed to serialize transcript record: %s", e)
+                continue
+
+            segment = self._segments[-1] if self._segments else None
+            if segment is None or (segment.size and segment.size + len(line) > self.segment_bytes):
+                if data_file is not None:
+                    self._sync(data_file, index_file)
+                    data_file.close()
+                    index_file.close()
+                segment = self._open_segment()
+                data_file = index_file = None
+            if data_file is None:
+                data_file = open(segment.path, 'ab')
+                index_file = open(segment.index_path, 'ab')
+
+            row = self._index_row(record, segment.size, len(line))
+            data_file.write(line)
+            index_file.write(orjson.dumps(row) + b'\n')
+            segment.size += len(line)
+            pending.append((segment.number, row))
+
+        if pending:
+            # 本文をファイルに出してから索引に載せる（読み手が未書き込みの位置を引かない）
+            data_file.flush()
+            index_file.flush()
+            self._publish(pending)
+        return data_file, index_file, bool(pending)
+
+    def _sync(self, data_file, index_file):
+        data_file.flush()
+        index_file.flush()
+        os.fsync(data_file.fileno())
+        os.fsync(index_file.fileno())
+        self._stats['fsyncs'] += 1
+
+    def _open_segment(self) -> _Segment:
+        number = self._segments[-1].number + 1 if self._segments else 1
+        segment = _Segment(number, self.directory)
+        with self._lock:
+            self._segments.append(segment)
+        return segment
+
+    @staticmethod
+    def _index_row(record: Dict, offset: int, length: int) -> list:
+        timestamp = record.get('timestamp')
+        try:
+            ts = datetime.fromisoformat(timestamp).timestamp() if timestamp else time.time()
+        except (TypeError, ValueError):
+            ts = time.time()
+        return [
+            offset, length, round(ts, 3),
+            record.get('session_id') or '',
+            record.get('pair') or '',
+            record.get('location_id') or record.get('location') or '',
+            record.get('speaker') or '',
+            record.get('time_bucket') or ''
+        ]
+
+    def _publish(self, rows: List[Tuple[int, list]]):
+        with self._lock:
+            for number, row in rows:
+                entry_id = len(self._entries)
+                self._entries.append((number, row))
+                for field in INDEXED_FIELDS.values():
+                    if row[field]:
+                        self._postings[field].setdefault(row[field], []).append(entry_id)
+            self._stats['appended'] += len(rows)
+
+    # ---- 起動時の読み込み ----
+
+    def _load(self):
+        """既存のセグメントとインデックスを読み込む（インデックスが足りなければ本文から補う）"""
+        numbers = sorted(
+            int(name[len('segment-'):-len('.jsonl')])
+            for name in os.listdir(self.directory)
+            if name.startswith('segment-') and name.endswith('.jsonl')
+        )
+        rows = []
+        for number in numbers:
+            segment = _Segment(number, self.directory)
+            segment.size = os.path.getsize(segment.path)
+            self._segments.append(segment)
+
+            indexed = []
+            end = 0
+            damaged = False
+            if os.path.exists(segment.index_path):
+                with open(segment.index_path, 'rb') as f:
+                    for line in f:
+                        try:
+                            row = orjson.loads(line)
+                        except orjson.JSONDecodeError:
+                            damaged = True
+                            break
+                        # fsync前に落ちて本文が欠けた行は捨てる
+                        if row[OFFSET] + row[LENGTH] > segment.size:
+                            damaged = True
+                            break
+                        indexed.append((number, row))
+                        end = row[OFFSET] + row[LENGTH]
+            if damaged or end < segment.size:
+                indexed.extend(self._recover(segment, end, indexed))
+            rows.extend(indexed)
+
+        self._publish(rows)
+        self._stats['appended'] = 0
+        if rows:
+            logger.info("Loaded %s transcript lines from %s segments", len(rows), len(numbers))
+
+    def _recover(
+        self,
+        segment: _Segment,
+        start: int,
+        indexed: List[Tuple[int, list]]
+    ) -> List[Tuple[int, list]]:
+        """インデックスに無い本文の行を読み直し、インデックスを作り直す
+
+        書きかけで途切れた末尾の行は切り捨てる（続きの追記と混ざらないように）
+        """
+        rows = []
+        offset = start
+        with open(segment.path, 'rb') as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    rows.append((segment.number, self._index_row(orjson.loads(line), offset, len(line))))
+                except orjson.JSONDecodeError:
+                    pass
+                offset += len(line)
+        if offset < segment.size:
+            os.truncate(segment.path, offset)
+            segment.size = offset
+
+        temp_path = segment.index_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            for _, row in indexed + rows:
+                f.write(orjson.dumps(row) + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, segment.index_path)
+
+        self._stats['recovered'] += len(rows)
+        logger.warning("Rebuilt index for %s (%s unindexed lines recovered)", segment.path, len(rows))
+        return rows
+
+    # ---- 読み出し ----
+
+    def query(
+        self,
+        limit: int = 100,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        newest_first: bool = True,
+        **filters: str
+    ) -> List[Dict]:
+        """条件に合う発言を返す（filtersは session_id / pair / location / speaker / time_bucket）"""
+        results = []
+        for record in self.iter_query(since=since, until=until, newest_first=newest_first, **filters):
+            results.append(record)
+            if len(results) >= limit:
+                break
+        return results
+
+    def iter_query(
+        self,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        newest_first: bool = True,
+        **filters: str
+    ) -> Iterator[Dict]:
+        """条件に合う発言を順に読む（一番絞り込めるインデックスから候補を取る）"""
+        unknown = set(filters) - set(INDEXED_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown transcript filters: {sorted(unknown)}")
+        conditions = [(INDEXED_FIELDS[k], v) for k, v in filters.items() if v]
+
+        with self._lock:
+            if conditions:
+                lists = [self._postings[field].get(value, []) for field, value in conditions]
+                candidates = min(lists, key=len)
+            else:
+                candidates = range(len(self._entries))
+            count = len(candidates)
+            entries = self._entries
+            segments = {s.number: s for s in self._segments}
+
+        order = range(count - 1, -1, -1) if newest_first else range(count)
+        for i in order:
+            segment_number, row = entries[candidates[i]]
+            if any(row[field] != value for field, value in conditions):
+                continue
+            if since is not None and row[TS] < since:
+                continue
+            if until is not None and row[TS] >= until:
+                continue
+            yield orjson.loads(segments[segment_number].read(row[OFFSET], row[LENGTH]))
+
+    def conversations(self) -> List[Dict]:
+        """記録済みの会話の一覧（インデックスだけから作り、本文は読まない）"""
+        with self._lock:
+            summaries = []
+            for session_id, ids in self._postings[SESSION].items():
+                _, first = self._entries[ids[0]]
+                summaries.append({
+                    'session_id': session_id,
+                    'pair': first[PAIR],
+                    'location': first[LOCATION],
+                    'time_bucket': first[BUCKET],
+                    'started': first[TS],
+                    'lines': len(ids)
+                })
+        return summaries
+
+    def keys(self, field: str) -> Dict[str, int]:
+        """インデックスに載っている値と件数（場所やペアの一覧用）"""
+        with self._lock:
+            return {value: len(ids) for value, ids in self._postings[INDEXED_FIELDS[field]].items()}
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """それまでに追記した分が読めるようになるまで待つ"""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done, timeout=timeout)
+        return done.wait(timeout)
+
+    def close(self):
+        """残りを書き出して書き込みスレッドを止める"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        self._thread = None
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+
+    def stats(self) -> Dict:
+        """監視用の統計情報"""
+        with self._lock:
+            return dict(
+                self._stats,
+                enabled=self.enabled,
+                lines=len(self._entries),
+                segments=len(self._segments),
+                bytes=sum(s.size for s in self._segments),
+                queued=self._queue.qsize(),
+                sessions=len(self._postings[SESSION])
+            )
@@ -0,0 +1,224 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+from services.session_store import SessionStore
+from services.scheduler import PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+class WarmPool:
+    """(エージェントの組, 場所) ごとに会話の出だしを先に生成して貯めておく
+
+    LLMが空いている間にバックグラウンドで補充し、1ターン目はここから即座に返す。
+    1エントリは generate_conversation_async で作った最初の数ターン分の応答dictのリスト。
+    """
+
+    def __init__(self, dialog_service):
+        self.dialog_service = dialog_service
+        self.enabled = os.getenv('WARM_POOL', 'true') == 'true'
+        self.depth = int(os.getenv('WARM_POOL_DEPTH', '2'))
+        self.max_total = int(os.getenv('WARM_POOL_MAX_TOTAL', '200'))
+        self.calls_per_hour = int(os.getenv('WARM_POOL_CALLS_PER_HOUR', '300'))
+        self.exchange_turns = int(os.getenv('WARM_POOL_TURNS', '2'))
+        self.ttl_seconds = float(os.getenv('WARM_POOL_TTL', '3600'))
+        self.idle_threshold = int(os.getenv(
+            'WARM_POOL_IDLE_THRESHOLD',
+            str(max(1, dialog_service.llm_service.max_concurrency // 2))
+        ))
+        self.context = os.getenv('WARM_POOL_CONTEXT', '夏祭りで出会いました。')
+
+        # (pair_key, location_id) -> deque[{'lines', 'time_bucket', 'created'}]
+        self._reservoir: Dict[Tuple[str, str], deque] = {}
+        # 設定が変わるたびに増やし、それより前に始めた補充の結果は捨てる
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._call_times: deque = deque()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._served = 0
+        self._empty = 0
+        self._generated = 0
+        self._stale = 0
+        self._offered = 0
+        self._invalidated = 0
+
+    def start(self):
+        """補充用のバックグラウンドスレッドを起動"""
+        if not self.enabled or not self.dialog_service.llm_service.online_mode:
+            logger.info("Warm pool disabled")
+            return
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='warm-pool', daemon=True)
+        self._thread.start()
+        logger.info("Warm pool started (depth=%s, max_total=%s)", self.depth, self.max_total)
+
+    def stop(self):
+        self._stop.set()
+
+    def draw(self, agent_ids: List[str], location: str, context: str) -> Optional[List[Dict]]:
+        """会話の出だしを1つ取り出す（なければNone）"""
+        if not self.enabled or (context and context != self.context):
+            return None
+
+        key = self._key(agent_ids, location)
+        bucket = self.dialog_service.get_time_bucket()
+        now = time.monotonic()
+
+        with self._lock:
+            entries = self._reservoir.get(key)
+            while entries:
+                entry = entries.popleft()
+                if self._usable(entry, bucket, now):
+                    self._served += 1
+                    return entry['lines']
+                self._stale += 1
+            self._empty += 1
+            return None
+
+    def offer(self, agent_ids: List[str], location: str, lines: List[Dict]) -> bool:
+        """締め切りに間に合わなかった生成結果などを出だしとして預かる（空きが無ければFalse）"""
+        if not self.enabled or not lines:
+            return False
+
+        key = self._key(agent_ids, location)
+        with self._lock:
+            entries = self._reservoir.setdefault(key, deque())
+            if len(entries) >= self.depth or sum(len(d) for d in self._reservoir.values()) >= self.max_total:
+                return False
+            entries.append({
+                'lines': lines,
+                'time_bucket': self.dialog_service.get_time_bucket(),
+                'created': time.monotonic()
+            })
+            self._offered += 1
+            return True
+
+    def invalidate(self):
+        """貯めた出だしを全て捨てる（エージェント・場所の設定が変わったとき）"""
+        with self._lock:
+            dropped = sum(len(d) for d in self._reservoir.values())
+            self._reservoir.clear()
+            self._generation += 1
+            self._invalidated += dropped
+        if dropped:
+            logger.info("Warm pool invalidated %d openings after a config change", dropped)
+
+    def _key(self, agent_ids: List[str], location: str) -> Tuple[str, str]:
+        return (
+            SessionStore.pair_key(agent_ids),
+            self.dialog_service.location_service.resolve_location_id(location)
+        )
+
+    def _combinations(self) -> List[Tuple[List[str], str]]:
+        """補充対象となる全ての (エージェントの組, 場所の表示名)"""
+        locations = self.dialog_service.location_service.get_all_locations()
+        return [
+            (list(pair), location.get('display_name', location_id))
+            for pair in combinations(sorted(self.dialog_service.agents), 2)
+            for location_id, location in locations.items()
+        ]
+
+    def _next_target(self) -> Optional[Tuple[List[str], str]]:
+        """最も残りの少ない組み合わせを選ぶ（全体上限・深さを満たしていればNone）
+
+        時間帯が変わった・期限切れで draw() が捨てる出だしは、数える前にここで捨てる。
+        """
+        with self._lock:
+            self._purge()
+            if sum(len(d) for d in self._reservoir.values()) >= self.max_total:
+                return None
+            best, best_count = None, self.depth
+            for agent_ids, location in self._combinations():
+                count = len(self._reservoir.get(self._key(agent_ids, location), ()))
+                if count < best_count:
+                    best, best_count = (agent_ids, location), count
+            return best
+
+    def _purge(self):
+        """draw() が受け付けない出だしを捨てる（ロック保持中に呼ぶ）"""
+        bucket = self.dialog_service.get_time_bucket()
+        now = time.monotonic()
+        for key in list(self._reservoir):
+            entries = self._reservoir[key]
+            fresh = [e for e in entries if self._usable(e, bucket, now)]
+            self._stale += len(entries) - len(fresh)
+            if fresh:
+                self._reservoir[key] = deque(fresh)
+            else:
+                del self._reservoir[key]
+
+    def _usable(self, entry: Dict, bucket: str, now: float) -> bool:
+        return entry['time_bucket'] == bucket and now - entry['created'] < self.ttl_seconds
+
+    def _within_budget(self) -> bool:
+        now = time.monotonic()
+        while self._call_times and now - self._call_times[0] > 3600:
+            self._call_times.popleft()
+        return len(self._call_times) < self.calls_per_hour
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if (
+                    self.dialog_service.llm_service.in_flight >= self.idle_threshold
+                    or not self._within_budget()
+                ):
+                    self._stop.wait(1.0)
+                    continue
+
+                target = self._next_target()
+                if target is None:
+                    self._stop.wait(5.0)
+                    continue
+
+                self._refill(*target)
+            except Exception as e:
+                logger.error("Warm pool refill failed: %s", e)
+                self._stop.wait(5.0)
+
+    def _refill(self, agent_ids: List[str], location: str):
+        self._call_times.append(time.monotonic())
+        bucket = self.dialog_service.get_time_bucket()
+        generation = self._generation
+        lines = self.dialog_service.generate_conversation_async(
+            agent_ids=agent_ids,
+            context=self.context,
+            location=location,
+            turns=self.exchange_turns,
+            fallback=False,
+            priority=PRIORITY_BACKGROUND,
+            fair_key='warm_pool'
+        ).result()
+
+        with self._lock:
+            if generation != self._generation:
+                return  # 生成中に設定が変わった
+            self._reservoir.setdefault(self._key(agent_ids, location), deque()).append({
+                'lines': lines,
+                'time_bucket': bucket,
+                'created': time.monotonic()
+            })
+            self._generated += 1
+        logger.debug("Warm pool refilled %s at %s", agent_ids, location)
+
+    def stats(self) -> Dict:
+        """監視用の統計情報"""
+        with self._lock:
+            return {
+                'enabled': self.enabled and self._thread is not None,
+                'size': sum(len(d) for d in self._reservoir.values()),
+                'keys': len(self._reservoir),
+                'served': self._served,
+                'empty': self._empty,
+                'stale': self._stale,
+                'generated': self._generated,
+                'offered': self._offered,
+                'invalidated': self._invalidated,
+                'calls_last_hour': len(self._call_times)
+            }
@@ -0,0 +1,48 @@
+import os
+import sys
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+
+# サービスは server/ を基準に `services.xxx` で読み込む
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.conversation_memory import ConversationMemory
+from services.response_cache import ResponseCache
+from services.token_counter import TokenCounter
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config')
+
+class FakeLLM:
+    """DialogService から見える LLMService の代役
+
+    既定では即座に 'LLMの発言です' を返す。テストごとに必要なメソッドだけ差し替える
+    """
+
+    max_concurrency = 4
+    online_mode = True
+
+    def __init__(self):
+        self.offline_engine = None
+        self.response_cache = ResponseCache()
+        self.memory = ConversationMemory(TokenCounter('gpt-4o-mini'))
+        self.scheduler = SimpleNamespace(promote=lambda key: None)
+        self.compiled = 0
+
+    def compile_prompts(self, agents):
+        self.compiled += 1
+
+    def generate_response_async(self, agent_data, context, history, location, **kwargs):
+        future = Future()
+        future.set_result(SimpleNamespace(text='LLMの発言です', source='llm'))
+        return future
+
+@pytest.fixture
+def fake_llm():
+    return FakeLLM()
+
+@pytest.fixture
+def config_dir():
+    """リポジトリ同梱の設定ディレクトリ"""
+    return CONFIG_DIR
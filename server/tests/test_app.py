@@ -0,0 +1,54 @@
+import importlib
+
+import pytest
+
+for module in ('flask', 'flask_socketio', 'flask_cors', 'dotenv', 'orjson', 'openai', 'httpx'):
+    pytest.importorskip(module)
+
+@pytest.fixture(scope='module')
+def app_module(tmp_path_factory):
+    """オフラインモードで、ファイルを書き出さない設定のアプリを読み込む"""
+    logs = tmp_path_factory.mktemp('logs')
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('ONLINE', 'false')
+        mp.setenv('WARM_POOL', 'false')
+        mp.setenv('REPLAY', 'false')
+        mp.setenv('TRANSCRIPT_ENABLED', 'false')
+        mp.setenv('TRACE_ENABLED', 'false')
+        mp.setenv('LOG_CONSOLE', 'false')
+        mp.setenv('LOG_FILE', str(logs / 'app.log'))
+        # トレーサーは他のテストの収集時に作られていることがある
+        mp.setattr(importlib.import_module('services.tracing').tracer, 'enabled', False)
+        yield importlib.import_module('app')
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+AGENTS = ['alpha', 'beta']
+
+def test_idempotency_keys_are_scoped_per_endpoint(client):
+    headers = {'Idempotency-Key': 'shared-key'}
+    turn = client.post('/dialog/turn', json={'agent_ids': AGENTS, 'turn': 1}, headers=headers)
+    assert turn.status_code == 200
+
+    # 同じキーでも別のエンドポイントでは /dialog/turn の結果を返さない
+    conversation = client.post(
+        '/dialog/conversation', json={'agent_ids': AGENTS, 'turns': 2}, headers=headers
+    )
+    assert conversation.status_code == 200
+    assert len(conversation.get_json()['turns']) == 2
+
+    again = client.post('/dialog/turn', json={'agent_ids': AGENTS, 'turn': 1}, headers=headers)
+    assert again.get_json() == turn.get_json()
+
+@pytest.mark.parametrize('turns', ['3', 2.5, True, None])
+def test_conversation_rejects_non_integer_turns(client, turns):
+    response = client.post('/dialog/conversation', json={'agent_ids': AGENTS, 'turns': turns})
+    assert response.status_code == 400
+
+@pytest.mark.parametrize('turns, expected', [(10_000, 6), (0, 1), (-3, 1), (2, 2)])
+def test_conversation_turns_are_clamped_to_max_turns(client, turns, expected):
+    response = client.post('/dialog/conversation', json={'agent_ids': AGENTS, 'turns': turns})
+    assert response.status_code == 200
+    assert len(response.get_json()['turns']) == expected
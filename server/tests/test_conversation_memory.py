@@ -0,0 +1,73 @@
+import pytest
+
+from services.conversation_memory import ConversationMemory
+from services.token_counter import TOKENS_PER_MESSAGE
+
+class _CharCounter:
+    """1文字1トークンで数える（tiktokenの有無に左右されない）"""
+
+    def count(self, text):
+        return len(text or '')
+
+def _history(count, speaker='alpha'):
+    return [
+        {'speaker': speaker, 'speaker_name': 'アルファ', 'text': f'発言{turn}です', 'turn': turn}
+        for turn in range(1, count + 1)
+    ]
+
+@pytest.fixture
+def memory(monkeypatch):
+    # 自分の発言は1件 3 + 5 = 8 トークン、予算20なら直近2件まで
+    monkeypatch.setenv('MEMORY_TOKEN_BUDGET', '20')
+    monkeypatch.setenv('MEMORY_SUMMARY_TOKENS', '80')
+    return ConversationMemory(_CharCounter())
+
+def test_recent_window_fits_the_token_budget(memory):
+    messages = memory.history_messages('alpha', _history(5), 's1')
+
+    assert messages[1:] == [
+        {'role': 'assistant', 'content': '発言4です'},
+        {'role': 'assistant', 'content': '発言5です'}
+    ]
+    # 予算からあふれた古い発言は要約に畳み込む
+    assert messages[0] == {
+        'role': 'system',
+        'content': 'これまでの会話の要約：アルファ「発言1です」 / アルファ「発言2です」 / アルファ「発言3です」'
+    }
+    assert memory.stats()['avg_history_tokens'] == 2 * (TOKENS_PER_MESSAGE + 5)
+
+def test_other_speakers_are_sent_as_user_messages(memory):
+    messages = memory.history_messages('beta', _history(1), 's1')
+
+    assert messages == [{'role': 'user', 'content': 'アルファ：発言1です'}]
+
+def test_newest_line_is_kept_even_over_budget(memory):
+    history = [{'speaker': 'alpha', 'text': 'あ' * 50, 'turn': 1}]
+
+    assert memory.history_messages('alpha', history, 's1') == [{'role': 'assistant', 'content': 'あ' * 50}]
+
+def test_summary_is_folded_once_and_trimmed_to_its_budget(monkeypatch):
+    monkeypatch.setenv('MEMORY_TOKEN_BUDGET', '20')
+    monkeypatch.setenv('MEMORY_SUMMARY_TOKENS', '30')
+    memory = ConversationMemory(_CharCounter())
+    history = _history(4)
+    memory.history_messages('alpha', history, 's1')
+
+    history += _history(8)[4:]
+    summary = memory.history_messages('alpha', history, 's1')[0]['content']
+
+    # 畳み込み済みのターンは数え直さず、予算を超えた古い断片から捨てる
+    assert memory.stats()['folded_turns'] == 6
+    assert summary == 'これまでの会話の要約：アルファ「発言5です」 / アルファ「発言6です」'
+
+def test_pair_notes_keep_the_latest_conversations(monkeypatch):
+    monkeypatch.setenv('MEMORY_NOTES_PER_PAIR', '2')
+    memory = ConversationMemory(_CharCounter())
+    for count in (1, 2, 3):
+        memory.record_pair('alpha-beta', _history(count), '射的')
+
+    notes = memory.pair_notes('alpha-beta')
+
+    assert notes.count('前に射的で') == 2
+    assert '1回やりとり' not in notes
+    assert memory.pair_notes('alpha-gamma') == ''
@@ -0,0 +1,28 @@
+import json
+import shutil
+
+import pytest
+
+from services.config_store import ConfigStore
+from services.dialog_service import DialogService
+
+@pytest.fixture
+def config_copy(config_dir, tmp_path):
+    shutil.copytree(config_dir, tmp_path / 'config')
+    return tmp_path / 'config'
+
+def test_agents_reload_invalidates_warm_pool_and_offline_tables(fake_llm, config_copy, monkeypatch):
+    monkeypatch.setenv('WARM_POOL', 'true')
+    store = ConfigStore(str(config_copy))
+    dialog = DialogService(llm_service=fake_llm, config_store=store)
+    line = {'speaker': 'alpha', 'speaker_name': 'アルファ', 'text': '古い口調です', 'turn': 1}
+    assert dialog.warm_pool.offer(['alpha', 'beta'], '夏祭り会場', [line])
+
+    data = json.loads((config_copy / 'agents.json').read_text(encoding='utf-8'))
+    data['agents'][0]['greeting_patterns'] = ['新しい挨拶だよ']
+    (config_copy / 'agents.json').write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+    assert store.reload(['agents']) == ['agents']
+
+    assert dialog.warm_pool.draw(['alpha', 'beta'], '夏祭り会場', '') is None
+    assert dialog.warm_pool.stats()['invalidated'] == 1
+    assert dialog.offline_engine.generate('alpha', '', opening=True) == '新しい挨拶だよ'
@@ -0,0 +1,94 @@
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+
+from services.config_store import ConfigStore
+from services.dialog_service import DialogService
+
+@pytest.fixture
+def dialog(fake_llm, config_dir, monkeypatch):
+    """途中まで文字を渡したところで止まるLLMを使う"""
+    monkeypatch.setenv('WARM_POOL', 'false')
+    fake_llm.pending = []
+
+    def generate_response_async(agent_data, context, history, location, on_delta=None, **kwargs):
+        if on_delta is not None:
+            on_delta('わぁ、')
+        future = Future()
+        fake_llm.pending.append(future)
+        return future
+
+    fake_llm.generate_response_async = generate_response_async
+    return DialogService(llm_service=fake_llm, config_store=ConfigStore(config_dir))
+
+def _turn(dialog, deltas, on_delta=True):
+    agent_ids = sorted(dialog.agents)[:2]
+    return dialog.generate_session_turn(
+        session_id='s1',
+        agent_ids=agent_ids,
+        turn=1,
+        context='',
+        location='夏祭り会場',
+        history=[],
+        on_delta=deltas.append if on_delta else None,
+        deadline=0.05
+    )
+
+def test_deadline_after_partial_stream_replaces_the_shown_text(dialog):
+    deltas = []
+    response = _turn(dialog, deltas).result(timeout=2)
+
+    assert deltas[0]['delta'] == 'わぁ、'
+    # 代わりの発言は継ぎ足しではなく置き換えとして送る
+    assert deltas[-1] == {
+        'speaker': response['speaker'],
+        'speaker_name': response['speaker_name'],
+        'turn': 1,
+        'delta': response['text'],
+        'replace': True
+    }
+    assert response['source'] in ('cache', 'offline', 'fallback')
+    assert dialog.deadline_stats()['missed'] == 1
+
+def test_deltas_after_the_deadline_are_dropped(dialog):
+    deltas = []
+    _turn(dialog, deltas).result(timeout=2)
+    shown = len(deltas)
+
+    # 締め切り後に届いた生成結果は表示に流さない
+    dialog.llm_service.pending[0].set_result(SimpleNamespace(text='わぁ、屋台がいっぱい！', source='llm'))
+    assert len(deltas) == shown
+
+def test_late_llm_result_is_backfilled_into_the_warm_pool(dialog):
+    dialog.warm_pool.enabled = True
+    _turn(dialog, []).result(timeout=2)
+
+    dialog.llm_service.pending[0].set_result(SimpleNamespace(text='わぁ、屋台がいっぱい！', source='llm'))
+    assert dialog.deadline_stats()['backfilled_pool'] == 1
+    agent_ids = sorted(dialog.agents)[:2]
+    assert dialog.warm_pool.draw(agent_ids, '夏祭り会場', '')[0]['text'] == 'わぁ、屋台がいっぱい！'
+
+def test_late_fallback_is_not_backfilled_into_the_warm_pool(dialog):
+    dialog.warm_pool.enabled = True
+    _turn(dialog, []).result(timeout=2)
+
+    # 生成に失敗して代わりの発言になった結果は、別の組に配られないようプールに入れない
+    dialog.llm_service.pending[0].set_exception(RuntimeError('LLM failed'))
+    assert dialog.warm_pool.stats()['offered'] == 0
+    assert dialog.deadline_stats()['late_discarded'] == 1
+    agent_ids = sorted(dialog.agents)[:2]
+    assert dialog.warm_pool.draw(agent_ids, '夏祭り会場', '') is None
+
+def test_failing_deadline_fallback_still_resolves_the_turn(dialog, monkeypatch):
+    def _broken(*args):
+        raise KeyError('speaker')
+
+    monkeypatch.setattr(dialog, '_deadline_fallback', _broken)
+    deltas = []
+    response = _turn(dialog, deltas).result(timeout=2)
+
+    # 代わりの発言を作れなくても、待っているリクエストを止めない
+    assert response['source'] == 'fallback'
+    assert deltas[-1]['delta'] == response['text']
+    assert dialog.deadline_stats()['missed'] == 1
@@ -0,0 +1,60 @@
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+
+from services.config_store import ConfigStore
+from services.dialog_service import DialogService
+from services.scheduler import PRIORITY_BACKGROUND, QueueFull
+
+@pytest.fixture
+def dialog(fake_llm, config_dir, monkeypatch):
+    """バックグラウンドの仕事だけ断る（混雑時のスケジューラと同じ振る舞い）"""
+    monkeypatch.setenv('WARM_POOL', 'false')
+    fake_llm.calls = []
+
+    def generate_response_async(agent_data, context, history, location, priority, **kwargs):
+        fake_llm.calls.append(priority)
+        future = Future()
+        if priority >= PRIORITY_BACKGROUND:
+            future.set_exception(QueueFull("Scheduler queue is full"))
+        else:
+            future.set_result(SimpleNamespace(text='LLMの発言です', source='llm'))
+        return future
+
+    fake_llm.generate_response_async = generate_response_async
+    return DialogService(llm_service=fake_llm, config_store=ConfigStore(config_dir))
+
+def test_shed_prefetch_falls_through_to_live_generation(dialog):
+    agent_ids = sorted(dialog.agents)[:2]
+    history = [{'speaker': agent_ids[0], 'text': 'こんにちは', 'turn': 1}]
+    dialog.prefetch_next('s1', agent_ids, 1, '', '夏祭り会場', history)
+
+    response = dialog.generate_session_turn('s1', agent_ids, 2, '', '夏祭り会場', history).result(timeout=2)
+
+    # 断られた先読みの代わりにオフラインの発言を出さず、表示時に生成し直す
+    assert response['text'] == 'LLMの発言です'
+    assert response['source'] == 'llm'
+    assert dialog.llm_service.calls == [PRIORITY_BACKGROUND, 0]
+    assert dialog.prefetch_stats()['hits'] == 0
+
+def test_prefetched_turn_is_streamed_as_one_delta(fake_llm, config_dir, monkeypatch):
+    monkeypatch.setenv('WARM_POOL', 'false')
+    dialog = DialogService(llm_service=fake_llm, config_store=ConfigStore(config_dir))
+    agent_ids = sorted(dialog.agents)[:2]
+    history = [{'speaker': agent_ids[0], 'text': 'こんにちは', 'turn': 1}]
+    dialog.prefetch_next('s1', agent_ids, 1, '', '夏祭り会場', history)
+
+    deltas = []
+    response = dialog.generate_session_turn(
+        's1', agent_ids, 2, '', '夏祭り会場', history, on_delta=deltas.append
+    ).result(timeout=2)
+
+    # 先読み済みのターンもウォームプール・再生と同じく全文を1つの差分で送る
+    assert dialog.prefetch_stats()['hits'] == 1
+    assert deltas == [{
+        'speaker': response['speaker'],
+        'speaker_name': response['speaker_name'],
+        'turn': 2,
+        'delta': response['text']
+    }]
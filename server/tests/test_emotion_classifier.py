@@ -0,0 +1,47 @@
+import pytest
+
+from services.emotion_classifier import EmotionClassifier
+
+AGENTS = {
+    'alpha': {'id': 'alpha'},
+    'beta': {'id': 'beta', 'emotion_lexicon': {'happy': {'悪くない': 1.0}, 'sad': ['はぁ']}}
+}
+
+@pytest.fixture
+def classifier():
+    return EmotionClassifier(agents=AGENTS)
+
+@pytest.mark.parametrize('text, emotion', [
+    ('今日は楽しいですね♪', 'happy'),
+    ('もう帰るの？寂しいな', 'sad'),
+    ('順番抜かされてイライラする', 'angry'),
+    ('え？もう花火始まったの', 'surprised'),
+    ('たこ焼きを買いに行きましょう', 'neutral'),
+    ('', 'neutral'),
+])
+def test_known_inputs(classifier, text, emotion):
+    assert classifier.classify(text) == emotion
+
+def test_weights_are_summed_across_matches(classifier):
+    # 「わぁ」「♪」は0.5ずつ、「悲しい」は1.0
+    assert classifier.scores('わぁ♪悲しい') == {'happy': 1.0, 'sad': 1.0}
+    assert classifier.classify('わぁ、悲しい') == 'sad'
+
+def test_ties_prefer_the_emotion_order(classifier):
+    assert classifier.classify('楽しいけど悲しい') == 'happy'
+    assert classifier.classify('悲しいし腹が立つ、怒るよ') == 'sad'
+
+def test_agent_lexicon_extends_the_shared_one(classifier):
+    assert classifier.classify('まあ、悪くないね', 'beta') == 'happy'
+    assert classifier.classify('はぁ…', 'beta') == 'sad'
+    assert classifier.classify('まあ、悪くないね', 'alpha') == 'neutral'
+    # 共有の語彙はそのまま使える
+    assert classifier.classify('嬉しい', 'beta') == 'happy'
+
+def test_classify_many_matches_classify(classifier):
+    texts = ['楽しい！', 'はぁ', 'え？', 'こんにちは']
+    speakers = ['alpha', 'beta', 'beta', None]
+
+    assert classifier.classify_many(texts, speakers) == [
+        classifier.classify(text, speaker) for text, speaker in zip(texts, speakers)
+    ]
@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('openai')
+
+from services.llm_resilience import CircuitBreaker, ResilientCaller, TokenRateLimiter, hedge_slots
+
+@pytest.fixture
+def caller(monkeypatch):
+    monkeypatch.setenv('LLM_HEDGE_MIN_SAMPLES', '5')
+    caller = ResilientCaller(4)
+    yield caller
+    caller.shutdown()
+
+def test_pool_and_hedge_workers_share_the_slot_count(caller):
+    assert caller.hedge_slots == hedge_slots(4) == 2
+    assert caller._hedge_executor._max_workers == 4 + caller.hedge_slots
+
+def test_hedge_slot_is_held_until_the_slow_primary_finishes(caller):
+    caller._latencies.extend([0.01] * 5)
+    release = threading.Event()
+    calls = []
+
+    def _fn():
+        calls.append(None)
+        if len(calls) == 1:
+            release.wait(5)
+            return 'slow'
+        return 'fast'
+
+    assert caller.call(_fn) == 'fast'
+    assert caller.stats()['hedge_wins'] == 1
+    # 負けた元の呼び出しはまだ接続を使っているので、ヘッジ枠は返していない
+    assert caller._hedge_slots._value == caller.hedge_slots - 1
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while caller._hedge_slots._value != caller.hedge_slots and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert caller._hedge_slots._value == caller.hedge_slots
+
+def test_breaker_opens_after_consecutive_failures_and_probes_once(monkeypatch):
+    monkeypatch.setenv('LLM_BREAKER_FAILURES', '2')
+    monkeypatch.setenv('LLM_BREAKER_OPEN_SECONDS', '0')
+    breaker = CircuitBreaker()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+    # 待ち時間が過ぎたら1件だけ試す
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+def test_breaker_reopens_when_the_probe_fails(monkeypatch):
+    monkeypatch.setenv('LLM_BREAKER_FAILURES', '1')
+    monkeypatch.setenv('LLM_BREAKER_OPEN_SECONDS', '0')
+    breaker = CircuitBreaker()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.stats()['opened'] == 2
+
+def test_token_limiter_rejects_when_the_bucket_is_empty():
+    limiter = TokenRateLimiter(600)
+    assert limiter.acquire(600, timeout=0)
+    assert not limiter.acquire(600, timeout=0.05)
+
+def test_token_limiter_is_unlimited_at_zero():
+    limiter = TokenRateLimiter(0)
+    assert all(limiter.acquire(10_000, timeout=0) for _ in range(10))
@@ -0,0 +1,81 @@
+import pytest
+
+pytest.importorskip('httpx')
+pytest.importorskip('openai')
+pytest.importorskip('dotenv')
+
+from types import SimpleNamespace
+
+from services.llm_service import LLMService
+
+AGENT = {'id': 'alpha', 'name': 'アルファ'}
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+class _BrokenStream:
+    """2つ目の断片を渡した後に接続が切れるストリーム"""
+
+    def __iter__(self):
+        yield _chunk('わぁ、')
+        yield _chunk('屋台が')
+        raise ConnectionError('connection reset')
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setenv('ONLINE', 'false')
+    service = LLMService()
+    service.online_mode = True
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=lambda **kwargs: _BrokenStream()
+    )))
+    yield service
+    service.shutdown()
+
+def test_interrupted_stream_ends_with_the_partial_text(service):
+    deltas = []
+    reply = service.generate_response(AGENT, '', [], on_delta=deltas.append)
+
+    # 表示済みの文字列にオフライン応答を継ぎ足さない
+    assert deltas == ['わぁ、', '屋台が']
+    assert reply.text == 'わぁ、屋台が'
+    assert reply.source == 'partial'
+
+def test_stream_failing_before_any_text_falls_back_offline(service):
+    service.client.chat.completions.create = lambda **kwargs: (_ for _ in ()).throw(ConnectionError())
+    deltas = []
+    reply = service.generate_response(AGENT, '', [], on_delta=deltas.append)
+
+    assert reply.source == 'offline'
+    assert deltas == [reply.text]
+
+AGENTS = [AGENT, {'id': 'beta', 'name': 'ベータ'}]
+
+def test_parse_script_keeps_at_most_turns_lines(service):
+    content = '{"lines": [{"speaker": "alpha", "text": "こんにちは"}, {"speaker": "beta", "text": "やあ"}, {"speaker": "alpha", "text": "余分"}]}'
+
+    lines = service._parse_script(content, AGENTS, 2)
+
+    assert lines == [
+        {'speaker': 'alpha', 'text': 'こんにちは', 'source': 'llm'},
+        {'speaker': 'beta', 'text': 'やあ', 'source': 'llm'}
+    ]
+
+def test_parse_script_repairs_speakers_and_skips_bad_lines(service):
+    content = '[{"speaker": "gamma", "text": "誰？"}, "ただの文字列", {"speaker": "beta", "text": "  "}, {"text": "' + 'あ' * 60 + '"}]'
+
+    lines = service._parse_script(content, AGENTS, 6)
+
+    # 知らない話者は順番どおりのキャラクターに、空の発言と辞書でない要素は捨てる
+    assert [line['speaker'] for line in lines] == ['alpha', 'beta']
+    assert lines[0]['text'] == '誰？'
+    assert lines[1]['text'] == 'あ' * 40 + '...'
+
+def test_parse_script_without_lines_raises(service):
+    with pytest.raises(ValueError):
+        service._parse_script('{"lines": []}', AGENTS, 6)
+    with pytest.raises(ValueError):
+        service._parse_script('"台本ではない"', AGENTS, 6)
@@ -0,0 +1,65 @@
+import itertools
+import json
+
+import pytest
+
+from services.config_store import ConfigStore
+from services.location_service import LocationService
+
+def _baseline(locations, waypoint_name):
+    """以前の実装（場所を順に見て、キーワードが含まれていれば採用）"""
+    waypoint_name = waypoint_name.lower()
+    for location in locations.values():
+        for keyword in location.get('waypoint_keywords', []):
+            if keyword.lower() in waypoint_name:
+                return location
+    return locations.get('central_plaza')
+
+def _service(tmp_path, locations):
+    locations = [
+        dict(location, display_name=location['id'], context_description='テスト用の場所です。')
+        for location in locations
+    ]
+    (tmp_path / 'locations.json').write_text(json.dumps({'locations': locations}, ensure_ascii=False))
+    return LocationService(ConfigStore(str(tmp_path)))
+
+def test_shorter_keyword_of_an_earlier_location_wins(tmp_path):
+    service = _service(tmp_path, [
+        {'id': 'goldfish', 'waypoint_keywords': ['金魚']},
+        {'id': 'scooping', 'waypoint_keywords': ['金魚すくい']},
+        {'id': 'central_plaza', 'waypoint_keywords': ['広場']},
+    ])
+
+    assert service.get_location_by_waypoint_name('Waypoint_金魚すくい_01')['id'] == 'goldfish'
+    assert service.resolve_location_id('金魚すくい屋台') == 'goldfish'
+
+def test_overlapping_keywords_use_config_order(tmp_path):
+    service = _service(tmp_path, [
+        {'id': 'drink', 'waypoint_keywords': ['ドリンク']},
+        {'id': 'stand', 'waypoint_keywords': ['stand']},
+        {'id': 'central_plaza', 'waypoint_keywords': ['広場']},
+    ])
+
+    assert service.resolve_location_id('Stand_ドリンク') == 'drink'
+    assert service.resolve_location_id('Stand_Other') == 'stand'
+    assert service.resolve_location_id('nowhere') == 'central_plaza'
+
+def test_matches_the_baseline_resolver_on_the_shipped_config(config_dir):
+    service = LocationService(ConfigStore(config_dir))
+    keywords = [k for loc in service.locations.values() for k in loc.get('waypoint_keywords', [])]
+    names = ['', 'Waypoint_01', 'unknown_spot'] + [
+        f'WP_{a}_{b}' for a, b in itertools.permutations(keywords + ['x'], 2)
+    ] + [k.upper() for k in keywords]
+
+    for name in names:
+        expected = _baseline(service.locations, name)
+        assert service.get_location_by_waypoint_name(name) is expected, name
+
+@pytest.mark.parametrize('name, expected', [
+    ('takoyaki_stand', 'takoyaki_stand'),
+    ('たこ焼き屋台', 'takoyaki_stand'),
+    ('夏祭り会場', 'central_plaza'),
+])
+def test_resolve_accepts_ids_display_names_and_waypoints(config_dir, name, expected):
+    service = LocationService(ConfigStore(config_dir))
+    assert service.resolve_location_id(name) == expected
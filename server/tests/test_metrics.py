@@ -0,0 +1,40 @@
+import threading
+
+from services.metrics import SHARD_COUNT, Counter, Histogram, Registry
+
+def _run_threads(count, target):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def test_counter_sums_across_many_short_lived_threads():
+    counter = Counter('requests', 'test', ('route',))
+    _run_threads(500, lambda: counter.inc('/dialog/turn'))
+
+    assert counter.samples() == [('requests_total', ('/dialog/turn',), 500)]
+    # リクエストごとにスレッドが作られても書き込み領域は増えない
+    assert len(counter._shards) == SHARD_COUNT
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency', 'test', buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 2.0):
+        histogram.observe(value)
+
+    samples = {(name, labels): value for name, labels, value in histogram.samples()}
+    assert samples[('latency_bucket', ('0.1',))] == 1
+    assert samples[('latency_bucket', ('1',))] == 3
+    assert samples[('latency_bucket', ('+Inf',))] == 4
+    assert samples[('latency_count', ())] == 4
+    assert samples[('latency_sum', ())] == 3.05
+
+def test_registry_renders_text_format():
+    registry = Registry()
+    registry.counter('emits', 'Socket.IO emits', ('event',)).inc('dialog_delta', amount=2)
+    registry.callback('sessions', 'Active sessions', lambda: 3)
+
+    text = registry.render()
+    assert '# TYPE emits counter' in text
+    assert 'emits_total{event="dialog_delta"} 2' in text
+    assert 'sessions 3' in text
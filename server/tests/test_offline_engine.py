@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from services.config_store import ConfigStore
+from services.location_service import LocationService
+from services.offline_engine import OfflineEngine
+
+@pytest.fixture
+def store(config_dir):
+    return ConfigStore(config_dir)
+
+@pytest.fixture
+def agents(store):
+    return {agent['id']: agent for agent in store.get('agents')['agents']}
+
+@pytest.fixture
+def engine(store, agents):
+    return OfflineEngine(agents, LocationService(store))
+
+def _all_lines(engine):
+    tables, _, _ = engine._compiled
+    return {line for table in tables.values() for line in table}
+
+def test_mid_conversation_lines_have_no_greetings_or_stage_directions(engine, agents):
+    lines = _all_lines(engine)
+
+    greetings = {g for agent in agents.values() for g in agent['greeting_patterns']}
+    assert not lines & greetings
+    assert not [line for line in lines if line.startswith('（')]
+
+def test_location_fields_are_interpolated_only_when_they_are_nouns(engine):
+    lines = _all_lines(engine)
+
+    # topics は品詞が混ざるので定型文に入れない
+    assert not [line for line in lines if line.endswith(('気になりますね！', '気になるね！'))]
+    # 匂いでない記述や、文になっている記述は「〜がしますね」に入れない
+    assert not [line for line in lines if '空気がし' in line or '混じり合うがし' in line]
+    assert 'ソースの香ばしい匂いがしますね！' in engine._compiled[0][('alpha', 'takoyaki_stand')]
+
+def test_curated_location_lines_follow_the_speaking_style(engine):
+    tables, _, _ = engine._compiled
+
+    assert '花火、もうすぐ上がりますね' in tables[('alpha', 'fireworks_spot')]
+    assert '花火、もうすぐ上がるね' in tables[('beta', 'fireworks_spot')]
+
+def test_opening_uses_the_configured_greetings(engine, agents):
+    for _ in range(10):
+        assert engine.generate('beta', 'ステージ前', 's1', opening=True) in agents['beta']['greeting_patterns']
+
+def test_session_walks_the_whole_table_before_repeating(engine):
+    table = engine._compiled[0][('gamma', 'rest_area')]
+    lines = [engine.generate('gamma', '休憩所', 's1') for _ in table]
+
+    assert sorted(lines) == sorted(table)
+
+def test_generate_survives_concurrent_recompiles(engine, agents):
+    # 場所の数が変わると表の長さ（歩幅の候補のキー）も変わる
+    fewer = {'alpha': dict(agents['alpha'], topics=[])}
+    errors = []
+    done = threading.Event()
+
+    def _recompile():
+        while not done.is_set():
+            engine.compile(fewer)
+            engine.compile(agents)
+
+    thread = threading.Thread(target=_recompile)
+    thread.start()
+    try:
+        for i in range(5000):
+            try:
+                engine.generate('alpha', '射的', f's{i % 7}')
+            except Exception as e:
+                errors.append(e)
+    finally:
+        done.set()
+        thread.join()
+
+    assert errors == []
@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+
+import pytest
+
+from services.proximity_tracker import ProximityTracker
+
+@pytest.fixture
+def tracker(monkeypatch):
+    monkeypatch.setenv('PROXIMITY_COOLDOWN', '30')
+    rules = {'proximity_radius': 2.0, 'separation_distance': 5.0}
+    return ProximityTracker(SimpleNamespace(conversation_rules=rules))
+
+def test_one_encounter_starts_one_conversation(tracker):
+    assert tracker.observe(['a', 'b'], 1.0)
+    assert not tracker.observe(['a', 'b'], 1.5)
+    assert not tracker.observe(['b', 'a'], 3.0)
+    assert tracker.stats()['started'] == 1
+    assert tracker.stats()['debounced'] == 2
+
+def test_cooldown_after_conversation_ends(tracker):
+    assert tracker.observe(['a', 'b'], 1.0)
+    tracker.conversation_ended(['a', 'b'])
+
+    assert not tracker.observe(['a', 'b'], 1.0)
+    assert tracker.stats()['cooldown_suppressed'] == 1
+
+def test_positions_start_only_the_close_pair(tracker):
+    positions = {'a': (0.0, 0.0), 'b': (1.0, 0.0), 'c': (50.0, 0.0), 'd': (100.0, 0.0)}
+    assert tracker.observe_positions(positions) == [['a', 'b']]
+
+def test_departed_pairs_are_not_counted_as_debounced(tracker):
+    assert tracker.observe_positions({'a': (0.0, 0.0), 'b': (1.0, 0.0)}) == [['a', 'b']]
+    for _ in range(5):
+        tracker.observe_positions({'a': (0.0, 0.0), 'b': (40.0, 0.0)})
+
+    assert tracker.stats()['debounced'] == 0
+    assert tracker.stats()['started'] == 1
+
+def test_busy_agent_is_not_paired_twice(tracker):
+    assert tracker.observe(['a', 'b'], 1.0)
+    assert not tracker.observe(['a', 'c'], 1.0)
+    assert tracker.stats()['busy_suppressed'] == 1
@@ -0,0 +1,72 @@
+import pytest
+
+from services.replay_service import ReplayService
+from services.transcript_store import TranscriptStore
+
+PAIR = 'agent_a-agent_b'
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv('TRANSCRIPT_FSYNC_INTERVAL', '0.05')
+    store = TranscriptStore(str(tmp_path))
+    yield store
+    store.close()
+
+def _record(store, session_id, lines, **extra):
+    for turn in range(1, lines + 1):
+        store.append(dict({
+            'session_id': session_id,
+            'pair': PAIR,
+            'location_id': 'festival',
+            'time_bucket': 'evening',
+            'speaker': 'agent_a' if turn % 2 else 'agent_b',
+            'text': f'{session_id}-{turn}',
+            'turn': turn,
+            'source': 'llm'
+        }, **extra))
+    store.flush()
+
+def _replay(store, monkeypatch):
+    monkeypatch.setenv('REPLAY', 'true')
+    return ReplayService(store)
+
+def test_turns_follow_the_recorded_conversation(store, monkeypatch):
+    _record(store, 'rec-1', 3)
+    replay = _replay(store, monkeypatch)
+
+    texts = [replay.turn('s1', PAIR, turn, 'festival', 'evening', 6)['text'] for turn in (1, 2, 3)]
+    assert texts == ['rec-1-1', 'rec-1-2', 'rec-1-3']
+
+def test_turn_beyond_max_turns_falls_through(store, monkeypatch):
+    _record(store, 'rec-1', 3)
+    replay = _replay(store, monkeypatch)
+
+    # クライアントが送る巨大なターン番号で記録を延々とつながない
+    assert replay.turn('s1', PAIR, 2_000_000, 'festival', 'evening', 6) is None
+    assert replay.turn('s1', PAIR, 0, 'festival', 'evening', 6) is None
+    assert replay.stats()['misses'] == 2
+    assert replay.stats()['conversations_served'] == 0
+
+def test_conversation_longer_than_max_turns_falls_through(store, monkeypatch):
+    _record(store, 'rec-1', 3)
+    replay = _replay(store, monkeypatch)
+
+    assert replay.conversation(PAIR, 10_000, 'festival', 'evening', 6) is None
+    assert len(replay.conversation(PAIR, 5, 'festival', 'evening', 6)) == 5
+
+def test_unknown_pair_falls_through(store, monkeypatch):
+    _record(store, 'rec-1', 3)
+    replay = _replay(store, monkeypatch)
+
+    assert not replay.covers('agent_a|agent_c')
+    assert replay.turn('s1', 'agent_a|agent_c', 1, 'festival', 'evening', 6) is None
+
+def test_conversations_with_non_llm_lines_are_not_replayed(store, monkeypatch):
+    _record(store, 'rec-offline', 3, source='offline')
+    _record(store, 'rec-cache', 3, source='cache')
+    _record(store, 'rec-llm', 3)
+    replay = _replay(store, monkeypatch)
+
+    for session in ('s1', 's2', 's3'):
+        assert replay.turn(session, PAIR, 1, 'festival', 'evening', 6)['text'] == 'rec-llm-1'
+    assert replay.stats()['skipped'] == 2
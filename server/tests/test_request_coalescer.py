@@ -0,0 +1,61 @@
+import threading
+import time
+
+import pytest
+
+from services.request_coalescer import RequestCoalescer
+
+def test_concurrent_duplicates_share_one_call():
+    coalescer = RequestCoalescer()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def _work():
+        calls.append(None)
+        started.set()
+        release.wait(5)
+        return {'text': 'こんにちは'}
+
+    results = []
+    owner = threading.Thread(target=lambda: results.append(coalescer.run(('turn', 's1', 1), _work)))
+    owner.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(coalescer.run(('turn', 's1', 1), _work)))
+    follower.start()
+    deadline = time.monotonic() + 5
+    while coalescer.stats()['coalesced'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    owner.join(5)
+    follower.join(5)
+
+    assert len(calls) == 1
+    assert results == [{'text': 'こんにちは'}] * 2
+
+def test_idempotency_key_replays_the_stored_result():
+    coalescer = RequestCoalescer()
+    first = coalescer.run(('turn', 's1', 1), lambda: 'first', idempotency_key='key-1')
+    again = coalescer.run(('turn', 's1', 1), lambda: 'second', idempotency_key='key-1')
+
+    assert first == again == 'first'
+    assert coalescer.stats()['replayed'] == 1
+
+def test_failures_are_not_stored(monkeypatch):
+    coalescer = RequestCoalescer()
+
+    def _fail():
+        raise RuntimeError('LLM down')
+
+    with pytest.raises(RuntimeError):
+        coalescer.run(('turn', 's1', 1), _fail, idempotency_key='key-1')
+    assert coalescer.run(('turn', 's1', 1), lambda: 'ok', idempotency_key='key-1') == 'ok'
+    assert coalescer.stats()['in_flight'] == 0
+
+def test_stored_keys_are_bounded(monkeypatch):
+    monkeypatch.setenv('IDEMPOTENCY_MAX_KEYS', '2')
+    coalescer = RequestCoalescer()
+    for i in range(5):
+        coalescer.run(('turn', 's1', i), lambda: i, idempotency_key=f'key-{i}')
+
+    assert coalescer.stats()['stored_keys'] == 2
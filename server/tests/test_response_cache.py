@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+import pytest
+
+from services import response_cache as response_cache_module
+from services.response_cache import ResponseCache, fingerprint
+
+KEY = ('alpha', 'takoyaki_stand', 'evening', '')
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ResponseCache が読む時刻を手で進める"""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(response_cache_module, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+def test_misses_until_the_key_is_filled(clock):
+    cache = ResponseCache(max_keys=10, ttl_seconds=60, fill=2)
+    cache.put(KEY, 'たこ焼き美味しそう！')
+    assert cache.get(KEY) is None
+
+    cache.put(KEY, 'ソースの匂いがするね')
+    assert cache.get(KEY) in ('たこ焼き美味しそう！', 'ソースの匂いがするね')
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 1, 0.5)
+
+def test_hits_do_not_repeat_the_previous_line(clock):
+    cache = ResponseCache(max_keys=10, ttl_seconds=60, fill=2)
+    cache.put(KEY, 'A')
+    cache.put(KEY, 'B')
+
+    served = [cache.get(KEY) for _ in range(6)]
+
+    assert all(a != b for a, b in zip(served, served[1:]))
+
+def test_least_recently_used_key_is_evicted(clock):
+    cache = ResponseCache(max_keys=2, ttl_seconds=60, fill=1)
+    cache.put(('a',), 'A')
+    cache.put(('b',), 'B')
+    assert cache.get(('a',)) == 'A'
+
+    cache.put(('c',), 'C')
+
+    assert cache.get(('b',)) is None
+    assert cache.get(('a',)) == 'A'
+    assert cache.stats()['evictions'] == 1
+
+def test_candidates_expire_after_ttl(clock):
+    cache = ResponseCache(max_keys=10, ttl_seconds=60, fill=1)
+    cache.put(KEY, 'A')
+
+    clock.now += 60
+    assert cache.peek(KEY) is None
+    assert cache.get(KEY) is None
+    assert cache.stats()['expirations'] == 1
+
+def test_peek_serves_partial_keys_without_counting(clock):
+    cache = ResponseCache(max_keys=10, ttl_seconds=60, fill=3)
+    cache.put(KEY, 'A')
+
+    assert cache.peek(KEY) == 'A'
+    assert cache.contains(KEY, 'A')
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (0, 0)
+
+def test_disabled_cache_stores_nothing(clock, monkeypatch):
+    monkeypatch.setenv('RESPONSE_CACHE', 'false')
+    cache = ResponseCache(max_keys=10, ttl_seconds=60, fill=1)
+    cache.put(KEY, 'A')
+
+    assert cache.get(KEY) is None
+    assert not cache.contains(KEY, 'A')
+
+def test_fingerprint_ignores_punctuation_and_width():
+    assert fingerprint('わぁ、すごい！') == fingerprint('わぁ すごい!')
+    assert fingerprint('ＡＢＣ') == fingerprint('abc')
+    assert fingerprint('', '  ') == ''
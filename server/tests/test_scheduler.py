@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+from services.scheduler import (
+    PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, QueueFull, Scheduler
+)
+
+@pytest.fixture
+def blocked(monkeypatch):
+    """ワーカー1つを止めておき、キューに積まれた順番を観察する"""
+    monkeypatch.setenv('SCHEDULER_SHED_DEPTH', '2')
+    monkeypatch.setenv('SCHEDULER_MAX_QUEUE', '4')
+    scheduler = Scheduler(1, name='test')
+    gate = threading.Event()
+    started = threading.Event()
+
+    def _block():
+        started.set()
+        gate.wait(5)
+
+    scheduler.submit(_block)
+    started.wait(5)
+    yield scheduler, gate
+    gate.set()
+    scheduler.shutdown()
+
+def test_higher_priority_runs_first(blocked):
+    scheduler, gate = blocked
+    order = []
+    futures = [
+        scheduler.submit(order.append, 'normal', priority=PRIORITY_NORMAL),
+        scheduler.submit(order.append, 'interactive', priority=PRIORITY_INTERACTIVE),
+    ]
+    gate.set()
+    for future in futures:
+        future.result(timeout=5)
+
+    assert order == ['interactive', 'normal']
+
+def test_sessions_take_turns_within_a_priority(blocked):
+    scheduler, gate = blocked
+    order = []
+    futures = [
+        scheduler.submit(order.append, 'a1', fair_key='a'),
+        scheduler.submit(order.append, 'a2', fair_key='a'),
+        scheduler.submit(order.append, 'b1', fair_key='b'),
+    ]
+    gate.set()
+    for future in futures:
+        future.result(timeout=5)
+
+    assert order == ['a1', 'b1', 'a2']
+
+def test_background_is_shed_first(blocked):
+    scheduler, _ = blocked
+    scheduler.submit(lambda: None)
+    scheduler.submit(lambda: None)
+
+    shed = scheduler.submit(lambda: 'ran', priority=PRIORITY_BACKGROUND, shed=lambda: 'shed')
+    refused = scheduler.submit(lambda: 'ran', priority=PRIORITY_BACKGROUND)
+    normal = scheduler.submit(lambda: 'ran')
+
+    assert shed.result(timeout=1) == 'shed'
+    assert isinstance(refused.exception(timeout=1), QueueFull)
+    assert not normal.done()
+    assert scheduler.stats()['priorities']['background']['shed'] == 2
+
+def test_promote_moves_waiting_work_ahead(blocked):
+    scheduler, gate = blocked
+    order = []
+    futures = [
+        scheduler.submit(order.append, 'normal', priority=PRIORITY_NORMAL),
+        scheduler.submit(order.append, 'prefetch', priority=PRIORITY_BACKGROUND, fair_key='s1'),
+    ]
+    assert scheduler.promote('s1') == 1
+    gate.set()
+    for future in futures:
+        future.result(timeout=5)
+
+    assert order == ['prefetch', 'normal']
+
+def test_cancelled_work_leaves_the_queue(blocked):
+    scheduler, _ = blocked
+    waiting = [scheduler.submit(lambda: None, fair_key='s1'), scheduler.submit(lambda: None, fair_key='s2')]
+    assert scheduler.depth == 2
+
+    for future in waiting:
+        assert future.cancel()
+
+    # 取り消した分は待ち件数から外れ、次の先読みは断られない
+    assert scheduler.depth == 0
+    admitted = scheduler.submit(lambda: 'ran', priority=PRIORITY_BACKGROUND)
+    assert not admitted.done()
+    assert scheduler.stats()['cancelled'] == 2
+    assert scheduler.stats()['priorities']['normal']['queued'] == 0
@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+import pytest
+
+from services import session_store as session_store_module
+from services.session_store import SessionStore
+
+@pytest.fixture
+def clock(monkeypatch):
+    """SessionStore が読む時刻を手で進める"""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(session_store_module, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+def test_sessions_expire_after_ttl(clock):
+    store = SessionStore(max_sessions=10, ttl_seconds=60)
+    session_id, _ = store.resolve(None, ['alpha', 'beta'], 1)
+
+    clock.now += 59
+    assert store.get(session_id) is not None
+
+    # ターンを進めるたびに期限は延びる
+    store.resolve(session_id, ['alpha', 'beta'], 2)
+    clock.now += 59
+    assert store.get(session_id) is not None
+    clock.now += 1
+    assert store.get(session_id) is None
+    assert store.stats()['expired'] == 1
+
+def test_expired_session_is_not_found_by_pair(clock):
+    store = SessionStore(max_sessions=10, ttl_seconds=60)
+    old_id, _ = store.resolve(None, ['alpha', 'beta'], 1)
+
+    clock.now += 61
+    new_id, session = store.resolve(None, ['beta', 'alpha'], 2)
+
+    assert new_id != old_id
+    assert session['history'] == []
+
+def test_least_recently_used_session_is_evicted_at_capacity(clock):
+    store = SessionStore(max_sessions=2, ttl_seconds=60)
+    first, _ = store.resolve('s1', ['alpha', 'beta'], 1)
+    second, _ = store.resolve('s2', ['beta', 'gamma'], 1)
+
+    clock.now += 1
+    store.resolve(first, ['alpha', 'beta'], 2)
+    store.resolve('s3', ['alpha', 'gamma'], 1)
+
+    assert store.get(second) is None
+    assert store.get(first) is not None
+    assert len(store) == 2
+    stats = store.stats()
+    assert (stats['created'], stats['evicted'], stats['expired']) == (3, 1, 0)
+
+def test_turn_after_the_first_finds_the_pair_session(clock):
+    store = SessionStore(max_sessions=10, ttl_seconds=60)
+    session_id, _ = store.resolve(None, ['alpha', 'beta'], 1)
+
+    assert store.resolve(None, ['beta', 'alpha'], 2)[0] == session_id
+    # 1ターン目は常に新しい会話
+    assert store.resolve(None, ['alpha', 'beta'], 1)[0] != session_id
+
+def test_history_is_trimmed_and_remove_is_counted(clock):
+    store = SessionStore(max_sessions=10, ttl_seconds=60, max_history=3)
+    session_id, session = store.resolve(None, ['alpha', 'beta'], 1)
+    for turn in range(1, 6):
+        store.append_history(session, {'turn': turn})
+
+    assert [entry['turn'] for entry in session['history']] == [3, 4, 5]
+    assert store.remove(session_id)
+    assert not store.remove(session_id)
+    assert store.stats()['removed'] == 1
@@ -0,0 +1,55 @@
+import itertools
+import math
+import random
+
+import pytest
+
+from services.spatial_grid import SpatialGrid
+
+def _brute_force(positions, radius):
+    """全ペアの距離を測る（以前の実装）"""
+    found = set()
+    for (a, (ax, az)), (b, (bx, bz)) in itertools.combinations(positions.items(), 2):
+        if math.hypot(ax - bx, az - bz) < radius:
+            found.add(frozenset((a, b)))
+    return found
+
+def _pairs(grid, positions, radius):
+    return {frozenset((a, b)) for a, b, _ in grid.pairs_within(positions, radius)}
+
+@pytest.mark.parametrize('a, b', [
+    ((9.5, 0.0), (10.5, 0.0)),     # 右隣のセル
+    ((0.0, 9.5), (0.0, 10.5)),     # 上のセル
+    ((9.5, 9.5), (10.5, 10.5)),    # 右上のセル
+    ((10.5, 9.5), (9.5, 10.5)),    # 左上のセル
+    ((-0.5, -0.5), (0.5, 0.5)),    # 原点をまたぐ負の座標
+])
+def test_neighbours_across_cell_boundaries_are_found(a, b):
+    grid = SpatialGrid(10.0)
+
+    pairs = grid.pairs_within({'a': a, 'b': b}, 2.0)
+
+    assert len(pairs) == 1
+    assert pairs[0][2] == pytest.approx(math.dist(a, b))
+
+def test_pairs_at_or_beyond_the_radius_are_not_reported():
+    grid = SpatialGrid(10.0)
+    positions = {'a': (0.0, 0.0), 'b': (3.0, 4.0), 'c': (20.0, 0.0)}
+
+    assert grid.pairs_within(positions, 5.0) == []
+    assert _pairs(grid, positions, 5.01) == {frozenset(('a', 'b'))}
+
+@pytest.mark.parametrize('cell_size, radius', [(10.0, 10.0), (10.0, 25.0), (50.0, 10.0)])
+def test_matches_brute_force_without_duplicates(cell_size, radius):
+    rng = random.Random(7)
+    positions = {f'agent{i}': (rng.uniform(-100, 100), rng.uniform(-100, 100)) for i in range(200)}
+    grid = SpatialGrid(cell_size)
+
+    pairs = grid.pairs_within(positions, radius)
+
+    assert len(pairs) == len({frozenset((a, b)) for a, b, _ in pairs})
+    assert _pairs(grid, positions, radius) == _brute_force(positions, radius)
+
+def test_cell_size_must_be_positive():
+    with pytest.raises(ValueError):
+        SpatialGrid(0)
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from services.transcript_store import TranscriptStore
+
+@pytest.fixture
+def env(monkeypatch):
+    monkeypatch.setenv('TRANSCRIPT_FSYNC_INTERVAL', '0.05')
+
+def _line(session_id, turn, speaker='alpha'):
+    return {
+        'session_id': session_id,
+        'pair': 'alpha-beta',
+        'location_id': 'festival',
+        'time_bucket': 'night',
+        'speaker': speaker,
+        'text': f'{session_id}-{turn}',
+        'turn': turn,
+        'source': 'llm'
+    }
+
+def _segment(directory):
+    return os.path.join(directory, 'segment-000001')
+
+def test_query_by_index_fields(tmp_path, env):
+    store = TranscriptStore(str(tmp_path))
+    for turn in (1, 2, 3):
+        store.append(_line('s1', turn, 'alpha' if turn % 2 else 'beta'))
+    store.append(_line('s2', 1))
+    store.flush()
+
+    assert [r['text'] for r in store.query(session_id='s1', newest_first=False)] == ['s1-1', 's1-2', 's1-3']
+    assert [r['text'] for r in store.query(speaker='beta')] == ['s1-2']
+    assert {c['session_id']: c['lines'] for c in store.conversations()} == {'s1': 3, 's2': 1}
+    with pytest.raises(ValueError):
+        store.query(mood='happy')
+    store.close()
+
+def test_reopen_reads_the_saved_index(tmp_path, env):
+    store = TranscriptStore(str(tmp_path))
+    store.append(_line('s1', 1))
+    store.close()
+
+    reopened = TranscriptStore(str(tmp_path))
+    assert reopened.stats()['recovered'] == 0
+    assert reopened.query(session_id='s1')[0]['text'] == 's1-1'
+    reopened.close()
+
+def test_lines_missing_from_the_index_are_recovered(tmp_path, env):
+    store = TranscriptStore(str(tmp_path))
+    store.append(_line('s1', 1))
+    store.append(_line('s1', 2))
+    store.close()
+
+    # インデックスの書き込み前に落ちた場合
+    with open(_segment(tmp_path) + '.idx', 'rb') as f:
+        first = f.readline()
+    with open(_segment(tmp_path) + '.idx', 'wb') as f:
+        f.write(first)
+
+    reopened = TranscriptStore(str(tmp_path))
+    assert reopened.stats()['recovered'] == 1
+    assert [r['text'] for r in reopened.query(session_id='s1', newest_first=False)] == ['s1-1', 's1-2']
+    reopened.close()
+
+def test_torn_tail_is_truncated(tmp_path, env):
+    store = TranscriptStore(str(tmp_path))
+    store.append(_line('s1', 1))
+    store.close()
+    with open(_segment(tmp_path) + '.jsonl', 'ab') as f:
+        f.write(b'{"session_id": "s1", "te')
+
+    reopened = TranscriptStore(str(tmp_path))
+    assert len(reopened.query(session_id='s1')) == 1
+    reopened.append(_line('s1', 2))
+    reopened.flush()
+    assert [r['text'] for r in reopened.query(session_id='s1', newest_first=False)] == ['s1-1', 's1-2']
+    reopened.close()
@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+from services.warm_pool import WarmPool
+
+class _Locations:
+    def get_all_locations(self):
+        return {'festival': {'display_name': '夏祭り会場'}}
+
+    def resolve_location_id(self, location):
+        return 'festival'
+
+def _pool(monkeypatch, **env):
+    monkeypatch.setenv('WARM_POOL_DEPTH', '2')
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    dialog = SimpleNamespace(
+        agents={'alpha': {}, 'beta': {}},
+        bucket='evening',
+        llm_service=SimpleNamespace(max_concurrency=4, online_mode=True),
+        location_service=_Locations()
+    )
+    dialog.get_time_bucket = lambda: dialog.bucket
+    return WarmPool(dialog), dialog
+
+def _lines():
+    return [{'speaker': 'alpha', 'text': 'こんばんは', 'turn': 1}]
+
+def test_full_pool_has_no_target(monkeypatch):
+    pool, _ = _pool(monkeypatch)
+    assert pool._next_target() == (['alpha', 'beta'], '夏祭り会場')
+
+    pool.offer(['alpha', 'beta'], '夏祭り会場', _lines())
+    pool.offer(['alpha', 'beta'], '夏祭り会場', _lines())
+    assert pool._next_target() is None
+    assert pool.draw(['alpha', 'beta'], '夏祭り会場', '') == _lines()
+
+def test_stale_time_bucket_entries_are_refilled(monkeypatch):
+    pool, dialog = _pool(monkeypatch)
+    pool.offer(['alpha', 'beta'], '夏祭り会場', _lines())
+    pool.offer(['alpha', 'beta'], '夏祭り会場', _lines())
+
+    # 時間帯が変わると draw() は使わないので、補充対象に戻る
+    dialog.bucket = 'night'
+    assert pool._next_target() == (['alpha', 'beta'], '夏祭り会場')
+    assert pool.stats()['size'] == 0
+    assert pool.stats()['stale'] == 2
+
+def test_expired_entries_are_refilled(monkeypatch):
+    pool, _ = _pool(monkeypatch, WARM_POOL_TTL='0')
+    pool.offer(['alpha', 'beta'], '夏祭り会場', _lines())
+    pool.offer(['alpha', 'beta'], '夏祭り会場', _lines())
+
+    assert pool._next_target() == (['alpha', 'beta'], '夏祭り会場')
+    assert pool.draw(['alpha', 'beta'], '夏祭り会場', '') is None
+
+def test_expired_entries_do_not_count_against_max_total(monkeypatch):
+    pool, _ = _pool(monkeypatch, WARM_POOL_MAX_TOTAL='1', WARM_POOL_TTL='0')
+    pool.offer(['alpha', 'beta'], '夏祭り会場', _lines())
+
+    assert pool._next_target() is not None
+
+def test_invalidate_drops_openings_and_refills_in_flight(monkeypatch):
+    pool, dialog = _pool(monkeypatch)
+    pool.offer(['alpha', 'beta'], '夏祭り会場', _lines())
+
+    # 補充の生成中に設定が変わった場合、その結果は貯めない
+    def _generate(**kwargs):
+        pool.invalidate()
+        return SimpleNamespace(result=lambda: _lines())
+
+    dialog.generate_conversation_async = _generate
+    pool._refill(['alpha', 'beta'], '夏祭り会場')
+
+    assert pool.stats()['size'] == 0
+    assert pool.stats()['invalidated'] == 1
+    assert pool.draw(['alpha', 'beta'], '夏祭り会場', '') is None